@@ -0,0 +1,99 @@
+# apps/common/cache.py
+"""
+Кэш страниц реестра: блоки дашборда, счётчики отфильтрованного списка,
+публичная карточка паспорта.
+
+Ключ — "registry:<поколение>:<раздел>:<хэш параметров>". Поколение — число
+в том же кэше; любое сохранение/удаление паспорта, лошади, владельца,
+организации, физлица (и прививок/анализов — они есть в карточке) увеличивает
+его после коммита (bump, см. apps/passports/signals.py), и все прежние ключи
+разом становятся недостижимы — их вытеснит TTL/LRU бэкенда. Поэтому
+инвалидация не знает, какие ключи от чего зависят, и работает с любым
+бэкендом Django (locmem, file-based, …) без удаления по шаблону.
+
+locmem — свой кэш и своё поколение у каждого процесса: правка в одном
+воркере не видна кэшу другого до истечения REGISTRY_CACHE_TIMEOUT. Для
+нескольких процессов на сервере — CACHE_BACKEND=file (или общий Redis/Memcached).
+
+Счётчики попаданий/промахов — на процесс, по разделам (stats()).
+"""
+import hashlib
+import threading
+import time
+from collections import defaultdict
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import transaction
+
+GENERATION_KEY = "registry:generation"
+
+_stats = defaultdict(lambda: {"hits": 0, "misses": 0})
+_stats_lock = threading.Lock()
+_MISSING = object()
+
+
+def _cache():
+    return caches[getattr(settings, "REGISTRY_CACHE_ALIAS", "default")]
+
+
+def _initial_generation() -> int:
+    # не с 1: если счётчик вытеснят, новый не совпадёт ни с одним прежним поколением
+    return int(time.time() * 1000)
+
+
+def generation() -> int:
+    gen = _cache().get(GENERATION_KEY)
+    if gen is None:
+        _cache().add(GENERATION_KEY, _initial_generation(), timeout=None)
+        gen = _cache().get(GENERATION_KEY, 0)
+    return gen
+
+
+def bump():
+    """Новое поколение: всё закэшированное ранее больше не читается."""
+    try:
+        _cache().incr(GENERATION_KEY)
+        # incr у file-based — get+set с TTL по умолчанию; счётчик должен жить бессрочно
+        _cache().touch(GENERATION_KEY, None)
+    except ValueError:  # ключа ещё нет (или вытеснен)
+        _cache().add(GENERATION_KEY, _initial_generation(), timeout=None)
+
+
+def bump_on_commit():
+    """bump после коммита текущей транзакции: иначе параллельный запрос успел бы
+    закэшировать под новым поколением ещё старые данные."""
+    transaction.on_commit(bump)
+
+
+def make_key(section: str, *parts) -> str:
+    digest = hashlib.sha1(repr(parts).encode("utf-8")).hexdigest()[:16]
+    return f"registry:{generation()}:{section}:{digest}"
+
+
+def cached(section: str, parts, compute, timeout=None):
+    """
+    Значение compute() из кэша по (раздел, parts) текущего поколения; при
+    промахе — вычислить и положить. parts — всё, от чего зависит результат
+    помимо данных реестра (фильтры, дата, номер страницы…).
+    """
+    if not getattr(settings, "REGISTRY_CACHE_ENABLED", True):
+        return compute()
+    key = make_key(section, *parts)
+    value = _cache().get(key, _MISSING)
+    hit = value is not _MISSING
+    with _stats_lock:
+        _stats[section]["hits" if hit else "misses"] += 1
+    if not hit:
+        value = compute()
+        _cache().set(key, value, timeout if timeout is not None else getattr(settings, "REGISTRY_CACHE_TIMEOUT", 300))
+    return value
+
+
+def stats() -> dict:
+    """{раздел: {"hits", "misses", "hit_rate"}} с начала жизни процесса."""
+    with _stats_lock:
+        return {
+            section: {**rec, "hit_rate": round(rec["hits"] / (rec["hits"] + rec["misses"]), 3)}
+            for section, rec in sorted(_stats.items())
+        }
@@ -0,0 +1,119 @@
+# apps/common/instrumentation.py
+"""
+Замеры этапов выпуска паспорта: время, число SQL-запросов и прирост пикового
+RSS процесса.
+
+    with RenderTrace("pdf", passport) as trace:
+        with trace.stage("context"):
+            ...
+
+Внутри трассы этап можно отметить и из глубины стека — через stage(name)
+(например, уменьшение фото в print_images): запись попадёт в активную трассу.
+По выходу из трассы результат отдаётся хукам из PASSPORT_RENDER_HOOKS
+(структурный лог — log_hook, таблица RenderMetric — apps.passports.metrics.db_hook).
+"""
+import json
+import logging
+import os
+import time
+from contextlib import contextmanager, nullcontext
+from contextvars import ContextVar
+from functools import lru_cache
+
+from django.conf import settings
+from django.db import connection
+from django.utils.module_loading import import_string
+
+logger = logging.getLogger("apps.passports.render")
+
+_current: ContextVar["RenderTrace | None"] = ContextVar("passport_render_trace", default=None)
+
+DEFAULT_HOOKS = ("apps.common.instrumentation.log_hook",)
+
+
+def peak_rss_kb() -> int:
+    """Пиковый RSS процесса в КБ (0, если платформа не умеет)."""
+    try:
+        import resource
+    except ImportError:  # Windows
+        return 0
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+
+@lru_cache(maxsize=1)
+def _hooks():
+    return [import_string(path) for path in getattr(settings, "PASSPORT_RENDER_HOOKS", DEFAULT_HOOKS)]
+
+
+class RenderTrace:
+    """
+    Трасса одной операции (operation: "pdf", "codes") по одному паспорту.
+    stages: {этап: {"seconds", "queries", "rss_kb"}}; повторный этап суммируется.
+    """
+
+    def __init__(self, operation: str, passport=None):
+        self.operation = operation
+        self.passport_id = getattr(passport, "pk", None)
+        self.passport_number = getattr(passport, "number", "") or ""
+        self.stages = {}
+        self.queries = 0
+        self.error = ""
+
+    def _count_query(self, execute, sql, params, many, context):
+        self.queries += 1
+        return execute(sql, params, many, context)
+
+    @contextmanager
+    def stage(self, name: str):
+        started, queries, rss = time.perf_counter(), self.queries, peak_rss_kb()
+        try:
+            yield
+        finally:
+            rec = self.stages.setdefault(name, {"seconds": 0.0, "queries": 0, "rss_kb": 0})
+            rec["seconds"] += time.perf_counter() - started
+            rec["queries"] += self.queries - queries
+            rec["rss_kb"] += max(0, peak_rss_kb() - rss)
+
+    def __enter__(self):
+        self._token = _current.set(self)
+        self._wrapper = connection.execute_wrapper(self._count_query)
+        self._wrapper.__enter__()
+        self._total = self.stage("total")
+        self._total.__enter__()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self._total.__exit__(exc_type, exc, tb)
+        self._wrapper.__exit__(exc_type, exc, tb)
+        _current.reset(self._token)
+        if exc is not None:
+            self.error = f"{exc_type.__name__}: {exc}"
+        for hook in _hooks():
+            try:
+                hook(self)
+            except Exception:
+                logger.exception("Хук замеров %r упал", hook)
+        return False
+
+    def as_dict(self) -> dict:
+        return {
+            "operation": self.operation,
+            "passport_id": self.passport_id,
+            "passport": self.passport_number,
+            "pid": os.getpid(),
+            "error": self.error,
+            "stages": {k: {**v, "seconds": round(v["seconds"], 6)} for k, v in self.stages.items()},
+        }
+
+
+def stage(name: str):
+    """Этап в активной трассе; вне трассы — ничего не делает."""
+    trace = _current.get()
+    return trace.stage(name) if trace is not None else nullcontext()
+
+
+def log_hook(trace: RenderTrace):
+    """Структурный лог: одна JSON-строка на операцию (logger apps.passports.render)."""
+    data = trace.as_dict()
+    logger.info(json.dumps(data, ensure_ascii=False), extra={"passport_render": data})
+
@@ -0,0 +1,139 @@
+# apps/common/management/commands/gc_media.py
+import shutil
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+
+from django.apps import apps
+from django.conf import settings
+from django.core.files.storage import default_storage
+from django.core.management.base import BaseCommand, CommandError
+from django.db import models
+from django.utils.timezone import now
+
+from apps.common.print_images import PRINT_CACHE_DIR
+from apps.common.storage import generated_storage, stored_digest
+from apps.passports.preview import PREVIEW_CACHE_DIR
+
+
+class Command(BaseCommand):
+    help = (
+        "Удаляет медиа-файлы, на которые не ссылается ни одна запись: разность множеств "
+        "«файлы в каталогах upload_to» − «имена в FileField/ImageField всех моделей» "
+        "(в обычном хранилище и в хранилище по содержимому), "
+        "печатные копии (print_cache) изображений, которых больше нет, и предпросмотры "
+        "(preview_cache), которые не открывали дольше --min-age. "
+        "Без --delete только показывает, что было бы удалено."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--delete", action="store_true", help="Действительно удалить")
+        parser.add_argument("--min-age", type=float, default=24,
+                            help="Не трогать файлы моложе N часов (их запись в БД может быть ещё не закоммичена)")
+
+    def handle(self, *args, **opts):
+        if opts["min_age"] < 0:
+            raise CommandError("--min-age не может быть отрицательным")
+
+        # обычное хранилище (загрузки, PDF) и хранилище по содержимому (штрих/QR)
+        by_storage = {default_storage: [], generated_storage(): []}
+        for model in apps.get_models():
+            for field in model._meta.concrete_fields:
+                if isinstance(field, models.FileField):
+                    for storage, fields in by_storage.items():
+                        if field.storage is storage:
+                            fields.append((model, field))
+
+        orphans, images, prefixes = [], set(), []
+        stored_total = referenced_total = 0
+        for storage, fields in by_storage.items():
+            storage_prefixes = sorted({
+                field.upload_to.strip("/").split("/")[0]
+                for _, field in fields
+                if isinstance(field.upload_to, str) and field.upload_to.strip("/")
+            })
+            referenced = set()
+            for model, field in fields:
+                names = set(
+                    model._default_manager.exclude(**{field.name: ""}).values_list(field.name, flat=True)
+                    .iterator(chunk_size=10000)
+                )
+                referenced |= names
+                if isinstance(field, models.ImageField):
+                    images |= {(field, name) for name in names}
+            stored = {name for prefix in storage_prefixes for name in self._walk(storage, prefix)}
+            orphans += [(storage, name) for name in sorted(stored - referenced)]
+            prefixes += storage_prefixes
+            stored_total += len(stored)
+            referenced_total += len(referenced)
+        self.stdout.write(
+            f"Каталоги: {', '.join(sorted(prefixes))}; файлов: {stored_total}, ссылок в БД: {referenced_total}, "
+            f"без ссылок: {len(orphans)}"
+        )
+
+        cutoff = now() - timedelta(hours=opts["min_age"])
+        removed = skipped = freed = 0
+        for storage, name in orphans:
+            if storage.get_modified_time(name) > cutoff:
+                skipped += 1
+                continue
+            size = storage.size(name)
+            if opts["delete"]:
+                storage.delete(name)
+            else:
+                self.stdout.write(f"  {name} ({size // 1024} КБ)")
+            removed += 1
+            freed += size
+
+        verb = "Удалено" if opts["delete"] else "К удалению"
+        self.stdout.write(self.style.SUCCESS(
+            f"{verb}: {removed} файлов, {freed / 1024 / 1024:.1f} МБ; моложе {opts['min_age']:g} ч пропущено: {skipped}"
+        ))
+        self._gc_print_cache(images, cutoff, opts["delete"])
+        self._gc_preview_cache(cutoff, opts["delete"])
+
+    def _gc_print_cache(self, images, cutoff, delete):
+        # копии лежат по хэшу исходника: нужны только для хэшей текущих изображений
+        keep = {stored_digest(field.attr_class(None, field, name)) for field, name in images}
+        self._gc_cache_dirs("Печатные копии", PRINT_CACHE_DIR, keep, cutoff, delete)
+
+    def _gc_preview_cache(self, cutoff, delete):
+        # ключ предпросмотра — хэш данных черновика: после правки старый каталог
+        # больше не запросят, поэтому держим только открытые моложе --min-age
+        self._gc_cache_dirs("Предпросмотры", PREVIEW_CACHE_DIR, set(), cutoff, delete)
+
+    def _gc_cache_dirs(self, title, cache_dir, keep, cutoff, delete):
+        """Каталоги MEDIA_ROOT/<cache_dir>/<aa>/<ключ>/: удаляются не из keep и старше cutoff."""
+        root = Path(settings.MEDIA_ROOT) / cache_dir
+        if not root.is_dir():
+            return
+        removed = skipped = freed = 0
+        for key_dir in sorted(root.glob("*/*")):
+            if not key_dir.is_dir() or key_dir.name in keep:
+                continue
+            files = [f for f in key_dir.iterdir() if f.is_file()]
+            newest = max([key_dir.stat().st_mtime, *(f.stat().st_mtime for f in files)])
+            if datetime.fromtimestamp(newest, tz=timezone.utc) > cutoff:
+                skipped += 1
+                continue
+            size = sum(f.stat().st_size for f in files)
+            if delete:
+                shutil.rmtree(key_dir, ignore_errors=True)
+            else:
+                relative = key_dir.relative_to(settings.MEDIA_ROOT).as_posix()
+                self.stdout.write(f"  {relative}/ ({size // 1024} КБ)")
+            removed += 1
+            freed += size
+        verb = "Удалено" if delete else "К удалению"
+        self.stdout.write(self.style.SUCCESS(
+            f"{title} — {verb.lower()}: {removed} каталогов, {freed / 1024 / 1024:.1f} МБ; "
+            f"свежих пропущено: {skipped}"
+        ))
+
+    def _walk(self, storage, path):
+        if not storage.exists(path):
+            return
+        dirs, files = storage.listdir(path)
+        for name in files:
+            yield f"{path}/{name}"
+        for name in dirs:
+            yield from self._walk(storage, f"{path}/{name}")
@@ -112,14 +112,25 @@ def next(cls, scope: str, year: int, region_name: str) -> int:
         Атомарно увеличивает и возвращает следующий порядковый номер
         для пары (scope, year, region_name).
         """
+        return cls.reserve(scope, year, region_name, 1).start
+
+    @classmethod
+    def reserve(cls, scope: str, year: int, region_name: str, count: int) -> range:
+        """
+        Резервирует count номеров подряд и возвращает их диапазон.
+        Строка счётчика блокируется одним UPDATE value = value + count (а не
+        захватом на каждый номер); вне транзакции вызывающего резерв
+        фиксируется сразу, внутри — откатывается вместе с ней.
+        """
+        if count < 1:
+            raise ValueError("count должен быть >= 1")
+        key = dict(scope=scope, year=year, region_name=region_name or "")
         with transaction.atomic():
-            obj, _ = cls.objects.select_for_update().get_or_create(
-                scope=scope, year=year, region_name=region_name or ""
-            )
-            obj.value = F("value") + 1
-            obj.save(update_fields=["value"])
-            obj.refresh_from_db(fields=["value"])
-            return obj.value
+            if not cls.objects.filter(**key).update(value=F("value") + count):
+                cls.objects.get_or_create(**key)  # первый номер для пары
+                cls.objects.filter(**key).update(value=F("value") + count)
+            last = cls.objects.filter(**key).values_list("value", flat=True).get()
+        return range(last - count + 1, last + 1)
 
 
     def __str__(self):
@@ -0,0 +1,104 @@
+# apps/common/print_images.py
+"""
+Кэш уменьшенных под печать копий изображений для PDF.
+
+Фото с камеры (десятки мегапикселей) WeasyPrint декодирует и встраивает как
+есть. Для печати достаточно размера рамки в мм при PDF_PRINT_DPI, поэтому
+копия строится один раз и лежит в MEDIA_ROOT/print_cache/<sha256>/<W>x<H>.<ext>:
+ключ — хэш содержимого исходника (storage.stored_digest: исходник читается
+один раз на процесс, пока не изменятся его размер или mtime) и целевой
+размер в пикселях. Замена фото копий не удаляет: старые убирает manage.py gc_media.
+"""
+import os
+import tempfile
+from pathlib import Path
+
+from django.conf import settings
+from PIL import Image, ImageOps, UnidentifiedImageError
+
+from .instrumentation import stage
+from .storage import stored_digest
+
+PRINT_CACHE_DIR = "print_cache"
+MM_PER_INCH = 25.4
+
+
+def print_dpi() -> int:
+    """Разрешение печати; 0 — копии не делаем, встраиваем оригиналы."""
+    return int(getattr(settings, "PDF_PRINT_DPI", 300) or 0)
+
+
+def target_px(width_mm: float, height_mm: float, dpi: int) -> tuple[int, int]:
+    return (
+        max(1, round(width_mm / MM_PER_INCH * dpi)),
+        max(1, round(height_mm / MM_PER_INCH * dpi)),
+    )
+
+
+def source_digest(field) -> str:
+    """sha256 содержимого файла поля ('' — если файла нет)."""
+    return stored_digest(field) or ""
+
+
+def derivative_dir(digest: str) -> Path:
+    return Path(settings.MEDIA_ROOT) / PRINT_CACHE_DIR / digest[:2] / digest
+
+
+def _has_alpha(img) -> bool:
+    return img.mode in ("RGBA", "LA") or (img.mode == "P" and "transparency" in img.info)
+
+
+def print_derivative(field, width_mm: float, height_mm: float, dpi: int | None = None) -> str | None:
+    """
+    Абсолютный путь к копии под рамку width_mm x height_mm (пропорции
+    сохраняются, как object-fit: contain). None — если уменьшать не нужно
+    (исходник уже не больше рамки) или не удалось: тогда встраиваем оригинал.
+    """
+    dpi = print_dpi() if dpi is None else dpi
+    if not field or dpi <= 0:
+        return None
+    with stage("images"):
+        digest = source_digest(field)
+        if not digest:
+            return None
+
+        w, h = target_px(width_mm, height_mm, dpi)
+        out_dir = derivative_dir(digest)
+        for ext in ("jpg", "png"):
+            cached = out_dir / f"{w}x{h}.{ext}"
+            if cached.exists():
+                return str(cached)
+        return _build_derivative(field, out_dir, w, h)
+
+
+def _build_derivative(field, out_dir: Path, w: int, h: int) -> str | None:
+    try:
+        with field.storage.open(field.name, "rb") as f:
+            img = Image.open(f)
+            if max(img.size) <= min(w, h):
+                return None
+            img = ImageOps.exif_transpose(img)  # WeasyPrint тоже учитывает EXIF-поворот
+            img.thumbnail((w, h), Image.Resampling.LANCZOS)
+    except (UnidentifiedImageError, OSError):
+        return None
+
+    if _has_alpha(img):
+        ext, params = "png", {"optimize": True}
+        img = img.convert("RGBA")
+    else:
+        ext, params = "jpg", {"quality": int(getattr(settings, "PDF_PRINT_JPEG_QUALITY", 85)), "optimize": True}
+        img = img.convert("RGB")
+
+    out_dir.mkdir(parents=True, exist_ok=True)
+    target = out_dir / f"{w}x{h}.{ext}"
+    # воркеры issue_passports могут строить одну и ту же копию одновременно
+    fd, tmp = tempfile.mkstemp(dir=out_dir, suffix=f".{ext}")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            img.save(f, format="PNG" if ext == "png" else "JPEG", **params)
+        os.replace(tmp, target)
+    except BaseException:
+        if os.path.exists(tmp):
+            os.unlink(tmp)
+        raise
+    return str(target)
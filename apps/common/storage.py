@@ -0,0 +1,121 @@
+# apps/common/storage.py
+"""
+Хранилище медиа с адресацией по содержимому.
+
+Файл, сохранённый как "<upload_to>/<любое имя>.<ext>", ложится в
+"<upload_to>/<aa>/<bb>/<sha256>.<ext>" (aa, bb — первые байты хэша):
+  * каталоги не разрастаются до сотен тысяч файлов;
+  * перегенерация не оставляет копий с суффиксами (_AbC12dE) — тот же
+    контент получает то же имя;
+  * одинаковые файлы (повторный рендер, общий штрих-код) хранятся один раз.
+
+Поэтому один файл может принадлежать нескольким записям: удалять его при
+замене поля нельзя — неиспользуемые файлы убирает manage.py gc_media.
+Только для сгенерированных файлов (штрих-код, QR): STORAGES["generated"],
+поле подключает его через storage=generated_storage; upload_to остаётся
+префиксом. Загрузки пользователей и PDF паспортов (passports/<номер>.pdf)
+лежат в обычном хранилище под своими именами.
+"""
+import hashlib
+import os
+import posixpath
+import re
+import tempfile
+from functools import lru_cache
+
+from django.core.files.storage import FileSystemStorage, storages
+
+SHARD_DEPTH = 2  # уровней каталогов по 2 hex-символа
+
+
+def content_name(name: str, digest: str) -> str:
+    """'barcodes/UZ-1.png' + sha256 -> 'barcodes/ab/cd/abcd….png'."""
+    dirname, basename = posixpath.split(name)
+    ext = posixpath.splitext(basename)[1].lower()
+    shards = [digest[i * 2:i * 2 + 2] for i in range(SHARD_DEPTH)]
+    return posixpath.join(dirname, *shards, f"{digest}{ext}")
+
+
+_SHA256_RE = re.compile(r"^[0-9a-f]{64}$")
+
+
+def name_digest(name: str) -> str | None:
+    """sha256 из имени, выданного content_name (иначе None)."""
+    dirname, basename = posixpath.split(name or "")
+    digest = posixpath.splitext(basename)[0]
+    if not _SHA256_RE.match(digest):
+        return None
+    shards = dirname.split("/")[-SHARD_DEPTH:]
+    return digest if shards == [digest[i * 2:i * 2 + 2] for i in range(SHARD_DEPTH)] else None
+
+
+@lru_cache(maxsize=4096)
+def _read_digest(storage, name: str, size: int, mtime) -> str:
+    h = hashlib.sha256()
+    with storage.open(name, "rb") as f:
+        for chunk in iter(lambda: f.read(64 * 1024), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def stored_digest(field) -> str | None:
+    """
+    sha256 содержимого файла поля без повторного чтения: у файлов этого
+    хранилища хэш — само имя; у прочих (фото, документы) файл читается один
+    раз на (имя, размер, mtime) в процессе. None — файла нет.
+    """
+    if not field:
+        return None
+    digest = name_digest(field.name)
+    if digest:
+        return digest
+    storage = field.storage
+    try:
+        return _read_digest(storage, field.name, storage.size(field.name), storage.get_modified_time(field.name))
+    except (FileNotFoundError, OSError, NotImplementedError):
+        return None
+
+
+def _digest(content) -> str:
+    h = hashlib.sha256()
+    if hasattr(content, "seek"):
+        content.seek(0)
+    for chunk in content.chunks():
+        h.update(chunk)
+    if hasattr(content, "seek"):
+        content.seek(0)
+    return h.hexdigest()
+
+
+class ContentAddressedStorage(FileSystemStorage):
+    def get_available_name(self, name, max_length=None):
+        # имя всё равно заменит хэш содержимого (_save) — суффиксы не нужны
+        return name
+
+    def _save(self, name, content):
+        name = content_name(name, _digest(content))
+        if self.exists(name):
+            return name  # такой контент уже есть — второй копии не пишем
+
+        full_path = self.path(name)
+        directory = os.path.dirname(full_path)
+        os.makedirs(directory, mode=self.directory_permissions_mode or 0o777, exist_ok=True)
+        # одинаковый файл могут писать два процесса сразу: пишем во временный
+        # и переименовываем — кто бы ни был вторым, результат тот же
+        fd, tmp = tempfile.mkstemp(dir=directory, suffix=".part")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                for chunk in content.chunks():
+                    f.write(chunk)
+            os.chmod(tmp, self.file_permissions_mode or 0o644)
+            os.replace(tmp, full_path)
+        except BaseException:
+            if os.path.exists(tmp):
+                os.unlink(tmp)
+            raise
+        return name
+
+
+def generated_storage():
+    """storage= для полей со сгенерированными файлами (ссылка на функцию — её пишут миграции)."""
+    return storages["generated"]
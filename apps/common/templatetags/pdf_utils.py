@@ -1,6 +1,7 @@
 from django import template
 from django.conf import settings
 from django.contrib.staticfiles import finders
+from django.utils.safestring import mark_safe
 from urllib.parse import urljoin
 from pathlib import Path
 import os
@@ -90,3 +91,46 @@ def data_uri(field):
             return f"data:{mime};base64,{base64.b64encode(f.read()).decode('ascii')}"
     except Exception:
         return ""
+
+@register.filter
+def blank_rows(rows):
+    """True, если на странице таблицы нет ни одной заполненной строки."""
+    return not any(rows or [])
+
+@register.filter
+def print_image(field, box_mm="40x40"):
+    """
+    file:// к уменьшенной под печать копии изображения (рамка "ШxВ" в мм,
+    разрешение — PDF_PRINT_DPI). Если копия не нужна — оригинал, как fileuri.
+    """
+    from apps.common.print_images import print_derivative
+    width_mm, height_mm = (float(x) for x in str(box_mm).lower().split("x"))
+    path = print_derivative(field, width_mm, height_mm)
+    return _to_file_uri(path) if path else fileuri(field)
+
+@register.simple_tag(takes_context=True)
+def pdf_page_id(context, section, *parts, blank=False):
+    """
+    Атрибут id страницы паспорта для сборки из готовых страниц (см.
+    apps/passports/engine.py). Вне режима сборки — пусто, HTML не меняется.
+      static-slot-…  — неизменная страница (blank=True), подставится готовая;
+      section-slot-… — раздел уже свёрстан (cached_sections), подставится из кэша;
+      section-…      — страница раздела, которую верстаем и кладём в кэш.
+    В предпросмотре (preview_sections) страницы невыбранных разделов получают
+    preview-skip-… и не верстаются вовсе (apps/passports/preview.py).
+    """
+    preview = context.get("preview_sections")
+    if preview:
+        if section in preview:
+            return ""
+        return mark_safe(' id="{}"'.format("-".join(str(p) for p in ("preview-skip", section, *parts))))
+    if not context.get("splice_static"):
+        return ""
+    if blank:
+        prefix = "static-slot"
+    elif section in context.get("cached_sections", ()):
+        prefix = "section-slot"
+    else:
+        prefix = "section"
+    name = "-".join(str(p) for p in (prefix, section, *parts))
+    return mark_safe(f' id="{name}"')
@@ -1,3 +1,86 @@
-from django.test import TestCase
+import hashlib
+import os
+import tempfile
+import time
+from datetime import date
+from io import StringIO
 
-# Create your tests here.
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.core.management import call_command
+from django.test import TestCase, override_settings
+
+from apps.horses.models import Horse
+from apps.passports.preview import preview_dir
+from .models import Breed, Color, NumberSequence
+from .print_images import derivative_dir
+from .storage import content_name, generated_storage, stored_digest
+from .utils import make_horse_registry_nos, make_passport_number
+
+
+class GcMediaTests(TestCase):
+    def setUp(self):
+        media = tempfile.TemporaryDirectory()
+        self.addCleanup(media.cleanup)
+        overridden = override_settings(MEDIA_ROOT=media.name)
+        overridden.enable()
+        self.addCleanup(overridden.disable)
+
+    def _file(self, content: bytes, hours_old: float, storage=default_storage, name="horses/photo.jpg") -> str:
+        name = storage.save(name, ContentFile(content))
+        self._age(storage.path(name), hours_old)
+        return name
+
+    def _cache_dir(self, out_dir, filename: str, hours_old: float):
+        out_dir.mkdir(parents=True)
+        (out_dir / filename).write_bytes(b"cached")
+        self._age(out_dir / filename, hours_old)
+        self._age(out_dir, hours_old)
+        return out_dir
+
+    def _age(self, path, hours_old: float):
+        stamp = time.time() - hours_old * 3600
+        os.utime(path, (stamp, stamp))
+
+    def test_deletes_only_old_orphans(self):
+        referenced = self._file(b"referenced", hours_old=48)
+        orphan = self._file(b"orphan", hours_old=48)
+        fresh = self._file(b"fresh", hours_old=1)
+        barcode = self._file(b"barcode", hours_old=48, storage=generated_storage(), name="barcodes/UZ-1.png")
+        horse = Horse.objects.create(
+            name="Лошадь", sex="M", birth_date=date(2020, 1, 1), breed=Breed.objects.create(name="Ахалтекинская"),
+            color=Color.objects.create(name="Гнедая"), microchip="900000000000001", photo_muzzle=referenced,
+        )
+        # загрузки — под своими именами, сгенерированные файлы — по хэшу содержимого
+        self.assertTrue(referenced.startswith("horses/photo"))
+        self.assertEqual(barcode, content_name("barcodes/UZ-1.png", hashlib.sha256(b"barcode").hexdigest()))
+        kept_copy = self._cache_dir(derivative_dir(stored_digest(horse.photo_muzzle)), "60x40-300.jpg", 48)
+        stale_copy = self._cache_dir(derivative_dir(hashlib.sha256(b"orphan").hexdigest()), "60x40-300.jpg", 48)
+
+        call_command("gc_media", min_age=24, stdout=StringIO())
+        self.assertTrue(all(default_storage.exists(name) for name in (referenced, orphan, fresh)))
+        self.assertTrue(stale_copy.is_dir())
+
+        call_command("gc_media", delete=True, min_age=24, stdout=StringIO())
+        self.assertTrue(default_storage.exists(referenced))
+        self.assertFalse(default_storage.exists(orphan))
+        self.assertTrue(default_storage.exists(fresh))  # моложе --min-age
+        self.assertFalse(generated_storage().exists(barcode))
+        self.assertTrue(kept_copy.is_dir())
+        self.assertFalse(stale_copy.exists())
+
+    def test_sweeps_previews_not_opened_within_min_age(self):
+        old = self._cache_dir(preview_dir("a" * 64), "page-001.png", hours_old=48)
+        recent = self._cache_dir(preview_dir("b" * 64), "page-001.png", hours_old=1)
+        call_command("gc_media", delete=True, min_age=24, stdout=StringIO())
+        self.assertFalse(old.exists())
+        self.assertTrue(recent.is_dir())
+
+
+class NumberSequenceTests(TestCase):
+    def test_reserve_and_batch_numbers_continue_sequence(self):
+        self.assertEqual(NumberSequence.reserve("PASSPORT", 1, "JIZ", 3), range(1, 4))
+        self.assertEqual(make_passport_number("jiz", 1), "UZ-JIZ-010004")
+        year = date.today().year
+        self.assertEqual(make_horse_registry_nos("jiz", 2), ["H-JIZ-000001", "H-JIZ-000002"])
+        self.assertEqual(NumberSequence.next("HORSE", year, "JIZ"), 3)
@@ -1,17 +1,32 @@
 from datetime import date
+
 from .models import NumberSequence
 
 
+def _horse_reg(region_code: str) -> str:
+    return (region_code or "FAL").upper()  # FAL — безопасный fallback
+
+
 def make_horse_registry_no(region_code: str = "") -> str:
     """
     H-<REG>-<####$$>, счётчик раздельно по (HORSE, REG).
     """
     year = date.today().year
-    reg = (region_code or "FAL").upper() # FAL — безопасный fallback
+    reg = _horse_reg(region_code)
     seq = NumberSequence.next("HORSE", year, reg)
     return f"H-{reg}-{seq:06d}"
 
 
+def make_horse_registry_nos(region_code: str, count: int) -> list[str]:
+    """
+    count номеров make_horse_registry_no одним резервом NumberSequence (одна
+    блокировка строки счётчика на пачку; откатывается вместе с транзакцией).
+    """
+    reg = _horse_reg(region_code)
+    seqs = NumberSequence.reserve("HORSE", date.today().year, reg, count)
+    return [f"H-{reg}-{seq:06d}" for seq in seqs]
+
+
 def make_passport_number(region_code: str, district_number: int | None = None) -> str:
     """
     Возвращает номер паспорта: UZ-<REG>-<RR><NNNN>.
@@ -1,5 +1,6 @@
 # horses/admin.py
 from django.contrib import admin
+from django.db.models import Q
 from django.templatetags.static import static
 from django.utils.html import format_html
 
@@ -8,7 +9,9 @@
     HorseMeasurements, DiagnosticCheck,
     SportAchievement, ExhibitionEntry, Offspring, HorseBonitation, RealOffspringNode, RealOffspring, HorseDiagram
 )
+from apps.passports import search
 from apps.vet.models import Vaccination, LabTest
+from . import microchips
 
 
 class IdentificationEventInline(admin.TabularInline):
@@ -94,7 +97,8 @@ def preview(self, obj):
 @admin.register(Horse)
 class HorseAdmin(admin.ModelAdmin):
     list_display = ("name", "registry_no", "microchip", "breed", "color", "birth_date", "place_of_birth", "horse_type", "created_at")
-    search_fields = ("name", "registry_no", "microchip", "brand_mark")
+    search_fields = ("name", "registry_no", "microchip", "offspring__brand_no")
+    search_help_text = "Кличка, рег. номер, тавро, номер паспорта, владелец (начала слов) или часть микрочипа"
     list_filter = ("breed", "color", "place_of_birth", "horse_type")
     readonly_fields = ("registry_no",)
 
@@ -138,6 +142,22 @@ class Media:
             "js/microchip_scanner.js",
         )
 
+    def get_search_results(self, request, queryset, search_term):
+        term = search_term.strip()
+        if not term:
+            return queryset, False
+        indexed = Q(passport__in=search.matching(term).values("passport_id"))
+        # лошадей без паспорта в PassportSearch нет: по ним — начало чипа, рег. номера, клички или тавро
+        branded = Offspring.objects.filter(brand_no__istartswith=term).values("horse_id")
+        bare = Q(passport__isnull=True) & (
+            microchips.lookup(term) | Q(registry_no__istartswith=term) | Q(name__istartswith=term)
+            | Q(pk__in=branded)
+        )
+        condition = indexed | bare
+        if search.looks_like_microchip(term):
+            condition |= microchips.find_substring(term)
+        return queryset.filter(condition), False
+
 
 @admin.register(HorseMeasurements)
 class HorseMeasurementsAdmin(admin.ModelAdmin):
@@ -0,0 +1,81 @@
+# apps/horses/management/commands/benchmark_bulk_register.py
+import time
+from datetime import date
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from apps.common.models import Breed, Color, Region
+from apps.horses.models import Horse
+
+
+class _Rollback(Exception):
+    pass
+
+
+class Command(BaseCommand):
+    help = (
+        "Бенчмарк импорта лошадей: Horse.save() по одной (--baseline строк, время "
+        "экстраполируется) против Horse.objects.bulk_register (--rows строк). "
+        "Всё в транзакции, которая откатывается (если не указан --keep)."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--rows", type=int, default=100_000, help="Лошадей для bulk_register")
+        parser.add_argument("--baseline", type=int, default=1000, help="Лошадей для save() по одной")
+        parser.add_argument("--regions", type=int, default=14, help="Регионов (счётчиков номеров)")
+        parser.add_argument("--batch-size", type=int, default=1000)
+        parser.add_argument("--keep", action="store_true", help="Не откатывать созданные записи")
+
+    def handle(self, *args, **opts):
+        if opts["rows"] < 1 or opts["baseline"] < 0 or opts["regions"] < 1:
+            raise CommandError("--rows и --regions должны быть положительными, --baseline — не меньше 0")
+
+        try:
+            with transaction.atomic():
+                self._run(opts)
+                if not opts["keep"]:
+                    raise _Rollback
+        except _Rollback:
+            self.stdout.write("Транзакция откачена, данные не сохранены.")
+
+    def _run(self, opts):
+        breed, _ = Breed.objects.get_or_create(name="Бенчмарк")
+        color, _ = Color.objects.get_or_create(name="Бенчмарк")
+        regions = [
+            Region.objects.get_or_create(name=f"Бенчмарк {i:02d}", defaults={"code": f"B{i:02d}"})[0]
+            for i in range(opts["regions"])
+        ]
+        # 15-значные микрочипы из диапазона, которого нет в БД
+        base = int(Horse.objects.filter(microchip__startswith="9").order_by("-microchip")
+                   .values_list("microchip", flat=True).first() or "900000000000000") + 1
+
+        def make(start, count):
+            return [
+                Horse(name=f"Лошадь {i}", sex="MF"[i % 2], birth_date=date(2015 + i % 10, 1 + i % 12, 1),
+                      breed=breed, color=color, place_of_birth=regions[i % len(regions)],
+                      microchip=f"{base + i:015d}")
+                for i in range(start, start + count)
+            ]
+
+        before = None
+        if opts["baseline"]:
+            horses = make(0, opts["baseline"])
+            started = time.perf_counter()
+            for h in horses:
+                h.save()
+            before = (time.perf_counter() - started) / len(horses)
+            self.stdout.write(
+                f"save() по одной: {len(horses)} шт. за {before * len(horses):.2f} с "
+                f"({1 / before:.0f} шт./с, на {opts['rows']} — ~{before * opts['rows']:.0f} с)"
+            )
+
+        horses = make(opts["baseline"], opts["rows"])
+        started = time.perf_counter()
+        Horse.objects.bulk_register(horses, batch_size=opts["batch_size"])
+        after = (time.perf_counter() - started) / len(horses)
+        self.stdout.write(
+            f"bulk_register: {len(horses)} шт. за {after * len(horses):.2f} с ({1 / after:.0f} шт./с)"
+        )
+        if before:
+            self.stdout.write(self.style.SUCCESS(f"Ускорение: x{before / after:.1f}"))
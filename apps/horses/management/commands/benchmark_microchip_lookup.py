@@ -0,0 +1,108 @@
+# apps/horses/management/commands/benchmark_microchip_lookup.py
+import random
+import statistics
+import time
+from datetime import date
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+
+from apps.common.models import Breed, Color
+from apps.horses import microchips
+from apps.horses.models import Horse
+
+
+class _Rollback(Exception):
+    pass
+
+
+class Command(BaseCommand):
+    help = (
+        "Бенчмарк поиска по микрочипу на --horses лошадях: прежний LIKE (icontains) против "
+        "точного совпадения, префикса по уникальному индексу и поиска по части номера "
+        "(pg_trgm / MicrochipNgram). Всё в транзакции, которая откатывается."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--horses", type=int, default=1_000_000, help="Сколько лошадей добавить")
+        parser.add_argument("--queries", type=int, default=20, help="Запросов каждого вида")
+        parser.add_argument("--prefix", type=int, default=8, help="Длина префикса/части номера, цифр")
+        parser.add_argument("--batch-size", type=int, default=5000)
+        parser.add_argument("--seed", type=int, default=1)
+
+    def handle(self, *args, **opts):
+        if opts["horses"] < 1 or opts["queries"] < 1 or not 1 <= opts["prefix"] < microchips.MICROCHIP_LEN:
+            raise CommandError("--horses и --queries должны быть положительными, --prefix — от 1 до 14")
+        try:
+            with transaction.atomic():
+                self._run(opts)
+                raise _Rollback
+        except _Rollback:
+            self.stdout.write("Транзакция откачена, данные не сохранены.")
+
+    def _run(self, opts):
+        rng = random.Random(opts["seed"])
+        chips = self._fill(rng, opts)
+        started = time.perf_counter()
+        done = microchips.build_index(concurrently=False, chunk_size=opts["batch_size"])
+        self.stdout.write(f"{done}: {time.perf_counter() - started:.1f} с")
+        if connection.vendor == "sqlite":
+            connection.cursor().execute("ANALYZE")
+
+        n = opts["prefix"]
+        samples = rng.sample(chips, opts["queries"])
+        parts = []
+        for mc in samples:
+            start = rng.randrange(1, microchips.MICROCHIP_LEN - n + 1)
+            parts.append(mc[start:start + n])
+        cases = [
+            ("15 цифр", samples, lambda v: Horse.objects.filter(microchip__icontains=v),
+             lambda v: Horse.objects.filter(microchips.lookup(v))),
+            # прежний фильтр на префиксе находил бы и вхождения в середине — сравниваем с LIKE 'x%'
+            (f"префикс {n}", [mc[:n] for mc in samples], lambda v: Horse.objects.filter(microchip__istartswith=v),
+             lambda v: Horse.objects.filter(microchips.lookup(v))),
+            (f"часть {n}", parts, lambda v: Horse.objects.filter(microchip__icontains=v),
+             lambda v: Horse.objects.filter(microchips.find_substring(v))),
+        ]
+        for title, values, old, new in cases:
+            before, found_before = self._time(old, values)
+            after, found_after = self._time(new, values)
+            if found_before != found_after:
+                raise CommandError(f"{title}: результаты расходятся ({found_before} против {found_after})")
+            self.stdout.write(
+                f"{title:>12}: LIKE {before:8.2f} мс, индекс {after:7.2f} мс "
+                f"(x{before / after:.0f}), найдено {found_after}"
+            )
+
+    def _fill(self, rng, opts) -> list[str]:
+        breed, _ = Breed.objects.get_or_create(name="Бенчмарк")
+        color, _ = Color.objects.get_or_create(name="Бенчмарк")
+        taken = set(Horse.objects.values_list("microchip", flat=True))
+        chips = set()
+        while len(chips) < opts["horses"]:
+            mc = f"{rng.randrange(10 ** 15):015d}"
+            if mc not in taken:
+                chips.add(mc)
+        chips = sorted(chips)
+        rng.shuffle(chips)
+
+        started = time.perf_counter()
+        # bulk_create напрямую: registry_no известны, валидация bulk_register здесь не измеряется
+        for i in range(0, len(chips), opts["batch_size"]):
+            Horse.objects.bulk_create([
+                Horse(name=f"Лошадь {j}", sex="MF"[j % 2], birth_date=date(2015, 1, 1), breed=breed, color=color,
+                      microchip=mc, registry_no=f"BENCH-{mc}")
+                for j, mc in enumerate(chips[i:i + opts["batch_size"]], start=i)
+            ])
+        self.stdout.write(f"Добавлено лошадей: {len(chips)} за {time.perf_counter() - started:.1f} с")
+        return chips
+
+    @staticmethod
+    def _time(make_qs, values) -> tuple[float, int]:
+        """Медиана времени запроса (мс) и всего найдено."""
+        timings, found = [], 0
+        for v in values:
+            started = time.perf_counter()
+            found += len(list(make_qs(v).values_list("pk", flat=True)))
+            timings.append((time.perf_counter() - started) * 1000)
+        return statistics.median(timings), found
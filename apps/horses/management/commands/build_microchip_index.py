@@ -0,0 +1,15 @@
+# apps/horses/management/commands/build_microchip_index.py
+from django.core.management.base import BaseCommand
+
+from apps.horses import microchips
+
+
+class Command(BaseCommand):
+    help = (
+        "Индекс для поиска по части микрочипа: на PostgreSQL — pg_trgm и GIN-индекс "
+        "(CREATE INDEX CONCURRENTLY, таблица не блокируется), на остальных БД — "
+        "полное перезаполнение таблицы 4-грамм MicrochipNgram."
+    )
+
+    def handle(self, *args, **opts):
+        self.stdout.write(self.style.SUCCESS(microchips.build_index()))
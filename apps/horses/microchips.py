@@ -0,0 +1,120 @@
+# apps/horses/microchips.py
+"""
+Поиск по микрочипу без полного просмотра таблицы лошадей.
+
+  * 15 цифр (сканер) — точное совпадение по уникальному индексу;
+  * меньше цифр — префикс как диапазон [prefix, prefix+1): работает по тому же
+    btree-индексу на любой БД (LIKE 'x%' на SQLite индекс не использует);
+  * часть номера из середины (find_substring) — на PostgreSQL обычный
+    LIKE '%x%', который ускоряет GIN-индекс pg_trgm; на остальных БД — через
+    таблицу 4-грамм MicrochipNgram (если включена MICROCHIP_NGRAM_INDEX).
+    Индексы создаёт/заполняет manage.py build_microchip_index.
+"""
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import Count, Q
+
+MICROCHIP_LEN = 15
+NGRAM = 4
+TRGM_INDEX = "horses_horse_microchip_trgm"
+
+
+def normalize(value: str) -> str:
+    """Оставляет только цифры: сканеры и копипаст добавляют пробелы/дефисы."""
+    return "".join(ch for ch in (value or "") if ch.isdigit())
+
+
+NOTHING = Q(pk__in=[])
+
+
+def lookup(value: str, field: str = "microchip") -> Q:
+    """Условие для точного номера или префикса (field — путь до Horse.microchip)."""
+    digits = normalize(value)
+    if not digits:
+        return NOTHING
+    if len(digits) >= MICROCHIP_LEN:
+        return Q(**{field: digits})
+    upper = str(int(digits) + 1).zfill(len(digits))
+    if len(upper) > len(digits):  # "999" -> всё, что >= "999"
+        return Q(**{f"{field}__gte": digits})
+    return Q(**{f"{field}__gte": digits, f"{field}__lt": upper})
+
+
+def ngrams(microchip: str) -> set[str]:
+    return {microchip[i:i + NGRAM] for i in range(len(microchip) - NGRAM + 1)}
+
+
+def ngram_index_enabled() -> bool:
+    return bool(getattr(settings, "MICROCHIP_NGRAM_INDEX", False)) and connection.vendor != "postgresql"
+
+
+def find_substring(value: str, horse_field: str = "") -> Q:
+    """
+    Условие «микрочип содержит value» (horse_field — путь до Horse, "" для самой
+    лошади). С таблицей n-грамм кандидаты — лошади, у которых есть все 4-граммы
+    искомого, а LIKE проверяет уже только их.
+    """
+    digits = normalize(value)
+    if not digits:
+        return NOTHING
+    prefix = f"{horse_field}__" if horse_field else ""
+    condition = Q(**{f"{prefix}microchip__contains": digits})
+    if len(digits) < NGRAM or not ngram_index_enabled():
+        return condition
+    from .models import MicrochipNgram
+
+    grams = ngrams(digits)
+    candidates = (
+        MicrochipNgram.objects.filter(gram__in=grams)
+        .values("horse_id").annotate(n=Count("gram")).filter(n=len(grams)).values("horse_id")
+    )
+    return condition & Q(**{f"{prefix}pk__in": candidates})
+
+
+def index_horses(horses):
+    """Перестроить 4-граммы для лошадей (после создания или смены чипа)."""
+    if not ngram_index_enabled():
+        return
+    from .models import MicrochipNgram
+
+    horses = [h for h in horses if h.pk]
+    with transaction.atomic():
+        MicrochipNgram.objects.filter(horse_id__in=[h.pk for h in horses]).delete()
+        MicrochipNgram.objects.bulk_create(
+            [MicrochipNgram(horse_id=h.pk, gram=g) for h in horses for g in ngrams(h.microchip or "")],
+            batch_size=5000,
+        )
+
+
+def build_index(concurrently: bool = True, chunk_size: int = 5000) -> str:
+    """
+    PostgreSQL: расширение pg_trgm и GIN-индекс по Horse.microchip (CONCURRENTLY
+    нельзя внутри транзакции). Остальные БД: заново заполнить MicrochipNgram.
+    Возвращает описание сделанного.
+    """
+    from .models import Horse, MicrochipNgram
+
+    if connection.vendor == "postgresql":
+        table = connection.ops.quote_name(Horse._meta.db_table)
+        with connection.cursor() as cursor:
+            cursor.execute("CREATE EXTENSION IF NOT EXISTS pg_trgm")
+            cursor.execute(
+                f"CREATE INDEX {'CONCURRENTLY ' if concurrently else ''}IF NOT EXISTS {TRGM_INDEX} "
+                f"ON {table} USING gin (microchip gin_trgm_ops)"
+            )
+            cursor.execute(f"ANALYZE {table}")
+        return f"GIN-индекс {TRGM_INDEX} (pg_trgm)"
+    if not ngram_index_enabled():
+        return "MICROCHIP_NGRAM_INDEX выключен — поиск по части номера без индекса"
+
+    with transaction.atomic():
+        MicrochipNgram.objects.all().delete()
+        batch, horses = [], 0
+        for pk, mc in Horse.objects.order_by().values_list("pk", "microchip").iterator(chunk_size=chunk_size):
+            batch += [MicrochipNgram(horse_id=pk, gram=g) for g in ngrams(mc or "")]
+            horses += 1
+            if len(batch) >= chunk_size:
+                MicrochipNgram.objects.bulk_create(batch)
+                batch = []
+        MicrochipNgram.objects.bulk_create(batch)
+    return f"4-граммы MicrochipNgram для {horses} лошадей"
@@ -1,15 +1,109 @@
 from decimal import Decimal
 
 from django.db import models, transaction, IntegrityError
+from django.core.exceptions import ValidationError
 from django.core.validators import RegexValidator, MinValueValidator, MaxValueValidator
 from django.templatetags.static import static
 
 from apps.common.models import Breed, Color, Region, Country
 from apps.parties.models import Owner, Veterinarian
-from apps.common.utils import make_horse_registry_no
+from apps.common.utils import make_horse_registry_no, make_horse_registry_nos
+from . import microchips
+from .signals import microchips_changed
 
 MICROCHIP_VALIDATOR = RegexValidator(r'^\d{15}$', 'Микрочип должен содержать 15 цифр (ISO 11784/11785).')
 
+class HorseQuerySet(models.QuerySet):
+    def bulk_update_microchips(self, mapping: dict, batch_size: int = 500) -> list[int]:
+        """
+        Смена микрочипов набора лошадей {pk: microchip} одним bulk_update,
+        без save() по каждой. Возвращает pk лошадей, у которых чип изменился:
+        о них рассылается microchips_changed — паспорта обновляют штрих-код
+        и ставят перегенерацию кодов (apps/passports/signals.py).
+        """
+        mapping = {int(pk): (mc or "").strip() for pk, mc in mapping.items()}
+        for mc in mapping.values():
+            MICROCHIP_VALIDATOR(mc)
+        if len(set(mapping.values())) != len(mapping):
+            raise ValidationError("Один микрочип указан для нескольких лошадей.")
+
+        with transaction.atomic():
+            horses = self.filter(pk__in=mapping).only("pk", "microchip").in_bulk()
+            changed = [h for h in horses.values() if h.microchip != mapping[h.pk]]
+            for horse in changed:
+                horse.microchip = mapping[horse.pk]
+            self.model.objects.bulk_update(changed, ["microchip"], batch_size=batch_size)
+            microchips.index_horses(changed)
+            horse_ids = sorted(h.pk for h in changed)
+            if horse_ids:
+                microchips_changed.send(sender=self.model, horse_ids=horse_ids)
+        return horse_ids
+
+    def bulk_register(self, horses, batch_size: int = 1000) -> list["Horse"]:
+        """
+        Регистрация набора новых лошадей без save() по каждой (импорт из
+        старого реестра): микрочипы проверяются на формат, повторы в наборе и
+        занятость в БД (set-запросом по пачкам), registry_no выдаются одним
+        резервом счётчика на регион, вставка — bulk_create пачками.
+        Всё в одной транзакции: при ошибке не создаётся ни одной лошади.
+
+        post_save не рассылается — для новых лошадей он и не нужен (паспортов
+        у них ещё нет). Возвращает те же объекты с pk и registry_no.
+        """
+        horses = list(horses)
+        errors = []
+        for h in horses:
+            h.microchip = (h.microchip or "").strip()
+            try:
+                MICROCHIP_VALIDATOR(h.microchip)
+            except ValidationError:
+                errors.append(f"{h.name}: неверный микрочип «{h.microchip}»")
+        chips = [h.microchip for h in horses]
+        seen, repeated = set(), set()
+        for mc in chips:
+            (repeated if mc in seen else seen).add(mc)
+        errors += [f"Микрочип {mc} указан для нескольких лошадей" for mc in sorted(repeated)]
+        errors += [f"Микрочип {mc} уже зарегистрирован" for mc in sorted(self._existing("microchip", seen, batch_size))]
+        if errors:
+            raise ValidationError(errors)
+
+        with transaction.atomic():
+            self._assign_registry_nos([h for h in horses if not h.registry_no], batch_size)
+            created = self.model.objects.bulk_create(horses, batch_size=batch_size)
+            microchips.index_horses(created)
+            return created
+
+    def _existing(self, field: str, values, batch_size: int) -> set:
+        values = list(values)
+        found = set()
+        for i in range(0, len(values), batch_size):
+            found.update(
+                self.model.objects.filter(**{f"{field}__in": values[i:i + batch_size]})
+                .values_list(field, flat=True)
+            )
+        return found
+
+    def _assign_registry_nos(self, horses, batch_size: int):
+        region_ids = {h.place_of_birth_id for h in horses if h.place_of_birth_id}
+        codes = dict(Region.objects.filter(pk__in=region_ids).values_list("pk", "code"))
+        by_code = {}
+        for h in horses:
+            by_code.setdefault(codes.get(h.place_of_birth_id) or "", []).append(h)
+
+        for code, group in by_code.items():
+            pending = group
+            # как и в save(): номер мог уже быть занят при рассинхроне счётчика
+            for _ in range(5):
+                for h, no in zip(pending, make_horse_registry_nos(code, len(pending))):
+                    h.registry_no = no
+                taken = self._existing("registry_no", [h.registry_no for h in pending], batch_size)
+                pending = [h for h in pending if h.registry_no in taken]
+                if not pending:
+                    break
+            else:
+                raise IntegrityError("Не удалось сгенерировать уникальные registry_no после 5 попыток")
+
+
 class Horse(models.Model):
     HORSE_TYPE_CHOICES = [
         ("SPORT", "Спортивная"),
@@ -39,6 +133,8 @@ class Horse(models.Model):
 
     created_at = models.DateTimeField("Создано", auto_now_add=True)
 
+    objects = HorseQuerySet.as_manager()
+
     class Meta:
         verbose_name = "Регистрация лошади"
         verbose_name_plural = "Регистрация лошадей"
@@ -46,6 +142,12 @@ class Meta:
     def __str__(self): return f"{self.name} [{self.registry_no}]"
 
     def save(self, *args, **kwargs):
+        self._save_with_registry_no(*args, **kwargs)
+        update_fields = kwargs.get("update_fields")
+        if update_fields is None or "microchip" in update_fields:
+            microchips.index_horses([self])
+
+    def _save_with_registry_no(self, *args, **kwargs):
         if self.registry_no:
             return super().save(*args, **kwargs)
 
@@ -68,6 +170,19 @@ def save(self, *args, **kwargs):
 
         raise IntegrityError("Не удалось сгенерировать уникальный registry_no после 5 попыток")
 
+class MicrochipNgram(models.Model):
+    """4-граммы микрочипа — поиск по части номера без LIKE '%…%' по всей таблице (см. microchips.py)."""
+    horse = models.ForeignKey(Horse, on_delete=models.CASCADE, related_name="microchip_ngrams")
+    gram = models.CharField(max_length=microchips.NGRAM)
+
+    class Meta:
+        verbose_name = "N-грамма микрочипа"
+        verbose_name_plural = "N-граммы микрочипов"
+        indexes = [
+            models.Index(fields=["gram", "horse"]),
+        ]
+
+
 class HorseDiagram(models.Model):
     """
     Схема для страницы «График тасвири / Diagram outline».
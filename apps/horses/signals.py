@@ -0,0 +1,7 @@
+# apps/horses/signals.py
+from django.dispatch import Signal
+
+# Микрочипы лошадей сменены набором (Horse.objects.bulk_update_microchips):
+# post_save при этом не рассылается. Аргумент horse_ids — pk лошадей, у которых
+# чип действительно изменился; отправляется внутри транзакции обновления.
+microchips_changed = Signal()
@@ -1,3 +1,52 @@
-from django.test import TestCase
+from datetime import date
 
-# Create your tests here.
+from django.core.exceptions import ValidationError
+from django.test import TestCase, override_settings
+
+from apps.common.models import Breed, Color, Region
+from . import microchips
+from .models import Horse
+
+
+class HorseBulkRegisterTests(TestCase):
+    def test_bulk_register_numbers_by_region_and_rejects_taken_microchips(self):
+        region = Region.objects.create(name="Джизак", code="JIZ")
+        breed, color = Breed.objects.create(name="Ахалтекинская"), Color.objects.create(name="Гнедая")
+
+        def horse(i, **kw):
+            return Horse(name=f"Лошадь {i}", sex="M", birth_date=date(2020, 1, 1), breed=breed, color=color,
+                         microchip=f"{900000000000000 + i}", **kw)
+
+        created = Horse.objects.bulk_register(
+            [horse(1, place_of_birth=region), horse(2), horse(3, place_of_birth=region)]
+        )
+        self.assertTrue(all(h.pk for h in created))
+        self.assertEqual([h.registry_no[:6] for h in created], ["H-JIZ-", "H-FAL-", "H-JIZ-"])
+        self.assertEqual(len({h.registry_no for h in created}), 3)
+        with self.assertRaises(ValidationError):
+            Horse.objects.bulk_register([horse(3), horse(4)])
+        self.assertEqual(Horse.objects.count(), 3)
+
+
+class MicrochipLookupTests(TestCase):
+    def test_microchip_lookup_exact_prefix_and_part(self):
+        breed, color = Breed.objects.create(name="Карабаирская"), Color.objects.create(name="Серая")
+        chips = ["643000000123456", "643000000123999", "643001234560000"]
+        horses = Horse.objects.bulk_register(
+            Horse(name=f"Лошадь {i}", sex="F", birth_date=date(2019, 1, 1), breed=breed, color=color, microchip=mc)
+            for i, mc in enumerate(chips)
+        )
+        horses[2].microchip = "643999999999999"
+        horses[2].save()
+
+        def found(q):
+            return sorted(Horse.objects.filter(q).values_list("microchip", flat=True))
+
+        self.assertEqual(found(microchips.lookup("643 000 000 123 456")), ["643000000123456"])
+        self.assertEqual(found(microchips.lookup("64300000012")), chips[:2])
+        self.assertEqual(found(microchips.lookup("6439")), ["643999999999999"])
+        self.assertEqual(found(microchips.lookup("abc")), [])
+        for enabled in (True, False):
+            with override_settings(MICROCHIP_NGRAM_INDEX=enabled):
+                self.assertEqual(found(microchips.find_substring("12345")), ["643000000123456"])
+                self.assertEqual(found(microchips.find_substring("9999")), ["643999999999999"])
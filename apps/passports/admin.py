@@ -1,8 +1,17 @@
 from django.contrib import admin, messages
 from django.db.models import Q
+from django.http import FileResponse, Http404
+from django.shortcuts import get_object_or_404
+from django.template.response import TemplateResponse
+from django.urls import path, reverse
+from django.utils.html import format_html
 from django.utils.timezone import now
-from .models import Passport
-from .services import render_passport_pdf
+from apps.common import cache
+from apps.horses import microchips
+from . import rollup, search
+from .fingerprint import SECTIONS
+from .models import Passport, RenderJob
+from .preview import parse_sections, passport_preview
 from django.contrib.admin import SimpleListFilter
 
 
@@ -28,11 +37,12 @@ class PassportAdmin(admin.ModelAdmin):
     list_display = ("number", "old_passport_number", "horse", "status", "version", "imported_badge", "active_badge", "issue_date", "created_at")
     list_filter = ("status", "issue_date", "version", ImportedFilter)
     search_fields = ("number", "old_passport_number", "horse__name", "horse__registry_no", "horse__microchip")
+    search_help_text = "Номер, старый номер, кличка, рег. номер, тавро, владелец (начала слов) или часть микрочипа"
     readonly_fields = (
         "barcode_value",
         "number", "qr_public_id", "created_at",
-        "barcode_image", "qr_image", "pdf_file",
-        "version", "public_link",
+        "barcode_image", "qr_image", "pdf_file", "pdf_fingerprint",
+        "version", "public_link", "preview_link",
     )
 
     fieldsets = (
@@ -47,7 +57,7 @@ class PassportAdmin(admin.ModelAdmin):
         }),
         ("Файл", {
             "classes": ("tab", "tab-file"),
-            "fields": ("pdf_file",),
+            "fields": ("pdf_file", "pdf_fingerprint", "preview_link"),
         }),
         ("Аннулирование / Служебное", {
             "classes": ("tab", "tab-service"),
@@ -55,6 +65,17 @@ class PassportAdmin(admin.ModelAdmin):
         }),
     )
 
+    def get_search_results(self, request, queryset, search_term):
+        # search_fields — только для подписи; ищем по индексу PassportSearch (search.py),
+        # а цифры — ещё и в середине микрочипа (индекс в токенах находит только начало)
+        term = search_term.strip()
+        if not term:
+            return queryset, False
+        condition = Q(pk__in=search.matching(term).values("passport_id"))
+        if search.looks_like_microchip(term):
+            condition |= microchips.find_substring(term, "horse")
+        return queryset.filter(condition), False
+
     def imported_badge(self, obj):
         return "Старый (импорт)" if obj.has_old else "Новый"
 
@@ -70,37 +91,113 @@ def public_link(self, obj):
 
     public_link.short_description = "Публичная ссылка"
 
-    actions = ["issue_passport", "revoke_passport", "reissue_passport"]
+    def preview_link(self, obj):
+        if not obj or not obj.pk:
+            return ""
+        return format_html('<a href="{}" target="_blank">Открыть предпросмотр</a>',
+                           reverse("admin:passports_passport_preview", args=[obj.pk]))
+
+    preview_link.short_description = "Предпросмотр"
+
+    # --- предпросмотр: выбранные разделы, PNG низкого разрешения, без выпуска ---
+
+    def get_urls(self):
+        view = self.admin_site.admin_view
+        return [
+            path("<int:pk>/preview/", view(self.preview_view), name="passports_passport_preview"),
+            path("<int:pk>/preview/<int:page>/", view(self.preview_page_view), name="passports_passport_preview_page"),
+        ] + super().get_urls()
+
+    def _preview_files(self, request, pk):
+        passport = get_object_or_404(Passport.objects.select_related("horse"), pk=pk)
+        if not self.has_view_permission(request, passport):
+            raise Http404
+        sections = parse_sections(request.GET.get("sections"))
+        return passport, sections, passport_preview(passport, sections)
+
+    def preview_view(self, request, pk):
+        passport, sections, files = self._preview_files(request, pk)
+        if files[0].suffix == ".pdf":  # pypdfium2 не установлен
+            return FileResponse(open(files[0], "rb"), content_type="application/pdf",
+                                filename=f"preview-{passport.pk}.pdf")
+        context = {
+            **self.admin_site.each_context(request),
+            "opts": self.model._meta,
+            "original": passport,
+            "title": f"Предпросмотр: {passport}",
+            "sections": SECTIONS,
+            "selected": sections,
+            "sections_param": ",".join(sections),
+            "pages": range(1, len(files) + 1),
+        }
+        return TemplateResponse(request, "admin/passports/passport/preview.html", context)
+
+    def preview_page_view(self, request, pk, page):
+        _, _, files = self._preview_files(request, pk)
+        if not 1 <= page <= len(files) or files[0].suffix != ".png":
+            raise Http404
+        return FileResponse(open(files[page - 1], "rb"), content_type="image/png")
+
+    actions = ["issue_passport", "revoke_passport", "reissue_passport", "rerender_pdf"]
+
+    def _queued(self, request, text: str, job_ids):
+        """Сообщение со ссылкой на поставленные задачи: там статус и «PDF не изменился»."""
+        if not job_ids:
+            messages.success(request, text)
+            return
+        url = reverse("admin:passports_renderjob_changelist") + "?id__in=" + ",".join(map(str, job_ids))
+        messages.success(request, format_html(
+            '{} — <a href="{}">задачи рендера</a> (выполнено, пропущено без изменений, ошибки)', text, url,
+        ))
 
     @admin.action(description="Выпустить паспорт (генерировать штрих/QR и PDF)")
     def issue_passport(self, request, queryset):
-        ok = 0
-        for p in queryset:
-            if p.status != Passport.Status.DRAFT:
-                continue
-            p.barcode_value = p.barcode_value or p.horse.microchip or p.horse.registry_no
-            p.generate_codes()
-            render_passport_pdf(p)
-            p.status = Passport.Status.ISSUED
-            p.issue_date = p.issue_date or now().date()
-            p.save()
-            ok += 1
-        messages.success(request, f"Выпущено: {ok}")
+        job_ids = [
+            RenderJob.enqueue(p, RenderJob.Kind.ISSUE).pk
+            for p in queryset.filter(status=Passport.Status.DRAFT)
+        ]
+        self._queued(request, f"Поставлено в очередь на выпуск: {len(job_ids)}", job_ids)
 
     @admin.action(description="Аннулировать паспорт")
     def revoke_passport(self, request, queryset):
-        cnt = queryset.update(status=Passport.Status.REVOKED)
+        ids = list(queryset.values_list("pk", flat=True))
+        cnt = Passport.objects.filter(pk__in=ids).update(status=Passport.Status.REVOKED)
+        rollup.schedule(ids)
+        cache.bump_on_commit()
         messages.warning(request, f"Аннулировано: {cnt}")
 
     @admin.action(description="Переоформить (версию +1, статус Переоформлен)")
     def reissue_passport(self, request, queryset):
-        ok = 0
+        job_ids = []
         for p in queryset:
             p.version += 1
             p.status = Passport.Status.REISSUED
-            p.generate_codes()
-            render_passport_pdf(p)
             p.issue_date = now().date()
-            p.save()
-            ok += 1
-        messages.success(request, f"Переоформлено: {ok}")
+            p.save(update_fields=["version", "status", "issue_date"])
+            job_ids.append(RenderJob.enqueue(p, RenderJob.Kind.REISSUE).pk)
+        self._queued(request, f"Переоформлено: {len(job_ids)} (коды и PDF — в очереди)", job_ids)
+
+    @admin.action(description="Перегенерировать PDF принудительно (без проверки отпечатка)")
+    def rerender_pdf(self, request, queryset):
+        job_ids = [RenderJob.enqueue(p, RenderJob.Kind.RENDER, force=True).pk for p in queryset]
+        self._queued(request, f"Поставлено в очередь на перегенерацию PDF: {len(job_ids)}", job_ids)
+
+
+@admin.register(RenderJob)
+class RenderJobAdmin(admin.ModelAdmin):
+    list_display = (
+        "id", "passport", "kind", "status", "pdf_skipped", "attempts", "run_after", "locked_by",
+        "finished_at", "created_at",
+    )
+    list_filter = ("status", "kind", "pdf_skipped")
+    search_fields = ("passport__number",)
+    raw_id_fields = ("passport",)
+    readonly_fields = ("attempts", "locked_by", "locked_at", "finished_at", "last_error", "pdf_skipped", "created_at")
+    actions = ["retry_jobs"]
+
+    @admin.action(description="Повторить (вернуть в очередь)")
+    def retry_jobs(self, request, queryset):
+        cnt = queryset.exclude(status=RenderJob.Status.RUNNING).update(
+            status=RenderJob.Status.PENDING, attempts=0, run_after=now(), finished_at=None, pdf_skipped=None,
+        )
+        messages.success(request, f"Возвращено в очередь: {cnt}")
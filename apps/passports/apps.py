@@ -7,4 +7,8 @@ class PassportsConfig(AppConfig):
     verbose_name = "Паспорта"
 
     def ready(self):
-        from . import signals  # noqa
+        from django.db.models.signals import post_migrate
+
+        from . import signals
+
+        post_migrate.connect(signals.fill_search_index, sender=self, dispatch_uid="passports_fill_search_index")
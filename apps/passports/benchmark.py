@@ -0,0 +1,214 @@
+# apps/passports/benchmark.py
+"""
+Бенчмарк рендера PDF-паспорта на синтетических лошадях.
+
+Профили различаются объёмом данных (вакцинации, анализы, владельцы, узлы
+родословной, фото). Для каждого профиля render_passport_pdf замеряется по
+этапам (RenderTrace) и сводится в JSON-отчёт, который можно сравнить
+с отчётом другого коммита: compare_reports() возвращает регрессии.
+
+Данные создаются в текущей БД — вызывающий отвечает за то, чтобы она была
+одноразовой (manage.py benchmark_passports поднимает тестовую БД, тесты
+работают в своей).
+"""
+import io
+import platform
+import random
+import statistics
+import subprocess
+from dataclasses import dataclass
+from datetime import date, timedelta
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.utils import timezone
+from PIL import Image
+
+from apps.common.models import Breed, Color, Country, LabTestType, Region, Vaccine
+from apps.horses.models import Horse, Ownership, RealOffspring, RealOffspringNode
+from apps.parties.models import Owner, Person, Veterinarian
+from apps.vet.models import LabTest, Vaccination
+
+from .engine import get_engine
+from .models import Passport
+from .services import render_passport_pdf
+
+# images (фото под печать) идёт внутри template и в total не суммируется повторно
+STAGES = ("context", "fingerprint", "template", "images", "layout", "write", "save")
+PHOTO_FIELDS = (
+    "photo_right_side", "photo_left_side", "photo_upper_eye_level", "photo_muzzle",
+    "photo_neck_lower_view", "photo_front_view_forelegs", "photo_hind_view_hind_legs",
+)
+
+
+@dataclass(frozen=True)
+class Profile:
+    name: str
+    vaccinations: int
+    lab_tests: int
+    ownerships: int
+    pedigree_nodes: int
+    photos: int
+
+
+PROFILES = (
+    Profile("minimal", vaccinations=0, lab_tests=0, ownerships=1, pedigree_nodes=0, photos=0),
+    Profile("typical", vaccinations=8, lab_tests=3, ownerships=2, pedigree_nodes=6, photos=3),
+    Profile("heavy", vaccinations=48, lab_tests=7, ownerships=6, pedigree_nodes=14, photos=7),
+)
+
+
+def _photo(rng: random.Random, size=(3000, 2000)) -> bytes:
+    """JPEG «с камеры»: шум, чтобы размер и декодирование были реалистичными."""
+    img = Image.frombytes("RGB", size, rng.randbytes(size[0] * size[1] * 3))
+    buf = io.BytesIO()
+    img.save(buf, "JPEG", quality=90)
+    return buf.getvalue()
+
+
+class SyntheticRegistry:
+    """Справочники и лошади для бенчмарка (всё с префиксом BENCH)."""
+
+    def __init__(self, seed: int = 0):
+        self.rng = random.Random(seed)
+        self.region, _ = Region.objects.get_or_create(code="BEN", defaults={"name": "BENCH регион"})
+        self.country, _ = Country.objects.get_or_create(name="BENCH страна")
+        self.breed, _ = Breed.objects.get_or_create(name="BENCH порода")
+        self.color, _ = Color.objects.get_or_create(name="BENCH масть")
+        day = date(2020, 1, 1)
+        self.vaccines = [
+            Vaccine.objects.get_or_create(
+                name=f"BENCH вакцина {i}",
+                defaults=dict(vaccine_for_grip=bool(i), batch_number=f"B{i}",
+                              manufacture_date=day, manufacturer_address="BENCH"),
+            )[0]
+            for i in range(2)
+        ]
+        self.test_type, _ = LabTestType.objects.get_or_create(name="BENCH анализ")
+        self.vet, _ = Veterinarian.objects.get_or_create(
+            last_name="BENCH", first_name="Вет", license_no="BENCH-1", defaults={"region": self.region}
+        )
+        self._photos = [_photo(self.rng) for _ in range(3)]
+        self._n = 0
+
+    def _owner(self) -> Owner:
+        self._n += 1
+        person = Person.objects.create(last_name=f"BENCH{self._n}", first_name="Владелец",
+                                       region=self.region, country=self.country)
+        return Owner.objects.create(person=person)
+
+    def passport(self, profile: Profile) -> Passport:
+        rng, start = self.rng, date(2015, 1, 1)
+        owner = self._owner()
+        horse = Horse(
+            name=f"BENCH {profile.name} {self._n}", sex="M", birth_date=start,
+            breed=self.breed, color=self.color, country_of_birth=self.country,
+            place_of_birth=self.region, microchip=f"{rng.randrange(10**15):015d}", owner_current=owner,
+        )
+        for i in range(profile.photos):
+            getattr(horse, PHOTO_FIELDS[i]).save(f"bench_{i}.jpg", ContentFile(self._photos[i % 3]), save=False)
+        horse.save()
+
+        Vaccination.objects.bulk_create(
+            Vaccination(horse=horse, date=start + timedelta(days=30 * i), vaccine=self.vaccines[i % 2],
+                        vaccine_for_grip=bool(i % 2), veterinarian=self.vet,
+                        registration_number=f"R{i}", place="BENCH")
+            for i in range(profile.vaccinations)
+        )
+        LabTest.objects.bulk_create(
+            LabTest(horse=horse, date=start + timedelta(days=45 * i), test_type=self.test_type,
+                    result="отриц.", veterinarian=self.vet)
+            for i in range(profile.lab_tests)
+        )
+        owners = [owner] + [self._owner() for _ in range(profile.ownerships - 1)]
+        Ownership.objects.bulk_create(
+            Ownership(horse=horse, owner=o, start_date=start + timedelta(days=365 * i))
+            for i, o in enumerate(owners)
+        )
+        if profile.pedigree_nodes:
+            pedigree = RealOffspring.objects.create(horse=horse)
+            RealOffspringNode.objects.bulk_create(
+                RealOffspringNode(pedigree=pedigree, relation=rel, name=f"Предок {i}")
+                for i, rel in enumerate(RealOffspringNode.Relation.values[:profile.pedigree_nodes])
+            )
+        return Passport.objects.create(horse=horse)
+
+
+def _git_commit() -> str:
+    try:
+        out = subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=settings.BASE_DIR,
+                             capture_output=True, text=True, timeout=5)
+    except OSError:
+        return ""
+    return out.stdout.strip()
+
+
+def _summary(values) -> dict:
+    return {"median": statistics.median(values), "min": min(values), "max": max(values)}
+
+
+def run_suite(profiles=PROFILES, horses: int = 3, repeat: int = 3, seed: int = 0,
+              section_cache: bool = False) -> dict:
+    """
+    Для каждого профиля: horses лошадей × repeat рендеров (force=True).
+    Первый рендер процесса (сборка движка и неизменных страниц) — прогрев,
+    в замеры не входит. Без section_cache кэш разделов сбрасывается перед
+    каждым рендером — меряем полную вёрстку, а не попадания в кэш.
+    """
+    registry = SyntheticRegistry(seed)
+    engine = get_engine()
+    warmup = registry.passport(profiles[0])
+    render_passport_pdf(warmup, force=True)
+
+    report = {
+        "meta": {
+            "commit": _git_commit(),
+            "created_at": timezone.now().isoformat(),
+            "python": platform.python_version(),
+            "horses": horses,
+            "repeat": repeat,
+            "splice_static": getattr(settings, "PASSPORT_PDF_SPLICE_STATIC", True),
+            "section_cache": section_cache,
+            "print_dpi": getattr(settings, "PDF_PRINT_DPI", 300),
+        },
+        "profiles": {},
+    }
+    for profile in profiles:
+        samples = {stage: [] for stage in STAGES + ("total",)}
+        sizes = []
+        for _ in range(horses):
+            passport = registry.passport(profile)
+            for _ in range(repeat):
+                if not section_cache:
+                    engine.clear_section_cache()
+                stages = {}
+                render_passport_pdf(passport, force=True, stages=stages)
+                for stage in STAGES + ("total",):
+                    samples[stage].append(stages.get(stage, 0.0))
+            sizes.append(passport.pdf_file.size)
+        report["profiles"][profile.name] = {
+            "data": profile.__dict__,
+            "pdf_bytes": max(sizes),
+            "stages": {stage: _summary(values) for stage, values in samples.items()},
+        }
+    return report
+
+
+def compare_reports(baseline: dict, current: dict, threshold: float = 0.2, min_delta: float = 0.005) -> list[str]:
+    """
+    Регрессии: медиана этапа выросла больше чем на threshold (доля) и больше
+    чем на min_delta секунд (шум таймера на быстрых этапах не считаем).
+    """
+    problems = []
+    for name, cur in current["profiles"].items():
+        base = baseline.get("profiles", {}).get(name)
+        if not base:
+            continue
+        for stage, stats in cur["stages"].items():
+            was = base["stages"].get(stage, {}).get("median")
+            now_ = stats["median"]
+            if was is None:
+                continue
+            if now_ - was > min_delta and now_ > was * (1 + threshold):
+                problems.append(f"{name}.{stage}: {was:.4f} с → {now_:.4f} с")
+    return problems
@@ -0,0 +1,169 @@
+# apps/passports/engine.py
+"""
+Движок WeasyPrint для паспортов: общий стиль (passports/pdf/passport.css) и
+FontConfiguration с DejaVuSans компилируются один раз на процесс и
+переиспользуются всеми рендерами этого процесса (веб-воркер, issue_passports).
+
+Режим сборки (PASSPORT_PDF_SPLICE_STATIC, по умолчанию включён): документ
+собирается из уже свёрстанных страниц, верстается только то, что изменилось.
+  * Неизменные страницы (2static_info, last_static_text, пустые хвостовые
+    страницы таблиц) верстаются один раз на версию шаблонов
+    (id="static-slot-…").
+  * Страницы разделов (fingerprint.SECTIONS: обложка, фото, вакцинации, …)
+    кэшируются по хэшу входных данных раздела: если хэш уже встречался,
+    раздел остаётся заглушкой (id="section-slot-…") и подставляется из кэша,
+    иначе верстается и запоминается (id="section-…"). Кэш — в памяти
+    процесса (section_cache.py): попадает только повторный рендер там же.
+Заглушки верстаются пустыми страницами с тем же номером, так что порядок
+страниц и колонтитулы не меняются.
+"""
+from functools import lru_cache
+
+from django.conf import settings
+from django.template.loader import get_template
+from weasyprint import CSS, HTML
+from weasyprint.text.fonts import FontConfiguration
+
+from .fingerprint import section_hashes, static_version, template_version
+from .section_cache import SectionCache
+
+STYLESHEET_TEMPLATE = "passports/pdf/passport.css"
+PASSPORT_TEMPLATE = "passports/pdf/base.html"
+STATIC_SLOT_PREFIX = "static-slot-"
+SECTION_SLOT_PREFIX = "section-slot-"
+SECTION_PREFIX = "section-"
+
+
+def _page_role(page) -> tuple[str, str]:
+    """('static' | 'cached' | 'section' | '', раздел) по id-якорям страницы."""
+    for name in page.anchors:
+        if name.startswith(STATIC_SLOT_PREFIX):
+            return "static", ""
+        if name.startswith(SECTION_SLOT_PREFIX):
+            return "cached", name[len(SECTION_SLOT_PREFIX):].split("-")[0]
+        if name.startswith(SECTION_PREFIX):
+            return "section", name[len(SECTION_PREFIX):].split("-")[0]
+    return "", ""
+
+
+def _blank_context(ctx: dict) -> dict:
+    """Контекст, в котором все страницы таблиц пустые (для неизменных страниц)."""
+    blank = dict(ctx)
+    for key, pages in ctx.items():
+        if key.endswith("_pages"):
+            blank[key] = [[None] * len(rows) for rows in pages]
+    return blank
+
+
+def _splice_enabled() -> bool:
+    return getattr(settings, "PASSPORT_PDF_SPLICE_STATIC", True)
+
+
+class PassportPdfEngine:
+    def __init__(self):
+        self.base_url = str(settings.BASE_DIR)
+        self.font_config = FontConfiguration()
+        css = get_template(STYLESHEET_TEMPLATE).render({})
+        # @font-face подгружаются в font_config здесь, при разборе листа
+        self.stylesheets = [CSS(string=css, base_url=self.base_url, font_config=self.font_config)]
+        self._static_docs = {}
+        self._sections = SectionCache()
+
+    def render(self, html: str):
+        """HTML -> weasyprint.Document (вёрстка страниц)."""
+        return HTML(string=html, base_url=self.base_url).render(
+            stylesheets=self.stylesheets, font_config=self.font_config
+        )
+
+    def write_pdf(self, html: str, target=None):
+        return self.render(html).write_pdf(target)
+
+    def static_document(self, ctx: dict):
+        """
+        Свёрстанный паспорт с пустыми таблицами — источник неизменных страниц.
+        Кэшируется на версию шаблонов/статики; данные лошади на взятых из него
+        страницах не печатаются, поэтому подходит контекст любого паспорта.
+        """
+        key = (template_version(), static_version())
+        doc = self._static_docs.get(key)
+        if doc is None:
+            html = get_template(PASSPORT_TEMPLATE).render(_blank_context(ctx))
+            self._static_docs = {key: self.render(html)}
+            doc = self._static_docs[key]
+        return doc
+
+    # --- кэш разделов ---
+
+    def _section_key(self, section: str, digest: str):
+        return (template_version(), static_version(), section, digest)
+
+    def cached_sections(self, sections: dict | None) -> set:
+        """Разделы, свёрстанные страницы которых уже есть в кэше."""
+        if not sections:
+            return set()
+        return {name for name, digest in sections.items() if self._section_key(name, digest) in self._sections}
+
+    def clear_section_cache(self):
+        self._sections.clear()
+
+    # --- паспорт ---
+
+    def passport_html(self, ctx: dict, sections: dict | None = None) -> str:
+        """
+        HTML паспорта; в режиме сборки — с заглушками вместо неизменных
+        страниц и уже свёрстанных разделов. sections — section_hashes(ctx).
+        """
+        if _splice_enabled():
+            ctx = {**ctx, "splice_static": True, "cached_sections": self.cached_sections(sections)}
+        return get_template(PASSPORT_TEMPLATE).render(ctx)
+
+    def layout_passport(self, ctx: dict, html: str, sections: dict | None = None):
+        """Вёрстка HTML из passport_html() с подстановкой готовых страниц."""
+        doc = self.render(html)
+        if not _splice_enabled():
+            return doc
+
+        static = self.static_document(ctx)
+        if len(doc.pages) != len(static.pages):
+            # какая-то страница лошади переполнилась — номера страниц
+            # разъехались, подставлять нельзя: обычный рендер целиком
+            return self._full_layout(ctx)
+
+        sections = sections or {}
+        pages, fresh = [], {}
+        for i, page in enumerate(doc.pages):
+            role, section = _page_role(page)
+            if role == "static":
+                page = static.pages[i]
+            elif role == "cached":
+                entry = self._sections.get(self._section_key(section, sections.get(section, "")))
+                page = entry.get(i) if entry else None
+                if page is None:  # вытеснен из кэша между html и вёрсткой
+                    return self._full_layout(ctx)
+            elif role == "section" and section in sections:
+                fresh.setdefault(section, {})[i] = page
+            pages.append(page)
+
+        for section, by_index in fresh.items():
+            self._sections.put(self._section_key(section, sections[section]), by_index)
+        return doc.copy(pages)
+
+    def preview_document(self, ctx: dict, sections):
+        """Вёрстка только страниц разделов sections (предпросмотр, без сборки)."""
+        html = get_template(PASSPORT_TEMPLATE).render({**ctx, "preview_sections": tuple(sections)})
+        return self.render(html)
+
+    def _full_layout(self, ctx: dict):
+        return self.render(get_template(PASSPORT_TEMPLATE).render(ctx))
+
+    def write_passport(self, ctx: dict, target=None):
+        """Рендер паспорта по контексту PassportRenderContext.as_dict()."""
+        sections = section_hashes(ctx) if _splice_enabled() else None
+        html = self.passport_html(ctx, sections)
+        return self.layout_passport(ctx, html, sections).write_pdf(target)
+
+
+@lru_cache(maxsize=1)
+def get_engine() -> PassportPdfEngine:
+    """Движок текущего процесса (создаётся при первом рендере)."""
+    return PassportPdfEngine()
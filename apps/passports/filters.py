@@ -1,7 +1,9 @@
 import django_filters as df
 from django.db.models import Q
 
+from . import search
 from .models import Passport
+from apps.horses import microchips
 from apps.common.models import Breed, Region
 from apps.parties.models import Organization
 
@@ -12,11 +14,15 @@
 )
 
 class PassportFilter(df.FilterSet):
+    q = df.CharFilter(label='Поиск', method='filter_q',
+                      help_text='Номер паспорта, кличка, рег. номер, микрочип или владелец')
     status = df.ChoiceFilter(choices=Passport.Status.choices, label='Статус')
     year = df.NumberFilter(field_name='issue_date', lookup_expr='year', label='Год')
     breed = df.ModelChoiceFilter(field_name='horse__breed', queryset=Breed.objects.all(), to_field_name='id', label='Порода')
     region = df.ModelChoiceFilter(field_name='horse__place_of_birth', queryset=Region.objects.all(), to_field_name='id', label='Регион')
-    microchip = df.CharFilter(field_name='horse__microchip', lookup_expr='icontains', label='Микрочип')
+    microchip = df.CharFilter(label='Микрочип', method='filter_microchip',
+                              help_text='Полный номер (15 цифр) или его начало')
+    microchip_part = df.CharFilter(label='Часть микрочипа', method='filter_microchip_part')
     owner_kind = df.ChoiceFilter(
         label="Тип владельца",
         choices=OWNER_KIND_CHOICES,
@@ -48,6 +54,15 @@ def filter_owner_kind(self, qs, name, value):
             )
         return qs
 
+    def filter_q(self, qs, name, value):
+        return qs.filter(pk__in=search.matching(value).values('passport_id'))
+
+    def filter_microchip(self, qs, name, value):
+        return qs.filter(microchips.lookup(value, 'horse__microchip'))
+
+    def filter_microchip_part(self, qs, name, value):
+        return qs.filter(microchips.find_substring(value, 'horse'))
+
     def filter_passport_kind(self, qs, name, value):
         if value == "import":
             return qs.filter(old_passport_number__isnull=False).exclude(old_passport_number__exact="")
@@ -57,4 +72,6 @@ def filter_passport_kind(self, qs, name, value):
 
     class Meta:
         model = Passport
-        fields = ["status", "year", "breed", "region", "microchip", "owner_kind", "passport_kind"]
+        fields = [
+            "q", "status", "year", "breed", "region", "microchip", "microchip_part", "owner_kind", "passport_kind",
+        ]
@@ -0,0 +1,170 @@
+# apps/passports/fingerprint.py
+"""
+Отпечаток (sha256) всех входных данных PDF-паспорта.
+
+Если отпечаток совпадает с сохранённым в Passport.pdf_fingerprint и файл на
+месте — повторный рендер WeasyPrint не нужен.
+"""
+import hashlib
+import json
+import re
+from datetime import date, datetime
+from decimal import Decimal
+from functools import lru_cache
+from pathlib import Path
+
+from django.conf import settings
+from django.contrib.staticfiles import finders
+from django.db import models
+from django.db.models.fields.files import FieldFile
+
+from apps.common.print_images import print_dpi
+from apps.common.storage import stored_digest
+
+PDF_TEMPLATE_DIR = Path(settings.BASE_DIR) / "templates" / "passports" / "pdf"
+
+# Поля паспорта, которые сами являются результатом рендера; PNG кодов в PDF
+# не попадают — там SVG из number/barcode_value (ключи qr_svg, barcode_svg)
+EXCLUDED_FIELDS = {"pdf_file", "pdf_fingerprint", "barcode_image", "qr_image"}
+
+_STATIC_RE = re.compile(r"""static_file\s+['"]([^'"]+)['"]""")
+
+
+def _digest_stream(f) -> str:
+    h = hashlib.sha256()
+    for chunk in iter(lambda: f.read(64 * 1024), b""):
+        h.update(chunk)
+    return h.hexdigest()
+
+
+def file_digest(field) -> str:
+    """sha256 содержимого FileField/ImageField (пусто — если файла нет); см. storage.stored_digest."""
+    if not field:
+        return ""
+    return stored_digest(field) or f"missing:{field.name}"
+
+
+@lru_cache(maxsize=1)
+def template_version() -> str:
+    """Хэш всех шаблонов passports/pdf/** — меняется при любой правке вёрстки."""
+    h = hashlib.sha256()
+    for path in sorted(PDF_TEMPLATE_DIR.rglob("*")):
+        if path.is_file():
+            h.update(str(path.relative_to(PDF_TEMPLATE_DIR)).encode())
+            h.update(path.read_bytes())
+    return h.hexdigest()
+
+
+@lru_cache(maxsize=1)
+def static_version() -> str:
+    """Хэш статических файлов ({% static_file %}), на которые ссылаются PDF-шаблоны."""
+    names = set()
+    for path in PDF_TEMPLATE_DIR.rglob("*"):
+        if path.is_file():
+            names.update(_STATIC_RE.findall(path.read_text(encoding="utf-8")))
+
+    h = hashlib.sha256()
+    for name in sorted(names):
+        h.update(name.encode())
+        found = finders.find(name)
+        if found:
+            with open(found, "rb") as f:
+                h.update(_digest_stream(f).encode())
+    return h.hexdigest()
+
+
+def _canonical(value):
+    """Приводит значения контекста к JSON-совместимому и стабильному виду."""
+    if value is None or isinstance(value, (bool, int, float, str)):
+        return value
+    if isinstance(value, (date, datetime)):
+        return value.isoformat()
+    if isinstance(value, Decimal):
+        return str(value)
+    if isinstance(value, FieldFile):
+        # имя файла меняется при каждой перегенерации — важен только контент
+        return {"sha256": file_digest(value)}
+    if isinstance(value, dict):
+        return {str(k): _canonical(v) for k, v in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [_canonical(v) for v in value]
+    if isinstance(value, models.Model):
+        return {
+            f.name: _canonical(
+                getattr(value, f.name) if isinstance(f, models.FileField) else f.value_from_object(value)
+            )
+            for f in value._meta.concrete_fields
+            if f.name not in EXCLUDED_FIELDS
+        }
+    return str(value)
+
+
+# Разделы паспорта и ключи контекста, от которых зависят их страницы.
+# cover (обложка и стр. 3) зависит от паспорта/лошади целиком и от всех
+# ключей, не закреплённых за другими разделами.
+SECTION_KEYS = {
+    "diagram": ("diagram_label",),
+    "marks": ("marks", "owner_full_address", "stable_address"),
+    "bonitation": ("bon",),
+    "vaccinations": ("vacc_other_pages", "vacc_flu_pages"),
+    "lab_tests": ("lab_pages",),
+    "diagnostics": ("diag_pages",),
+    "achievements": ("ach_pages", "exh_pages"),
+    "offspring": ("offspring_rows",),
+    "ownership": ("ownership_rows",),
+    "parentage": ("parentage", "pedigree"),
+    "chip": ("chip_rows", "passport_issue_date", "barcode_svg"),
+}
+SECTIONS = ("cover", "photos", *SECTION_KEYS)
+
+
+def _hash(payload) -> str:
+    raw = json.dumps(payload, sort_keys=True, ensure_ascii=False, separators=(",", ":"))
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+def section_hashes(ctx: dict) -> dict:
+    """
+    sha256 входных данных каждого раздела (SECTIONS) по контексту
+    PassportRenderContext.as_dict(). Файлы (фото, схема) хэшируются
+    по содержимому, по одному разу.
+    """
+    horse = ctx["horse"]
+    diagram = getattr(horse, "diagram", None)
+    passport = _canonical(ctx["passport"])
+    horse_data = _canonical(horse)
+    photos = {k: horse_data.pop(k) for k in list(horse_data) if k.startswith("photo_")}
+    # справочники, которые шаблон печатает через __str__
+    refs = {
+        "breed": str(horse.breed or ""),
+        "color": str(horse.color or ""),
+        "country_of_birth": str(horse.country_of_birth or ""),
+    }
+    claimed = {k for keys in SECTION_KEYS.values() for k in keys}
+    inputs = {
+        "cover": {
+            "passport": passport,
+            "horse": horse_data,
+            "refs": refs,
+            "ctx": _canonical({k: v for k, v in ctx.items() if k not in claimed | {"passport", "horse"}}),
+        },
+        "photos": {"photos": photos, "print_dpi": print_dpi()},
+    }
+    for section, keys in SECTION_KEYS.items():
+        inputs[section] = _canonical({k: ctx.get(k) for k in keys})
+    inputs["diagram"]["image"] = file_digest(getattr(diagram, "updated_image", None))
+    inputs["parentage"]["country_of_birth"] = refs["country_of_birth"]
+    return {section: _hash(inputs[section]) for section in SECTIONS}
+
+
+def passport_fingerprint(ctx: dict, sections: dict | None = None) -> str:
+    """
+    Отпечаток по контексту PassportRenderContext.as_dict(): хэши всех
+    разделов (поля паспорта и лошади, таблицы, фото/коды), версия шаблонов и
+    статики. sections — уже посчитанный section_hashes(ctx).
+    """
+    return _hash({
+        "template": template_version(),
+        "static": static_version(),
+        "sections": sections if sections is not None else section_hashes(ctx),
+    })
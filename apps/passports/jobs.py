@@ -0,0 +1,65 @@
+# apps/passports/jobs.py
+"""
+Выполнение RenderJob. Каждый обработчик идемпотентен: повтор после падения
+воркера или ошибки не портит паспорт (выпуск проверяет статус, коды и PDF
+просто перегенерируются). Обработчик возвращает результат
+render_passport_pdf (False — отпечаток не изменился, рендер пропущен) или
+None, если PDF он не трогал.
+"""
+from django.utils.timezone import now
+
+from .models import Passport, RenderJob
+from .services import render_passport_pdf
+
+CODE_FIELDS = ["barcode_value", "barcode_image", "qr_image"]
+PDF_FIELDS = ["pdf_file", "pdf_fingerprint"]
+
+
+def _issue(p: Passport, job: RenderJob):
+    if p.status != Passport.Status.DRAFT:
+        return None
+    p.barcode_value = p.barcode_value or p.horse.microchip or p.horse.registry_no
+    # статус до кодов: подпись на QR импортированного паспорта зависит от него,
+    # и save() не перестроит коды второй раз
+    p.status = Passport.Status.ISSUED
+    p.issue_date = p.issue_date or now().date()
+    p.generate_codes()
+    rendered = render_passport_pdf(p, force=job.force)
+    p.save()
+    return rendered
+
+
+def _reissue(p: Passport, job: RenderJob):
+    p.generate_codes()
+    rendered = render_passport_pdf(p, force=job.force)
+    p.save(update_fields=CODE_FIELDS + PDF_FIELDS)
+    return rendered
+
+
+def _render(p: Passport, job: RenderJob):
+    rendered = render_passport_pdf(p, force=job.force)
+    p.save(update_fields=PDF_FIELDS)
+    return rendered
+
+
+def _codes(p: Passport, job: RenderJob):
+    p.generate_codes()
+    p.save(update_fields=CODE_FIELDS)
+    return None
+
+
+HANDLERS = {
+    RenderJob.Kind.ISSUE: _issue,
+    RenderJob.Kind.REISSUE: _reissue,
+    RenderJob.Kind.RENDER: _render,
+    RenderJob.Kind.CODES: _codes,
+}
+
+
+def run_job(job: RenderJob) -> bool | None:
+    """
+    Выполняет задачу (исключения — наружу, статус ставит воркер).
+    Возвращает True/False — перерисован ли PDF, None — задача без PDF.
+    """
+    p = Passport.objects.select_related("horse").get(pk=job.passport_id)
+    return HANDLERS[job.kind](p, job)
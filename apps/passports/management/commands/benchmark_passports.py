@@ -0,0 +1,76 @@
+# apps/passports/management/commands/benchmark_passports.py
+import json
+import tempfile
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test.utils import override_settings
+
+from apps.passports.benchmark import PROFILES, STAGES, compare_reports, run_suite
+
+
+class Command(BaseCommand):
+    help = (
+        "Бенчмарк рендера PDF-паспорта по этапам на синтетических лошадях во временной БД. "
+        "Пишет JSON-отчёт; с --baseline падает, если этап стал медленнее порога."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--profiles", default=",".join(p.name for p in PROFILES),
+                            help="Профили через запятую (minimal,typical,heavy)")
+        parser.add_argument("--horses", type=int, default=3, help="Лошадей на профиль")
+        parser.add_argument("--repeat", type=int, default=3, help="Рендеров на лошадь")
+        parser.add_argument("--seed", type=int, default=0)
+        parser.add_argument("--section-cache", action="store_true",
+                            help="Не сбрасывать кэш разделов между рендерами (замер повторного рендера)")
+        parser.add_argument("--output", help="Куда записать JSON-отчёт")
+        parser.add_argument("--baseline", help="JSON-отчёт для сравнения (например, с main)")
+        parser.add_argument("--threshold", type=float, default=0.2,
+                            help="Допустимый рост медианы этапа (0.2 = +20%%)")
+        parser.add_argument("--min-delta", type=float, default=0.005,
+                            help="Рост меньше N секунд регрессией не считается")
+
+    def handle(self, *args, **opts):
+        by_name = {p.name: p for p in PROFILES}
+        names = [n.strip() for n in opts["profiles"].split(",") if n.strip()]
+        unknown = [n for n in names if n not in by_name]
+        if unknown or not names:
+            raise CommandError(f"Неизвестные профили: {', '.join(unknown) or '—'}")
+        if opts["horses"] < 1 or opts["repeat"] < 1:
+            raise CommandError("--horses и --repeat должны быть положительными")
+
+        baseline = None
+        if opts["baseline"]:
+            with open(opts["baseline"], encoding="utf-8") as f:
+                baseline = json.load(f)
+
+        # одноразовые БД и MEDIA_ROOT: рабочие данные не трогаем
+        old_name = connection.settings_dict["NAME"]
+        connection.creation.create_test_db(verbosity=0, autoclobber=True, serialize=False)
+        try:
+            with tempfile.TemporaryDirectory(prefix="passport-bench-") as media, override_settings(MEDIA_ROOT=media):
+                report = run_suite([by_name[n] for n in names], opts["horses"], opts["repeat"], opts["seed"],
+                                   section_cache=opts["section_cache"])
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+
+        self._print(report)
+        if opts["output"]:
+            with open(opts["output"], "w", encoding="utf-8") as f:
+                json.dump(report, f, ensure_ascii=False, indent=2)
+            self.stdout.write(f"Отчёт: {opts['output']}")
+
+        if baseline is not None:
+            problems = compare_reports(baseline, report, opts["threshold"], opts["min_delta"])
+            if problems:
+                for line in problems:
+                    self.stderr.write(self.style.ERROR(f"  регрессия {line}"))
+                raise CommandError(f"Регрессий: {len(problems)} (порог +{opts['threshold'] * 100:.0f}%)")
+            self.stdout.write(self.style.SUCCESS("Регрессий относительно baseline нет"))
+
+    def _print(self, report):
+        cols = STAGES + ("total",)
+        self.stdout.write(f"{'профиль':<10}" + "".join(f"{c:>12}" for c in cols) + f"{'PDF, КБ':>10}")
+        for name, data in report["profiles"].items():
+            row = "".join(f"{data['stages'][c]['median'] * 1000:>10.1f}мс" for c in cols)
+            self.stdout.write(f"{name:<10}{row}{data['pdf_bytes'] // 1024:>10}")
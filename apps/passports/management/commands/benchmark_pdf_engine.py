@@ -0,0 +1,57 @@
+# apps/passports/management/commands/benchmark_pdf_engine.py
+import statistics
+import time
+from io import BytesIO
+
+from django.core.management.base import BaseCommand, CommandError
+from django.template.loader import get_template
+
+from apps.passports.engine import PassportPdfEngine, get_engine
+from apps.passports.models import Passport
+from apps.passports.services import PassportRenderContext
+
+
+class Command(BaseCommand):
+    help = (
+        "Бенчмарк движка PDF: «холодный» рендер (стили и шрифты компилируются заново) "
+        "против «тёплого» (движок процесса переиспользуется)."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--passport", type=int, help="ID паспорта (по умолчанию — первый)")
+        parser.add_argument("--runs", type=int, default=5, help="Количество рендеров в каждом режиме")
+
+    def handle(self, *args, **opts):
+        if opts["runs"] < 1:
+            raise CommandError("--runs должен быть положительным")
+
+        qs = Passport.objects.order_by("pk")
+        passport = qs.filter(pk=opts["passport"]).first() if opts["passport"] else qs.first()
+        if passport is None:
+            raise CommandError("Паспорт не найден")
+
+        ctx = PassportRenderContext.load([passport])[0].as_dict()
+        html = get_template("passports/pdf/base.html").render(ctx)
+        self.stdout.write(f"Паспорт {passport.number}, HTML {len(html) // 1024} КБ, прогонов: {opts['runs']}")
+
+        cold = self._measure(lambda: PassportPdfEngine().write_pdf(html, BytesIO()), opts["runs"])
+        get_engine().write_pdf(html, BytesIO())  # прогрев
+        warm = self._measure(lambda: get_engine().write_pdf(html, BytesIO()), opts["runs"])
+
+        self._report("холодный", cold)
+        self._report("тёплый", warm)
+        self.stdout.write(self.style.SUCCESS(
+            f"Ускорение: x{statistics.mean(cold) / statistics.mean(warm):.2f} "
+            f"(экономия {statistics.mean(cold) - statistics.mean(warm):.3f} с на паспорт)"
+        ))
+
+    def _measure(self, fn, runs):
+        timings = []
+        for _ in range(runs):
+            started = time.perf_counter()
+            fn()
+            timings.append(time.perf_counter() - started)
+        return timings
+
+    def _report(self, label, timings):
+        self.stdout.write(f"  {label:>9}: среднее {statistics.mean(timings):.3f} с, минимум {min(timings):.3f} с")
@@ -0,0 +1,191 @@
+# apps/passports/management/commands/benchmark_qr_codes.py
+import io
+import statistics
+import time
+
+import qrcode
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from PIL import Image as PILImage, ImageChops, ImageDraw, ImageFont
+
+from apps.passports.models import Passport
+from apps.passports.qr import caption_font
+
+
+def legacy_qr_png(passport) -> bytes:
+    """Прежний Passport._build_qr_png — эталон скорости и картинки для сравнения."""
+
+    # ---- 1) Генерим QR ----
+    box_size = int(getattr(settings, "QR_BOX_SIZE", 10))  # размер модуля
+    border = int(getattr(settings, "QR_BORDER", 2))  # базовая quiet-zone (модули)
+
+    qr = qrcode.QRCode(version=None, box_size=box_size, border=border)
+    qr.add_data(passport.public_url)
+    qr.make(fit=True)
+    qr_img = qr.make_image(fill_color="black", back_color="white").convert("RGB")
+
+    # --- Асимметричная quiet-zone (по сторонам можно урезать отдельно) ---
+    bl = int(getattr(settings, "QR_BORDER_LEFT", None) or border)
+    bt = int(getattr(settings, "QR_BORDER_TOP", None) or border)
+    br = int(getattr(settings, "QR_BORDER_RIGHT", None) or border)
+    bb = int(getattr(settings, "QR_BORDER_BOTTOM", None) or border)
+
+    # сколько пикселей убрать с каждой стороны
+    px_l = max(0, (border - bl) * box_size)
+    px_t = max(0, (border - bt) * box_size)
+    px_r = max(0, (border - br) * box_size)
+    px_b = max(0, (border - bb) * box_size)
+
+    if any((px_l, px_t, px_r, px_b)):
+        w, h = qr_img.size
+        qr_img = qr_img.crop((px_l, px_t, w - px_r, h - px_b))
+
+    qr_w, qr_h = qr_img.size
+
+    # Если подпись не нужна — чистый QR
+    if not (passport.is_active and passport.has_old):
+        buf = io.BytesIO()
+        qr_img.save(buf, format="PNG")
+        return buf.getvalue()
+
+    # ---- 2) Вертикальная подпись с НОВЫМ номером ----
+    text = (passport.number or "").strip()
+
+    # внутренние паддинги текста (внутри «ленты» до поворота)
+    pad_x_left = int(getattr(settings, "QR_TEXT_PAD_X_LEFT", 2))
+    pad_x_right = int(getattr(settings, "QR_TEXT_PAD_X_RIGHT", 0))
+    pad_y = int(getattr(settings, "QR_TEXT_PAD_Y", 2))
+
+    # внешний левый отступ всей ленты (воздух слева от текста)
+    outer_left_pad = int(getattr(settings, "QR_STRIP_LEFT_OUTER_PAD", 4))
+
+    # зазор между лентой и самим QR
+    gap_between = int(getattr(settings, "QR_GAP_BETWEEN", 0))
+
+    # максимально допустимая ширина ленты (после поворота), в долях ширины QR
+    strip_max_ratio = float(getattr(settings, "QR_TEXT_STRIP_MAX", 0.22))
+
+    max_strip_w = max(1, int(qr_w * strip_max_ratio))
+    max_rot_h = max(1, qr_h - 2 * pad_y)
+
+    # шрифт
+    font_path = getattr(settings, "QR_TEXT_FONT_PATH", None)
+
+    def load_font(sz: int):
+        try:
+            if font_path:
+                return ImageFont.truetype(str(font_path), size=sz)
+            return ImageFont.truetype("DejaVuSans.ttf", size=sz)
+        except Exception:
+            return ImageFont.load_default()
+
+    size = int(qr_h * 0.14)
+    font = load_font(size)
+
+    # измерение текста
+    tmp = PILImage.new("RGB", (1, 1), "white")
+    draw = ImageDraw.Draw(tmp)
+
+    def text_wh(f):
+        try:
+            bbox = draw.textbbox((0, 0), text, font=f)
+            return bbox[2] - bbox[0], bbox[3] - bbox[1]
+        except AttributeError:
+            return draw.textsize(text, font=f)
+
+    tw, th = text_wh(font)
+    # после поворота CCW: высота ~ tw + 2*pad_y; ширина ~ th + pad_x_left + pad_x_right
+    while ((tw + 2 * pad_y) > max_rot_h or (th + pad_x_left + pad_x_right) > max_strip_w) and size > 9:
+        size -= 1
+        font = load_font(size)
+        tw, th = text_wh(font)
+
+    # рисуем горизонтально -> поворачиваем
+    text_img = PILImage.new("RGBA", (tw + pad_x_left + pad_x_right, th + 2 * pad_y), (255, 255, 255, 0))
+    tdraw = ImageDraw.Draw(text_img)
+    tdraw.text((pad_x_left, pad_y), text, fill=(0, 0, 0, 255), font=font)
+
+    rotate_deg = int(getattr(settings, "QR_TEXT_ROTATE", 90))  # 90 снизу-вверх; 270 сверху-вниз
+    text_rot = text_img.rotate(rotate_deg, expand=True, resample=PILImage.BICUBIC)
+
+    # авто-обрезка прозрачных краёв
+    bbox = text_rot.getbbox()
+    if bbox:
+        text_rot = text_rot.crop(bbox)
+
+    strip_w, strip_h = text_rot.width, text_rot.height
+
+    # ---- 3) Сборка финального изображения ----
+    canvas_w = outer_left_pad + strip_w + gap_between + qr_w
+    canvas_h = qr_h
+    canvas = PILImage.new("RGB", (canvas_w, canvas_h), "white")
+
+    y_text = max(0, (canvas_h - strip_h) // 2)
+    canvas.paste(text_rot.convert("RGB"), (outer_left_pad, y_text))
+    canvas.paste(qr_img, (outer_left_pad + strip_w + gap_between, 0))
+
+    buf = io.BytesIO()
+    canvas.save(buf, format="PNG")
+    return buf.getvalue()
+
+
+class Command(BaseCommand):
+    help = (
+        "Микро-бенчмарк QR-PNG паспорта: прежнее построение (шрифт грузится на каждом шаге "
+        "подбора, QR рисуется целиком и обрезается) против apps/passports/qr.py. "
+        "Проверяет, что картинки совпадают попиксельно."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--codes", type=int, default=200, help="Количество кодов в каждом режиме")
+
+    def handle(self, *args, **opts):
+        if opts["codes"] < 1:
+            raise CommandError("--codes должен быть положительным")
+
+        # несохранённые паспорта: половина — импортированные (с подписью номера)
+        passports = [
+            Passport(
+                number=f"JIZ-{i % 20:02d}-{i:06d}",
+                old_passport_number=f"OLD-{i}" if i % 2 else None,
+                status=Passport.Status.ISSUED,
+            )
+            for i in range(opts["codes"])
+        ]
+        with_caption = sum(p.has_old for p in passports)
+        self.stdout.write(f"Кодов: {len(passports)} (с подписью: {with_caption})")
+
+        mismatched = [p.number for p in passports[:20] if not _same_pixels(legacy_qr_png(p), p._build_qr_png())]
+        if mismatched:
+            raise CommandError(f"Картинки не совпадают: {', '.join(mismatched)}")
+
+        before = self._measure(legacy_qr_png, passports)
+        caption_font.cache_clear()
+        after = self._measure(Passport._build_qr_png, passports)
+
+        self._report("было", before)
+        self._report("стало", after)
+        self.stdout.write(self.style.SUCCESS(
+            f"Ускорение: x{statistics.mean(before) / statistics.mean(after):.2f} "
+            f"(экономия {(statistics.mean(before) - statistics.mean(after)) * 1000:.2f} мс на код)"
+        ))
+
+    def _measure(self, fn, passports):
+        timings = []
+        for p in passports:
+            started = time.perf_counter()
+            fn(p)
+            timings.append(time.perf_counter() - started)
+        return timings
+
+    def _report(self, label, timings):
+        ms = sorted(t * 1000 for t in timings)
+        self.stdout.write(
+            f"  {label:>5}: среднее {statistics.mean(ms):.2f} мс, медиана {statistics.median(ms):.2f} мс, "
+            f"p95 {ms[min(len(ms) - 1, int(len(ms) * 0.95))]:.2f} мс"
+        )
+
+
+def _same_pixels(a: bytes, b: bytes) -> bool:
+    img_a, img_b = PILImage.open(io.BytesIO(a)).convert("RGB"), PILImage.open(io.BytesIO(b)).convert("RGB")
+    return img_a.size == img_b.size and ImageChops.difference(img_a, img_b).getbbox() is None
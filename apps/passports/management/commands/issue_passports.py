@@ -0,0 +1,145 @@
+# apps/passports/management/commands/issue_passports.py
+import multiprocessing
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from concurrent.futures.process import BrokenProcessPool
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections, transaction
+
+from apps.common import cache
+from apps.passports import rollup
+from apps.passports.models import Passport
+from apps.passports.workers import init_worker, issue_one
+
+
+class Command(BaseCommand):
+    help = (
+        "Массовый выпуск паспортов-черновиков: генерация штрих/QR и PDF в пуле процессов, "
+        "статус и дата выдачи фиксируются пачками."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--status", default=Passport.Status.DRAFT,
+                            help="Статус выпускаемых паспортов; допустим только DRAFT (для совместимости скриптов)")
+        parser.add_argument("--region", default="",
+                            help="Код региона рождения лошади, например JIZ (он же — регион в номере паспорта)")
+        parser.add_argument("--workers", type=int, default=multiprocessing.cpu_count(),
+                            help="Количество процессов-рендеров")
+        parser.add_argument("--batch-size", type=int, default=50, help="Размер пачки для коммита в БД")
+        parser.add_argument("--max-renders", type=int, default=100,
+                            help="Перезапускать воркер после N рендеров")
+        parser.add_argument("--max-rss", type=int, default=1024,
+                            help="Перезапускать пул, если RSS воркера превысил N МБ")
+        parser.add_argument("--limit", type=int, default=0, help="Выпустить не более N паспортов")
+
+    def handle(self, *args, **opts):
+        if opts["workers"] < 1 or opts["batch_size"] < 1:
+            raise CommandError("--workers и --batch-size должны быть положительными")
+        if opts["status"].upper() != Passport.Status.DRAFT:
+            raise CommandError(
+                f"--status {opts['status']}: выпускаются только черновики (DRAFT); "
+                "выпущенные и аннулированные паспорта переоформляются из админки"
+            )
+
+        # выпускаются только черновики: _commit ставит ISSUED, аннулированные и
+        # переоформленные паспорта трогать нельзя
+        qs = Passport.objects.filter(status=Passport.Status.DRAFT).order_by("pk")
+        if opts["region"]:
+            qs = qs.filter(horse__place_of_birth__code=opts["region"].upper())
+        pks = list(qs.values_list("pk", flat=True))
+        if opts["limit"]:
+            pks = pks[:opts["limit"]]
+        if not pks:
+            self.stdout.write("Нет паспортов для выпуска")
+            return
+
+        self.stdout.write(f"К выпуску: {len(pks)} (воркеров: {opts['workers']})")
+
+        # воркерам нужны свои соединения — родительские не наследуем
+        connections.close_all()
+
+        issued = failed = skipped = 0
+        started = time.monotonic()
+        pool = None
+        try:
+            for i in range(0, len(pks), opts["batch_size"]):
+                if pool is None:
+                    pool = self._make_pool(opts)
+                results, errors, broken = self._run_batch(pool, pks[i:i + opts["batch_size"]])
+                self._commit(results)
+                issued += len(results)
+                failed += errors
+                skipped += sum(1 for r in results if not r["rendered"])
+
+                elapsed = time.monotonic() - started
+                self.stdout.write(
+                    f"  {issued + failed}/{len(pks)}: выпущено {issued}, ошибок {failed}, "
+                    f"{issued / elapsed:.2f} паспортов/с"
+                )
+
+                peak = max((r["rss_mb"] for r in results), default=0.0)
+                if peak > opts["max_rss"]:
+                    self.stdout.write(f"  RSS воркера {peak:.0f} МБ > {opts['max_rss']} МБ — перезапуск пула")
+                if broken or peak > opts["max_rss"]:
+                    pool.shutdown(wait=True)
+                    pool = None
+        finally:
+            if pool is not None:
+                pool.shutdown(wait=True)
+
+        elapsed = time.monotonic() - started
+        rate = issued / elapsed if elapsed else 0.0
+        self.stdout.write(self.style.SUCCESS(
+            f"Готово: выпущено {issued}, ошибок {failed} за {elapsed:.1f} с ({rate:.2f} паспортов/с); "
+            f"PDF без изменений (рендер пропущен): {skipped}"
+        ))
+
+    def _make_pool(self, opts):
+        return ProcessPoolExecutor(
+            max_workers=opts["workers"],
+            mp_context=multiprocessing.get_context("spawn"),
+            initializer=init_worker,
+            max_tasks_per_child=opts["max_renders"],
+        )
+
+    def _run_batch(self, pool, pks):
+        results, errors, broken = [], 0, False
+        futures = {pool.submit(issue_one, pk): pk for pk in pks}
+        for fut in as_completed(futures):
+            try:
+                results.append(fut.result())
+            except BrokenProcessPool as e:
+                # воркер упал (OOM/segfault в WeasyPrint) — пул пересоздадим
+                errors += 1
+                broken = True
+                self.stderr.write(self.style.WARNING(f"Паспорт #{futures[fut]}: {e}"))
+            except Exception as e:
+                errors += 1
+                self.stderr.write(self.style.WARNING(f"Паспорт #{futures[fut]}: {e}"))
+        return results, errors, broken
+
+    def _commit(self, results):
+        if not results:
+            return
+        by_pk = Passport.objects.in_bulk([r["pk"] for r in results])
+        objs = []
+        for r in results:
+            p = by_pk[r["pk"]]
+            p.barcode_value = r["barcode_value"]
+            p.barcode_image.name = r["barcode_image"]
+            p.qr_image.name = r["qr_image"]
+            p.pdf_file.name = r["pdf_file"]
+            p.pdf_fingerprint = r["pdf_fingerprint"]
+            # статус и дату воркер уже учёл в кодах и PDF — пишем те же
+            p.status = Passport.Status.ISSUED
+            p.issue_date = r["issue_date"]
+            objs.append(p)
+        with transaction.atomic():
+            Passport.objects.bulk_update(
+                objs, ["barcode_value", "barcode_image", "qr_image", "pdf_file", "pdf_fingerprint",
+                       "status", "issue_date"]
+            )
+            # bulk_update сигналов не рассылает
+            rollup.schedule(by_pk)
+            cache.bump_on_commit()
@@ -0,0 +1,21 @@
+# apps/passports/management/commands/prune_render_metrics.py
+from django.core.management.base import BaseCommand, CommandError
+
+from apps.passports.metrics import prune, retention_days
+
+
+class Command(BaseCommand):
+    help = (
+        "Удаляет замеры RenderMetric старше срока хранения (RENDER_METRICS_RETENTION_DAYS). "
+        "Запускать по расписанию (cron), если включён db_hook."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--days", type=int, default=None,
+                            help="Хранить замеры за последние N дней (по умолчанию — из настроек)")
+
+    def handle(self, *args, **opts):
+        days = opts["days"] if opts["days"] is not None else retention_days()
+        if days < 0:
+            raise CommandError("--days не может быть отрицательным")
+        self.stdout.write(self.style.SUCCESS(f"Удалено замеров старше {days} дн.: {prune(days)}"))
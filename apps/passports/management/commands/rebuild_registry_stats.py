@@ -0,0 +1,25 @@
+# apps/passports/management/commands/rebuild_registry_stats.py
+import time
+
+from django.core.management.base import BaseCommand
+
+from apps.passports.rollup import rebuild
+
+
+class Command(BaseCommand):
+    help = (
+        "Полностью пересчитывает статистику дашборда (RegistryStat, RegistryOwnerStat) "
+        "по текущему реестру. Нужен один раз после развёртывания и если таблицы разошлись "
+        "с данными (правки в обход ORM); дальше статистика ведётся сигналами."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--chunk-size", type=int, default=5000)
+
+    def handle(self, *args, **opts):
+        started = time.perf_counter()
+        cells, owners, passports = rebuild(chunk_size=opts["chunk_size"])
+        self.stdout.write(self.style.SUCCESS(
+            f"Паспортов: {passports}; строк куба: {cells}, владельцев: {owners} "
+            f"({time.perf_counter() - started:.1f} с)"
+        ))
@@ -0,0 +1,24 @@
+# apps/passports/management/commands/rebuild_search_index.py
+import time
+
+from django.core.management.base import BaseCommand
+
+from apps.passports.search import rebuild
+
+
+class Command(BaseCommand):
+    help = (
+        "Заново заполняет поисковый индекс паспортов (PassportSearch) по текущему реестру, "
+        "на PostgreSQL создаёт GIN-индекс pg_trgm по токенам. Паспорта без строки индекса "
+        "migrate дозаполняет сам; команда нужна после правок существующих паспортов в обход ORM."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--chunk-size", type=int, default=5000)
+
+    def handle(self, *args, **opts):
+        started = time.perf_counter()
+        total = rebuild(chunk_size=opts["chunk_size"])
+        self.stdout.write(self.style.SUCCESS(
+            f"Паспортов в индексе: {total} ({time.perf_counter() - started:.1f} с)"
+        ))
@@ -0,0 +1,69 @@
+# apps/passports/management/commands/run_render_worker.py
+import os
+import socket
+import time
+import traceback
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+from django.utils import timezone
+
+from apps.passports.jobs import run_job
+from apps.passports.models import RenderJob
+
+
+class Command(BaseCommand):
+    help = (
+        "Воркер очереди RenderJob: забирает задачи (FOR UPDATE SKIP LOCKED на Postgres), "
+        "выполняет, при ошибке повторяет с паузой. Можно запускать несколько экземпляров."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--once", action="store_true", help="Выполнить всё, что есть в очереди, и выйти")
+        parser.add_argument("--sleep", type=float, default=2.0, help="Пауза опроса пустой очереди, с")
+        parser.add_argument("--max-jobs", type=int, default=0, help="Выйти после N задач (0 — без лимита)")
+        parser.add_argument("--stale-after", type=int, default=600,
+                            help="Через сколько секунд RUNNING-задача считается брошенной")
+
+    def handle(self, *args, **opts):
+        worker = f"{socket.gethostname()}:{os.getpid()}"
+        self.stdout.write(f"Воркер {worker} запущен")
+        done = failed = skipped = 0
+        try:
+            while not opts["max_jobs"] or done + failed < opts["max_jobs"]:
+                close_old_connections()
+                stale = RenderJob.requeue_stale(timezone.now() - timedelta(seconds=opts["stale_after"]))
+                if stale:
+                    self.stdout.write(self.style.WARNING(f"  возвращено в очередь брошенных задач: {stale}"))
+
+                job = RenderJob.claim(worker)
+                if job is None:
+                    if opts["once"]:
+                        break
+                    time.sleep(opts["sleep"])
+                    continue
+
+                started = time.monotonic()
+                try:
+                    rendered = run_job(job)
+                except Exception as e:
+                    failed += 1
+                    job.mark_failed(f"{e}\n\n{traceback.format_exc()}")
+                    self.stderr.write(self.style.WARNING(
+                        f"  #{job.pk} {job.kind} паспорт {job.passport_id}: {e} "
+                        f"(попытка {job.attempts}/{job.max_attempts})"
+                    ))
+                else:
+                    done += 1
+                    skipped += rendered is False
+                    job.mark_done(rendered)
+                    note = " (PDF не изменился, рендер пропущен)" if rendered is False else ""
+                    self.stdout.write(
+                        f"  #{job.pk} {job.kind} паспорт {job.passport_id}: {time.monotonic() - started:.2f} с{note}"
+                    )
+        except KeyboardInterrupt:
+            self.stdout.write("Остановлен")
+        self.stdout.write(self.style.SUCCESS(
+            f"Готово: выполнено {done} (рендер PDF пропущен: {skipped}), ошибок {failed}"
+        ))
@@ -0,0 +1,117 @@
+# apps/passports/management/commands/update_microchips.py
+import csv
+import multiprocessing
+import os
+import socket
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from django.core.exceptions import ValidationError
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections, transaction
+from django.utils.timezone import now
+
+from apps.horses.models import Horse
+from apps.passports.models import Passport, RenderJob
+from apps.passports.workers import codes_one, init_worker
+
+
+class Command(BaseCommand):
+    help = (
+        "Массовая правка микрочипов из CSV (колонки registry_no или id, и microchip): "
+        "лошади и штрих-коды паспортов обновляются набором, коды каждого паспорта "
+        "перегенерируются ровно один раз — в пуле процессов или воркером очереди."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("csv_path", help="CSV с заголовком: registry_no|id, microchip")
+        parser.add_argument("--workers", type=int, default=multiprocessing.cpu_count(),
+                            help="Процессов для перегенерации кодов (0 — оставить задачи run_render_worker)")
+        parser.add_argument("--dry-run", action="store_true", help="Только проверить файл")
+
+    def handle(self, *args, **opts):
+        if opts["workers"] < 0:
+            raise CommandError("--workers не может быть отрицательным")
+
+        mapping, unknown = self._read(opts["csv_path"])
+        self.stdout.write(f"В файле: {len(mapping) + len(unknown)}, лошадь не найдена: {len(unknown)}")
+        for key in unknown[:20]:
+            self.stderr.write(self.style.WARNING(f"  нет лошади: {key}"))
+        if opts["dry_run"] or not mapping:
+            return
+
+        try:
+            horse_ids = Horse.objects.bulk_update_microchips(mapping)
+        except ValidationError as e:
+            raise CommandError("; ".join(e.messages))
+        job_ids = list(
+            RenderJob.objects.filter(
+                passport__horse_id__in=horse_ids, kind=RenderJob.Kind.CODES, status=RenderJob.Status.PENDING,
+            ).values_list("pk", flat=True)
+        )
+        self.stdout.write(f"Чип изменён у лошадей: {len(horse_ids)}, паспортов к перегенерации кодов: {len(job_ids)}")
+        if not job_ids or not opts["workers"]:
+            if job_ids:
+                self.stdout.write("Задачи в очереди — их выполнит manage.py run_render_worker")
+            return
+
+        worker = f"{socket.gethostname()}:{os.getpid()}"
+        jobs = {job.passport_id: job for job in RenderJob.claim_batch(worker, job_ids)}
+        if not jobs:
+            self.stdout.write("Задачи уже забрал воркер очереди")
+            return
+
+        # воркерам нужны свои соединения — родительские не наследуем
+        connections.close_all()
+        results, failed = [], 0
+        with ProcessPoolExecutor(
+            max_workers=min(opts["workers"], len(jobs)),
+            mp_context=multiprocessing.get_context("spawn"),
+            initializer=init_worker,
+            initargs=(False,),  # PDF-движок для кодов не нужен
+        ) as pool:
+            futures = {pool.submit(codes_one, pk): pk for pk in jobs}
+            for fut in as_completed(futures):
+                try:
+                    results.append(fut.result())
+                except Exception as e:
+                    failed += 1
+                    jobs[futures[fut]].mark_failed(str(e))  # повторит run_render_worker
+                    self.stderr.write(self.style.WARNING(f"Паспорт #{futures[fut]}: {e}"))
+
+        self._commit(results, [jobs[r["pk"]].pk for r in results])
+        self.stdout.write(self.style.SUCCESS(
+            f"Готово: коды перегенерированы у {len(results)} паспортов, ошибок {failed}"
+        ))
+
+    def _commit(self, results, job_ids):
+        by_pk = Passport.objects.in_bulk([r["pk"] for r in results])
+        for r in results:
+            p = by_pk[r["pk"]]
+            p.barcode_image.name = r["barcode_image"]
+            p.qr_image.name = r["qr_image"]
+        with transaction.atomic():
+            Passport.objects.bulk_update(by_pk.values(), ["barcode_image", "qr_image"], batch_size=500)
+            RenderJob.objects.filter(pk__in=job_ids).update(
+                status=RenderJob.Status.DONE, finished_at=now(), last_error="",
+            )
+
+    def _read(self, path):
+        try:
+            with open(path, newline="", encoding="utf-8-sig") as f:
+                rows = list(csv.DictReader(f))
+        except OSError as e:
+            raise CommandError(str(e))
+        if not rows:
+            return {}, []
+        if "microchip" not in rows[0] or not ({"registry_no", "id"} & set(rows[0])):
+            raise CommandError("Нужны колонки microchip и registry_no или id")
+
+        field = "registry_no" if "registry_no" in rows[0] else "id"
+        values = {r[field].strip(): r["microchip"] for r in rows}
+        found = {
+            str(k): pk
+            for k, pk in Horse.objects.filter(**{f"{field}__in": list(values)}).values_list(field, "pk")
+        }
+        mapping = {found[k]: mc for k, mc in values.items() if k in found}
+        unknown = [k for k in values if k not in found]
+        return mapping, unknown
@@ -0,0 +1,78 @@
+# apps/passports/metrics.py
+"""
+Таблица RenderMetric: хук для трасс выпуска (apps.common.instrumentation,
+включается в PASSPORT_RENDER_HOOKS) и сводка p50/p95 по этапам для страницы
+сотрудников. Старые строки удаляет prune (manage.py prune_render_metrics).
+"""
+from datetime import timedelta
+
+from django.conf import settings
+from django.db.models import Avg, Count, Max, Q
+from django.utils import timezone
+
+from .models import RenderMetric
+
+
+def db_hook(trace):
+    """Строки RenderMetric — по одной на этап трассы."""
+    RenderMetric.objects.bulk_create(
+        RenderMetric(
+            passport_id=trace.passport_id,
+            operation=trace.operation,
+            stage=name,
+            seconds=rec["seconds"],
+            queries=rec["queries"],
+            rss_kb=rec["rss_kb"],
+            failed=bool(trace.error),
+        )
+        for name, rec in trace.stages.items()
+    )
+
+
+def retention_days() -> int:
+    return getattr(settings, "RENDER_METRICS_RETENTION_DAYS", 30)
+
+
+def prune(days: int | None = None) -> int:
+    """Удалить замеры старше days дней (по умолчанию — срок хранения). Возвращает число строк."""
+    cutoff = timezone.now() - timedelta(days=days if days is not None else retention_days())
+    deleted, _ = RenderMetric.objects.filter(created_at__lt=cutoff).delete()
+    return deleted
+
+
+def _percentile(values_qs, count: int, p: float):
+    """
+    Перцентиль (линейная интерполяция, как percentile_cont): из БД читаем только
+    два соседних значения по порядку, а не всю группу.
+    """
+    if not count:
+        return None
+    k = (count - 1) * p
+    lo = int(k)
+    values = list(values_qs.order_by("seconds").values_list("seconds", flat=True)[lo:lo + 2])
+    hi = values[-1]
+    return values[0] + (hi - values[0]) * (k - lo)
+
+
+def stage_summary(days: int = 7) -> list[dict]:
+    """
+    p50/p95 времени, среднее число запросов и максимальный прирост RSS по
+    (операция, этап) за последние days дней (не больше срока хранения).
+    Счётчики — агрегатами в БД; percentile_cont есть не во всех СУБД, поэтому
+    перцентили — выборкой двух строк по смещению в каждой группе.
+    """
+    since = timezone.now() - timedelta(days=min(days, retention_days()))
+    window = RenderMetric.objects.filter(created_at__gte=since)
+    groups = (window.values("operation", "stage")
+              .annotate(count=Count("id"), avg_queries=Avg("queries"), max_rss_kb=Max("rss_kb"),
+                        failed=Count("id", filter=Q(failed=True)))
+              .order_by("operation", "stage"))
+    out = []
+    for g in groups:
+        rows = window.filter(operation=g["operation"], stage=g["stage"])
+        out.append({
+            **g,
+            "p50": _percentile(rows, g["count"], 0.5),
+            "p95": _percentile(rows, g["count"], 0.95),
+        })
+    return out
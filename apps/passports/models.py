@@ -1,14 +1,25 @@
 import io, uuid
-from django.db import models
+from datetime import timedelta
+
+from django.db import connection, models, transaction
+from django.utils import timezone
 from django.conf import settings
 from django.core.files.base import ContentFile
-from PIL import Image as PILImage, ImageDraw, ImageFont
-import barcode, qrcode
+import barcode
 from barcode.writer import ImageWriter
 
+from apps.common.models import Breed, Region
+from apps.common.storage import generated_storage
 from apps.common.utils import make_passport_number
 from apps.horses.models import Horse
 
+from apps.common.instrumentation import RenderTrace
+from .qr import build_qr_png, build_qr_svg
+
+
+# поля паспорта, от которых зависят картинки штрих-кода и QR
+CODE_INPUT_FIELDS = ("number", "old_passport_number", "barcode_value", "status")
+
 
 class Passport(models.Model):
     class Status(models.TextChoices):
@@ -36,9 +47,14 @@ class Status(models.TextChoices):
     barcode_value = models.CharField(
         "Значение штрих-кода (микрочип)", max_length=32, blank=True
     )
-    barcode_image = models.ImageField("Штрих-код (PNG)", upload_to='barcodes/', blank=True)
-    qr_image = models.ImageField("QR-код (PNG)", upload_to='qrcodes/', blank=True)
+    barcode_image = models.ImageField("Штрих-код (PNG)", upload_to='barcodes/', blank=True,
+                                      storage=generated_storage)
+    qr_image = models.ImageField("QR-код (PNG)", upload_to='qrcodes/', blank=True, storage=generated_storage)
     pdf_file = models.FileField("Файл паспорта (PDF)", upload_to='passports/', blank=True)
+    pdf_fingerprint = models.CharField(
+        "Отпечаток данных PDF", max_length=64, blank=True, editable=False,
+        help_text="sha256 входных данных последнего рендера; совпадает — PDF не перерисовываем."
+    )
     version = models.PositiveSmallIntegerField("Версия", default=1)
     revoked_reason = models.CharField("Причина аннулирования", max_length=255, blank=True)
     created_at = models.DateTimeField("Создано", auto_now_add=True)
@@ -49,6 +65,8 @@ class Meta:
         indexes = [
             models.Index(fields=["number"]),
             models.Index(fields=["old_passport_number"]),
+            # порядок списка и постраничный вывод по ключу (pagination.py)
+            models.Index(fields=["-issue_date", "-created_at", "-id"]),
         ]
 
     @property
@@ -102,153 +120,321 @@ def _build_qr_png(self) -> bytes:
         """
         QR кодирует public_url (всегда новый номер).
         Для действующих импортированных паспортов (is_active & has_old) слева рисуем
-        вертикальную подпись с НОВЫМ номером. Управляем пустыми зонами через settings.
+        вертикальную подпись с НОВЫМ номером. Пустые зоны и подпись — settings.QR_*,
+        построение — apps/passports/qr.py.
         """
+        return build_qr_png(self.public_url, self._qr_caption())
+
+    def _qr_caption(self) -> str | None:
+        return (self.number or "").strip() if (self.is_active and self.has_old) else None
 
-        # ---- 1) Генерим QR ----
-        box_size = int(getattr(settings, "QR_BOX_SIZE", 10))  # размер модуля
-        border = int(getattr(settings, "QR_BORDER", 2))  # базовая quiet-zone (модули)
-
-        qr = qrcode.QRCode(version=None, box_size=box_size, border=border)
-        qr.add_data(self.public_url)
-        qr.make(fit=True)
-        qr_img = qr.make_image(fill_color="black", back_color="white").convert("RGB")
-
-        # --- Асимметричная quiet-zone (по сторонам можно урезать отдельно) ---
-        bl = int(getattr(settings, "QR_BORDER_LEFT", None) or border)
-        bt = int(getattr(settings, "QR_BORDER_TOP", None) or border)
-        br = int(getattr(settings, "QR_BORDER_RIGHT", None) or border)
-        bb = int(getattr(settings, "QR_BORDER_BOTTOM", None) or border)
-
-        # сколько пикселей убрать с каждой стороны
-        px_l = max(0, (border - bl) * box_size)
-        px_t = max(0, (border - bt) * box_size)
-        px_r = max(0, (border - br) * box_size)
-        px_b = max(0, (border - bb) * box_size)
-
-        if any((px_l, px_t, px_r, px_b)):
-            w, h = qr_img.size
-            qr_img = qr_img.crop((px_l, px_t, w - px_r, h - px_b))
-
-        qr_w, qr_h = qr_img.size
-
-        # Если подпись не нужна — чистый QR
-        if not (self.is_active and self.has_old):
-            buf = io.BytesIO()
-            qr_img.save(buf, format="PNG")
-            return buf.getvalue()
-
-        # ---- 2) Вертикальная подпись с НОВЫМ номером ----
-        text = (self.number or "").strip()
-
-        # внутренние паддинги текста (внутри «ленты» до поворота)
-        pad_x_left = int(getattr(settings, "QR_TEXT_PAD_X_LEFT", 2))
-        pad_x_right = int(getattr(settings, "QR_TEXT_PAD_X_RIGHT", 0))
-        pad_y = int(getattr(settings, "QR_TEXT_PAD_Y", 2))
-
-        # внешний левый отступ всей ленты (воздух слева от текста)
-        outer_left_pad = int(getattr(settings, "QR_STRIP_LEFT_OUTER_PAD", 4))
-
-        # зазор между лентой и самим QR
-        gap_between = int(getattr(settings, "QR_GAP_BETWEEN", 0))
-
-        # максимально допустимая ширина ленты (после поворота), в долях ширины QR
-        strip_max_ratio = float(getattr(settings, "QR_TEXT_STRIP_MAX", 0.22))
-
-        max_strip_w = max(1, int(qr_w * strip_max_ratio))
-        max_rot_h = max(1, qr_h - 2 * pad_y)
-
-        # шрифт
-        font_path = getattr(settings, "QR_TEXT_FONT_PATH", None)
-
-        def load_font(sz: int):
-            try:
-                if font_path:
-                    return ImageFont.truetype(str(font_path), size=sz)
-                return ImageFont.truetype("DejaVuSans.ttf", size=sz)
-            except Exception:
-                return ImageFont.load_default()
-
-        size = int(qr_h * 0.14)
-        font = load_font(size)
-
-        # измерение текста
-        tmp = PILImage.new("RGB", (1, 1), "white")
-        draw = ImageDraw.Draw(tmp)
-
-        def text_wh(f):
-            try:
-                bbox = draw.textbbox((0, 0), text, font=f)
-                return bbox[2] - bbox[0], bbox[3] - bbox[1]
-            except AttributeError:
-                return draw.textsize(text, font=f)
-
-        tw, th = text_wh(font)
-        # после поворота CCW: высота ~ tw + 2*pad_y; ширина ~ th + pad_x_left + pad_x_right
-        while ((tw + 2 * pad_y) > max_rot_h or (th + pad_x_left + pad_x_right) > max_strip_w) and size > 9:
-            size -= 1
-            font = load_font(size)
-            tw, th = text_wh(font)
-
-        # рисуем горизонтально -> поворачиваем
-        text_img = PILImage.new("RGBA", (tw + pad_x_left + pad_x_right, th + 2 * pad_y), (255, 255, 255, 0))
-        tdraw = ImageDraw.Draw(text_img)
-        tdraw.text((pad_x_left, pad_y), text, fill=(0, 0, 0, 255), font=font)
-
-        rotate_deg = int(getattr(settings, "QR_TEXT_ROTATE", 90))  # 90 снизу-вверх; 270 сверху-вниз
-        text_rot = text_img.rotate(rotate_deg, expand=True, resample=PILImage.BICUBIC)
-
-        # авто-обрезка прозрачных краёв
-        bbox = text_rot.getbbox()
-        if bbox:
-            text_rot = text_rot.crop(bbox)
-
-        strip_w, strip_h = text_rot.width, text_rot.height
-
-        # ---- 3) Сборка финального изображения ----
-        canvas_w = outer_left_pad + strip_w + gap_between + qr_w
-        canvas_h = qr_h
-        canvas = PILImage.new("RGB", (canvas_w, canvas_h), "white")
-
-        y_text = max(0, (canvas_h - strip_h) // 2)
-        canvas.paste(text_rot.convert("RGB"), (outer_left_pad, y_text))
-        canvas.paste(qr_img, (outer_left_pad + strip_w + gap_between, 0))
-
-        buf = io.BytesIO()
-        canvas.save(buf, format="PNG")
-        return buf.getvalue()
+    def qr_svg(self) -> str:
+        """Тот же QR с подписью, что в qr_image, вектором — для вставки в PDF."""
+        return build_qr_svg(self.public_url, self._qr_caption())
 
     def generate_codes(self):
         """Штрих-код по микрочипу + QR (public_url), при наличии old_passport_number — подпись с НОВЫМ номером."""
-        if self.barcode_value:
-            b_png = io.BytesIO()
-            barcode.Code128(self.barcode_value, writer=ImageWriter()).write(b_png)
-            self.barcode_image.save(f'{self.number or "no-num"}.png', ContentFile(b_png.getvalue()), save=False)
-
-        qr_bytes = self._build_qr_png()
-        self.qr_image.save(f'{self.number or "no-num"}.png', ContentFile(qr_bytes), save=False)
+        with RenderTrace("codes", self) as trace:
+            if self.barcode_value:
+                b_png = io.BytesIO()
+                with trace.stage("barcode"):
+                    barcode.Code128(self.barcode_value, writer=ImageWriter()).write(b_png)
+                with trace.stage("save"):
+                    self.barcode_image.save(f'{self.number or "no-num"}.png', ContentFile(b_png.getvalue()), save=False)
+
+            with trace.stage("qr"):
+                qr_bytes = self._build_qr_png()
+            with trace.stage("save"):
+                self.qr_image.save(f'{self.number or "no-num"}.png', ContentFile(qr_bytes), save=False)
+        self._codes_state = self._current_codes_key()
+
+    # ---- Отслеживание изменений кодов ----
+    # Картинки кодов зависят от number (QR), barcode_value (штрих-код) и того,
+    # печатается ли подпись (is_active & has_old). Значения, для которых коды
+    # построены, запоминаются при загрузке из БД (from_db) и после
+    # generate_codes — save() решает, перегенерировать ли, без запроса к БД.
+
+    @staticmethod
+    def _codes_key(values) -> tuple | None:
+        if any(f not in values for f in CODE_INPUT_FIELDS):
+            return None  # поля отложены (defer/only)
+        active = values["status"] in (Passport.Status.ISSUED, Passport.Status.REISSUED)
+        has_old = bool((values["old_passport_number"] or "").strip())
+        return values["number"], values["barcode_value"], active and has_old
+
+    def _current_codes_key(self):
+        return self._codes_key(self.__dict__)
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance._codes_state = instance._current_codes_key()
+        return instance
+
+    def refresh_from_db(self, using=None, fields=None, **kwargs):
+        super().refresh_from_db(using=using, fields=fields, **kwargs)
+        if fields is None:
+            self._codes_state = self._current_codes_key()
+
+    def _codes_changed(self) -> bool:
+        if self._state.adding:
+            return True
+        state = getattr(self, "_codes_state", None)
+        if state is None:
+            # экземпляр собран не из БД (или поля были отложены) — сверяемся с базой
+            stored = type(self).objects.filter(pk=self.pk).values(*CODE_INPUT_FIELDS).first()
+            state = self._codes_key(stored) if stored else None
+        return state != self._current_codes_key()
 
     def save(self, *args, **kwargs):
         self._ensure_number()
         self._ensure_barcode()
 
-        regenerate = not self.pk
-        if self.pk and not regenerate:
-            prev = type(self).objects.filter(pk=self.pk).values(
-                "number", "old_passport_number", "barcode_value"
-            ).first() or {}
-            if (
-                prev.get("number") != self.number or
-                prev.get("old_passport_number") != self.old_passport_number or
-                prev.get("barcode_value") != self.barcode_value
-            ):
-                regenerate = True
+        if self._codes_changed():
+            # коды строим до записи — паспорт уходит в БД одним INSERT/UPDATE
+            self.generate_codes()
+            if kwargs.get("update_fields") is not None:
+                kwargs["update_fields"] = {*kwargs["update_fields"], "barcode_image", "qr_image"}
 
         super().save(*args, **kwargs)
 
-        if regenerate:
-            self.generate_codes()
-            super().save(update_fields=["barcode_image", "qr_image"])
-
     def __str__(self):
         return f"{self.number} → {self.horse}"
+
+
+class RenderJob(models.Model):
+    """
+    Фоновая задача по паспорту (штрих/QR, PDF). Очередь — сама таблица:
+    admin-действия и сигналы только ставят задачу, выполняет её
+    manage.py run_render_worker.
+    """
+    class Kind(models.TextChoices):
+        ISSUE = "ISSUE", "Выпуск (коды + PDF + статус)"
+        REISSUE = "REISSUE", "Переоформление (коды + PDF)"
+        RENDER = "RENDER", "Перегенерация PDF"
+        CODES = "CODES", "Перегенерация штрих/QR"
+
+    class Status(models.TextChoices):
+        PENDING = "PENDING", "В очереди"
+        RUNNING = "RUNNING", "Выполняется"
+        DONE = "DONE", "Готово"
+        FAILED = "FAILED", "Ошибка"
+
+    passport = models.ForeignKey(Passport, verbose_name="Паспорт", on_delete=models.CASCADE,
+                                 related_name="render_jobs")
+    kind = models.CharField("Тип", max_length=12, choices=Kind.choices)
+    force = models.BooleanField("Без проверки отпечатка", default=False)
+    status = models.CharField("Статус", max_length=12, choices=Status.choices, default=Status.PENDING)
+    attempts = models.PositiveSmallIntegerField("Попыток", default=0)
+    max_attempts = models.PositiveSmallIntegerField("Максимум попыток", default=3)
+    run_after = models.DateTimeField("Не раньше", default=timezone.now)
+    locked_by = models.CharField("Воркер", max_length=64, blank=True)
+    locked_at = models.DateTimeField("Взята в работу", null=True, blank=True)
+    finished_at = models.DateTimeField("Завершена", null=True, blank=True)
+    last_error = models.TextField("Последняя ошибка", blank=True)
+    pdf_skipped = models.BooleanField(
+        "PDF не изменился", null=True, blank=True,
+        help_text="Да — отпечаток совпал и рендер пропущен; пусто — задача без PDF или ещё не выполнена",
+    )
+    created_at = models.DateTimeField("Создано", auto_now_add=True)
+
+    class Meta:
+        verbose_name = "Задача рендера"
+        verbose_name_plural = "Задачи рендера"
+        ordering = ["-created_at"]
+        indexes = [
+            models.Index(fields=["status", "run_after"]),
+        ]
+
+    def __str__(self):
+        return f"{self.get_kind_display()} · {self.passport_id} · {self.get_status_display()}"
+
+    @classmethod
+    def enqueue(cls, passport, kind: str, force: bool = False) -> "RenderJob":
+        """Ставит задачу; если такая же уже ждёт в очереди — возвращает её."""
+        job = cls.objects.filter(passport=passport, kind=kind, status=cls.Status.PENDING).first()
+        if job is not None:
+            if force and not job.force:
+                job.force = True
+                job.save(update_fields=["force"])
+            return job
+        return cls.objects.create(passport=passport, kind=kind, force=force)
+
+    @classmethod
+    def enqueue_many(cls, passport_ids, kind: str) -> list[int]:
+        """
+        enqueue для набора паспортов: одна ожидающая задача на паспорт, новые
+        вставляются одним запросом. Возвращает id задач (новых и уже ждавших).
+        """
+        passport_ids = set(passport_ids)
+        waiting = dict(
+            cls.objects.filter(passport_id__in=passport_ids, kind=kind, status=cls.Status.PENDING)
+            .values_list("passport_id", "pk")
+        )
+        created = cls.objects.bulk_create(
+            [cls(passport_id=pk, kind=kind) for pk in sorted(passport_ids - set(waiting))]
+        )
+        return sorted([*waiting.values(), *(job.pk for job in created)])
+
+    @classmethod
+    def claim(cls, worker: str):
+        """
+        Забирает одну готовую к запуску задачу. На Postgres строки берутся
+        через SELECT ... FOR UPDATE SKIP LOCKED, поэтому воркеры не ждут друг
+        друга; на SQLite (нет SKIP LOCKED) задачу «захватывает» тот, чей
+        условный UPDATE status=PENDING → RUNNING прошёл первым.
+        """
+        skip_locked = connection.features.has_select_for_update_skip_locked
+        for _ in range(5):
+            with transaction.atomic():
+                qs = cls.objects.filter(status=cls.Status.PENDING, run_after__lte=timezone.now())
+                if skip_locked:
+                    qs = qs.select_for_update(skip_locked=True)
+                job = qs.order_by("run_after", "pk").first()
+                if job is None:
+                    return None
+                claimed = cls.objects.filter(pk=job.pk, status=cls.Status.PENDING).update(
+                    status=cls.Status.RUNNING, locked_by=worker, locked_at=timezone.now(),
+                    attempts=models.F("attempts") + 1,
+                )
+            if claimed:
+                job.refresh_from_db()
+                return job
+        return None
+
+    @classmethod
+    def claim_batch(cls, worker: str, ids) -> list["RenderJob"]:
+        """
+        Забирает сразу набор задач (одним условным UPDATE) для исполнителя,
+        который выполняет их сам, например пулом процессов. Возвращает те из
+        ids, что ещё ждали в очереди; остальные уже взял кто-то другой.
+        """
+        cls.objects.filter(pk__in=ids, status=cls.Status.PENDING).update(
+            status=cls.Status.RUNNING, locked_by=worker, locked_at=timezone.now(),
+            attempts=models.F("attempts") + 1,
+        )
+        return list(cls.objects.filter(pk__in=ids, status=cls.Status.RUNNING, locked_by=worker))
+
+    @classmethod
+    def requeue_stale(cls, older_than) -> int:
+        """RUNNING-задачи умерших воркеров (взяты раньше older_than) — обратно в очередь."""
+        return cls.objects.filter(status=cls.Status.RUNNING, locked_at__lt=older_than).update(
+            status=cls.Status.PENDING, locked_by="", locked_at=None,
+        )
+
+    def mark_done(self, rendered: bool | None = None):
+        """rendered — результат render_passport_pdf (None, если PDF задача не трогала)."""
+        self.status = self.Status.DONE
+        self.finished_at = timezone.now()
+        self.last_error = ""
+        self.pdf_skipped = None if rendered is None else not rendered
+        self.save(update_fields=["status", "finished_at", "last_error", "pdf_skipped"])
+
+    def mark_failed(self, error: str, backoff_seconds: int = 30):
+        """Ошибка: повтор с экспоненциальной паузой, пока не кончились попытки."""
+        self.last_error = error
+        if self.attempts < self.max_attempts:
+            self.status = self.Status.PENDING
+            self.run_after = timezone.now() + timedelta(seconds=backoff_seconds * 2 ** (self.attempts - 1))
+        else:
+            self.status = self.Status.FAILED
+            self.finished_at = timezone.now()
+        self.locked_by, self.locked_at = "", None
+        self.save(update_fields=["status", "run_after", "finished_at", "last_error", "locked_by", "locked_at"])
+
+
+class RenderMetric(models.Model):
+    """Замер одного этапа выпуска (см. instrumentation.db_hook)."""
+    passport = models.ForeignKey(Passport, verbose_name="Паспорт", on_delete=models.SET_NULL,
+                                 null=True, blank=True, related_name="render_metrics")
+    operation = models.CharField("Операция", max_length=16)
+    stage = models.CharField("Этап", max_length=32)
+    seconds = models.FloatField("Время, с")
+    queries = models.PositiveIntegerField("SQL-запросов", default=0)
+    rss_kb = models.PositiveIntegerField("Прирост пикового RSS, КБ", default=0)
+    failed = models.BooleanField("С ошибкой", default=False)
+    created_at = models.DateTimeField("Создано", auto_now_add=True, db_index=True)
+
+    class Meta:
+        verbose_name = "Замер рендера"
+        verbose_name_plural = "Замеры рендера"
+        indexes = [
+            models.Index(fields=["operation", "stage", "created_at"]),
+        ]
+
+    def __str__(self):
+        return f"{self.operation}.{self.stage}: {self.seconds:.3f} с"
+
+
+class RegistryStat(models.Model):
+    """
+    Куб статистики для дашборда: сколько паспортов в разрезе (статус, порода,
+    регион рождения, тип лошади, тип владельца, месяц выдачи). Строк — по
+    числу встречающихся сочетаний, а не паспортов; ведётся инкрементально
+    (apps/passports/rollup.py), полный пересчёт — manage.py rebuild_registry_stats.
+    """
+    key = models.CharField("Ключ сочетания", max_length=120, unique=True)
+    status = models.CharField("Статус", max_length=12, choices=Passport.Status.choices)
+    breed = models.ForeignKey(Breed, verbose_name="Порода", null=True, on_delete=models.DO_NOTHING,
+                              db_constraint=False, related_name="+")
+    region = models.ForeignKey(Region, verbose_name="Регион рождения", null=True, on_delete=models.DO_NOTHING,
+                               db_constraint=False, related_name="+")
+    horse_type = models.CharField("Тип лошади", max_length=10, blank=True)
+    owner_kind = models.CharField("Тип владельца", max_length=10, blank=True)  # PERSON / STATE / PRIVATE
+    issue_month = models.DateField("Месяц выдачи", null=True)
+    count = models.PositiveIntegerField("Паспортов", default=0)
+
+    class Meta:
+        verbose_name = "Строка статистики"
+        verbose_name_plural = "Статистика реестра"
+
+    def __str__(self):
+        return f"{self.key} = {self.count}"
+
+
+class RegistryOwnerStat(models.Model):
+    """Паспорта по владельцу (физлицо или организация) — для рейтинга владельцев."""
+    kind = models.CharField("Тип владельца", max_length=10)  # PERSON / STATE / PRIVATE
+    party_id = models.PositiveBigIntegerField("Физлицо/организация (id)")
+    count = models.PositiveIntegerField("Паспортов", default=0)
+
+    class Meta:
+        verbose_name = "Паспорта владельца"
+        verbose_name_plural = "Паспорта по владельцам"
+        unique_together = ("kind", "party_id")
+        indexes = [
+            models.Index(fields=["kind", "-count", "party_id"]),  # порядок рейтинга и курсор
+        ]
+
+    def __str__(self):
+        return f"{self.kind}:{self.party_id} = {self.count}"
+
+
+class RegistryStatMember(models.Model):
+    """В какие строки RegistryStat/RegistryOwnerStat паспорт сейчас засчитан."""
+    passport_id = models.PositiveBigIntegerField("Паспорт (id)", primary_key=True)
+    cube_key = models.CharField("Ключ RegistryStat", max_length=120)
+    owner_key = models.CharField("Ключ RegistryOwnerStat", max_length=40, blank=True)
+
+    class Meta:
+        verbose_name = "Учёт паспорта в статистике"
+        verbose_name_plural = "Учёт паспортов в статистике"
+
+
+class PassportSearch(models.Model):
+    """
+    Строка поиска по паспорту (apps/passports/search.py): нормализованные токены
+    номеров, клички, регистрационного номера, микрочипа и владельца — поиск
+    без соединения паспорт⋈лошадь⋈владелец.
+    """
+    passport = models.OneToOneField(Passport, verbose_name="Паспорт", on_delete=models.CASCADE,
+                                    primary_key=True, related_name="search_entry")
+    tokens = models.TextField("Токены")  # " tok1 tok2 … ": префикс токена — LIKE '% tok%'
+    label = models.CharField("Подпись", max_length=255)
+
+    class Meta:
+        verbose_name = "Поисковая строка паспорта"
+        verbose_name_plural = "Поисковый индекс паспортов"
+
+    def __str__(self):
+        return self.label
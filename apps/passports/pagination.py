@@ -0,0 +1,134 @@
+# apps/passports/pagination.py
+"""
+Постраничный вывод списка паспортов по ключу (seek/keyset) вместо OFFSET.
+
+Порядок — (issue_date, created_at, id) по убыванию, как у списка; страница
+начинается «после» последней строки предыдущей, поэтому глубина страницы
+не влияет на время запроса (индекс Passport: -issue_date, -created_at, -id),
+а COUNT(*) по всему отфильтрованному набору не нужен вовсе. Курсоры
+непрозрачны: base64 от направления и ключа граничной строки.
+
+issue_date бывает пустым (черновики): где NULL в порядке DESC — в начале
+(PostgreSQL) или в конце (SQLite, MySQL) — решает БД, условия «после/до»
+строятся с учётом connection.features.nulls_order_largest.
+"""
+import json
+import re
+from base64 import urlsafe_b64decode, urlsafe_b64encode
+from datetime import date, datetime
+
+from django.db import connections
+from django.db.models import Q
+
+ORDERING = ("-issue_date", "-created_at", "-id")
+
+
+class InvalidCursor(ValueError):
+    pass
+
+
+def encode_cursor(direction: str, obj) -> str:
+    key = [obj.issue_date.isoformat() if obj.issue_date else None, obj.created_at.isoformat(), obj.pk]
+    return urlsafe_b64encode(json.dumps([direction, *key]).encode()).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str):
+    """-> (направление "n"/"p", issue_date | None, created_at, id)."""
+    try:
+        direction, issue_date, created_at, pk = json.loads(urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)))
+        if direction not in ("n", "p"):
+            raise ValueError(direction)
+        return (direction, date.fromisoformat(issue_date) if issue_date else None,
+                datetime.fromisoformat(created_at), int(pk))
+    except (ValueError, TypeError) as e:
+        raise InvalidCursor(cursor) from e
+
+
+class KeysetPage:
+    def __init__(self, object_list, next_cursor, prev_cursor):
+        self.object_list = object_list
+        self.next_cursor = next_cursor
+        self.prev_cursor = prev_cursor
+
+    def has_next(self):
+        return self.next_cursor is not None
+
+    def has_previous(self):
+        return self.prev_cursor is not None
+
+    def has_other_pages(self):
+        return self.has_next() or self.has_previous()
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __len__(self):
+        return len(self.object_list)
+
+
+class KeysetPaginator:
+    def __init__(self, queryset, per_page: int):
+        self.queryset = queryset.order_by(*ORDERING)
+        self.per_page = per_page
+        self.nulls_largest = connections[queryset.db].features.nulls_order_largest
+
+    def page(self, cursor: str | None = None) -> KeysetPage:
+        if not cursor:
+            rows = list(self.queryset[:self.per_page + 1])
+            more = len(rows) > self.per_page
+            rows = rows[:self.per_page]
+            return KeysetPage(rows, encode_cursor("n", rows[-1]) if more else None, None)
+
+        direction, issue_date, created_at, pk = decode_cursor(cursor)
+        if direction == "n":
+            qs = self.queryset.filter(self._after(issue_date, created_at, pk))
+        else:  # к началу списка: идём в обратном порядке и разворачиваем
+            qs = self.queryset.filter(self._before(issue_date, created_at, pk)).reverse()
+        rows = list(qs[:self.per_page + 1])
+        more = len(rows) > self.per_page
+        rows = rows[:self.per_page]
+        if direction == "p":
+            rows.reverse()
+        if not rows:
+            return KeysetPage(rows, None, None)
+        first, last = encode_cursor("p", rows[0]), encode_cursor("n", rows[-1])
+        if direction == "n":
+            return KeysetPage(rows, last if more else None, first)
+        return KeysetPage(rows, last, first if more else None)
+
+    # «после» ключа в порядке ORDERING = строго меньше по (issue_date, created_at, id)
+    def _after(self, issue_date, created_at, pk) -> Q:
+        tail = Q(created_at__lt=created_at) | Q(created_at=created_at, pk__lt=pk)
+        return self._date_lt(issue_date) | (self._date_eq(issue_date) & tail)
+
+    def _before(self, issue_date, created_at, pk) -> Q:
+        tail = Q(created_at__gt=created_at) | Q(created_at=created_at, pk__gt=pk)
+        return self._date_gt(issue_date) | (self._date_eq(issue_date) & tail)
+
+    @staticmethod
+    def _date_eq(value) -> Q:
+        return Q(issue_date__isnull=True) if value is None else Q(issue_date=value)
+
+    def _date_lt(self, value) -> Q:
+        if value is None:  # меньше NULL — все даты, если NULL «наибольший»
+            return Q(issue_date__isnull=False) if self.nulls_largest else Q(pk__in=[])
+        return Q(issue_date__lt=value) | (Q(pk__in=[]) if self.nulls_largest else Q(issue_date__isnull=True))
+
+    def _date_gt(self, value) -> Q:
+        if value is None:
+            return Q(pk__in=[]) if self.nulls_largest else Q(issue_date__isnull=False)
+        return Q(issue_date__gt=value) | (Q(issue_date__isnull=True) if self.nulls_largest else Q(pk__in=[]))
+
+
+_PLAN_ROWS_RE = re.compile(r'"Plan Rows":\s*(\d+)')
+
+
+def estimated_count(queryset) -> int | None:
+    """
+    Оценка числа строк из плана запроса (PostgreSQL EXPLAIN) — без прохода по
+    данным. На других БД оценки нет: None.
+    """
+    if connections[queryset.db].vendor != "postgresql":
+        return None
+    match = _PLAN_ROWS_RE.search(queryset.order_by().explain(format="json"))
+    return int(match.group(1)) if match else None
@@ -0,0 +1,107 @@
+# apps/passports/preview.py
+"""
+Быстрый предпросмотр паспорта в админке: верстаются только выбранные разделы
+(обложка, фото, …) из тех же блоков шаблона, остальные страницы скрыты
+(pdf_page_id -> id="preview-skip-…"). Ни pdf_file, ни статус не трогаются.
+
+Страницы растрируются в PNG низкого разрешения (PASSPORT_PREVIEW_DPI) через
+pypdfium2 (requirements.txt); в окружении без него предпросмотр отдаётся
+маленьким PDF из тех же страниц. Результат лежит в
+MEDIA_ROOT/preview_cache/<ключ>/: ключ — хэш входных данных выбранных
+разделов, версии шаблонов и разрешения, так что повторный просмотр
+неизменённого черновика — просто чтение файлов. Каждая правка черновика даёт
+новый каталог; каталоги, которые дольше --min-age никто не открывал
+(mtime обновляется при попадании), удаляет manage.py gc_media.
+"""
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+from pathlib import Path
+
+from django.conf import settings
+
+from .engine import get_engine
+from .fingerprint import SECTIONS, section_hashes, static_version, template_version
+from .services import PassportRenderContext
+
+PREVIEW_CACHE_DIR = "preview_cache"
+DEFAULT_SECTIONS = ("cover", "photos")
+POINTS_PER_INCH = 72
+
+try:
+    import pypdfium2 as pdfium
+except ImportError:  # растеризатор не установлен — отдаём PDF
+    pdfium = None
+
+
+def preview_dpi() -> int:
+    return int(getattr(settings, "PASSPORT_PREVIEW_DPI", 50) or 50)
+
+
+def parse_sections(raw: str | None) -> tuple[str, ...]:
+    """'cover,photos' -> ('cover', 'photos') в порядке паспорта; неизвестные отбрасываются."""
+    wanted = {s.strip() for s in (raw or "").split(",") if s.strip()}
+    return tuple(s for s in SECTIONS if s in wanted) or DEFAULT_SECTIONS
+
+
+def preview_dir(key: str) -> Path:
+    return Path(settings.MEDIA_ROOT) / PREVIEW_CACHE_DIR / key[:2] / key
+
+
+def _preview_key(ctx: dict, sections: tuple[str, ...], fmt: str) -> str:
+    hashes = section_hashes(ctx)
+    raw = json.dumps({
+        "template": template_version(),
+        "static": static_version(),
+        "sections": {s: hashes[s] for s in sections},
+        "dpi": preview_dpi(),
+        "format": fmt,
+    }, sort_keys=True)
+    return hashlib.sha256(raw.encode()).hexdigest()
+
+
+def _cached_files(out_dir: Path) -> list[Path]:
+    return sorted(out_dir.glob("page-*.png")) or sorted(out_dir.glob("preview.pdf"))
+
+
+def passport_preview(passport, sections: tuple[str, ...] = DEFAULT_SECTIONS) -> list[Path]:
+    """
+    Файлы предпросмотра выбранных разделов: PNG по странице (page-001.png, …)
+    или один preview.pdf, если pypdfium2 не установлен.
+    """
+    ctx = PassportRenderContext.load([passport])[0].as_dict()
+    out_dir = preview_dir(_preview_key(ctx, sections, "png" if pdfium else "pdf"))
+    files = _cached_files(out_dir)
+    if files:
+        os.utime(out_dir)  # для gc_media: каталогом пользуются
+        return files
+
+    pdf = get_engine().preview_document(ctx, sections).write_pdf()
+    out_dir.parent.mkdir(parents=True, exist_ok=True)
+    # два оператора могут открыть один и тот же черновик одновременно
+    tmp = Path(tempfile.mkdtemp(dir=out_dir.parent))
+    try:
+        _write_files(pdf, tmp)
+        os.replace(tmp, out_dir)
+    except OSError:
+        if not out_dir.exists():
+            raise
+    finally:
+        shutil.rmtree(tmp, ignore_errors=True)
+    return _cached_files(out_dir)
+
+
+def _write_files(pdf: bytes, out_dir: Path) -> None:
+    if pdfium is None:
+        (out_dir / "preview.pdf").write_bytes(pdf)
+        return
+    doc = pdfium.PdfDocument(pdf)
+    try:
+        scale = preview_dpi() / POINTS_PER_INCH
+        for i, page in enumerate(doc, start=1):
+            page.render(scale=scale).to_pil().save(out_dir / f"page-{i:03d}.png", optimize=True)
+    finally:
+        doc.close()
+
@@ -0,0 +1,240 @@
+# apps/passports/qr.py
+"""
+QR-код паспорта (+ вертикальная подпись с новым номером) и штрих-код.
+
+PNG (qr_image/barcode_image) — для скачивания и публичной карточки; в PDF
+вставляются SVG (build_qr_svg/build_barcode_svg): вектор не размывается при
+масштабировании и не декодируется WeasyPrint.
+
+Шрифты подписи кэшируются на процесс по (путь, размер); размер подписи
+подбирается двоичным поиском вместо перебора по 1 pt. Матрица модулей
+рисуется сразу в границах асимметричной quiet-zone (QR_BORDER_*): по одному
+пикселю на модуль и масштабирование NEAREST до box_size — без отрисовки QR
+целиком и последующей обрезки. PNG пишется в оттенках серого (L), а не RGB:
+картинка чёрно-белая, пиксели те же, кодирование втрое дешевле. Результат
+попиксельно совпадает с прежним построением (manage.py benchmark_qr_codes это
+проверяет).
+"""
+import io
+import re
+from functools import lru_cache
+from html import escape
+
+import barcode
+import qrcode
+from barcode.writer import SVGWriter
+from django.conf import settings
+from django.utils.safestring import mark_safe
+from PIL import Image, ImageDraw, ImageFont
+from qrcode.image.svg import SvgPathImage
+
+# меньше не уменьшаем, даже если подпись не помещается
+MIN_CAPTION_SIZE = 9
+
+
+@lru_cache(maxsize=128)
+def caption_font(path: str, size: int):
+    try:
+        return ImageFont.truetype(path or "DejaVuSans.ttf", size=size)
+    except Exception:
+        return ImageFont.load_default()
+
+
+def _text_wh(font, text: str) -> tuple[int, int]:
+    bbox = font.getbbox(text)
+    return bbox[2] - bbox[0], bbox[3] - bbox[1]
+
+
+def fit_caption_size(text: str, start: int, max_w: int, max_h: int, font_path: str = "") -> int:
+    """
+    Наибольший размер шрифта <= start, при котором подпись (w, h с паддингами
+    уже вычтенными из max_*) помещается; не меньше MIN_CAPTION_SIZE.
+    """
+    def fits(size):
+        tw, th = _text_wh(caption_font(font_path, size), text)
+        return tw <= max_h and th <= max_w
+
+    if start <= MIN_CAPTION_SIZE or fits(start):
+        return start
+    best, lo, hi = MIN_CAPTION_SIZE, MIN_CAPTION_SIZE + 1, start - 1
+    while lo <= hi:
+        mid = (lo + hi) // 2
+        if fits(mid):
+            best, lo = mid, mid + 1
+        else:
+            hi = mid - 1
+    return best
+
+
+def _make_qr(data: str):
+    box_size = int(getattr(settings, "QR_BOX_SIZE", 10))  # размер модуля
+    border = int(getattr(settings, "QR_BORDER", 2))  # базовая quiet-zone (модули)
+
+    qr = qrcode.QRCode(version=None, box_size=box_size, border=border)
+    qr.add_data(data)
+    qr.make(fit=True)
+
+    # сколько модулей убрать с каждой стороны (расширять рамку не умеем)
+    cut = {}
+    for side in ("LEFT", "TOP", "RIGHT", "BOTTOM"):
+        keep = int(getattr(settings, f"QR_BORDER_{side}", None) or border)
+        cut[side] = max(0, border - keep)
+    return qr, cut
+
+
+def qr_image(data: str) -> Image.Image:
+    """QR (оттенки серого, L) с quiet-zone QR_BORDER, урезанной по сторонам до QR_BORDER_LEFT/TOP/RIGHT/BOTTOM."""
+    qr, cut = _make_qr(data)
+    matrix = qr.get_matrix()  # уже с рамкой border
+
+    n = len(matrix)
+    rows = matrix[cut["TOP"]:n - cut["BOTTOM"]]
+    cols = n - cut["LEFT"] - cut["RIGHT"]
+    pixels = bytes(0 if dark else 255 for row in rows for dark in row[cut["LEFT"]:n - cut["RIGHT"]])
+    img = Image.frombytes("L", (cols, len(rows)), pixels)
+    return img.resize((cols * qr.box_size, len(rows) * qr.box_size), Image.Resampling.NEAREST)
+
+
+def _caption_font(text: str, qr_w: int, qr_h: int):
+    """Шрифт подписи наибольшего размера, при котором лента помещается рядом с QR."""
+    # внутренние паддинги текста (внутри «ленты» до поворота)
+    pad_x_left = int(getattr(settings, "QR_TEXT_PAD_X_LEFT", 2))
+    pad_x_right = int(getattr(settings, "QR_TEXT_PAD_X_RIGHT", 0))
+    pad_y = int(getattr(settings, "QR_TEXT_PAD_Y", 2))
+    # максимально допустимая ширина ленты (после поворота), в долях ширины QR
+    strip_max_ratio = float(getattr(settings, "QR_TEXT_STRIP_MAX", 0.22))
+    font_path = str(getattr(settings, "QR_TEXT_FONT_PATH", None) or "")
+
+    max_strip_w = max(1, int(qr_w * strip_max_ratio))
+    max_rot_h = max(1, qr_h - 2 * pad_y)
+
+    # после поворота: высота ~ tw + 2*pad_y; ширина ~ th + pad_x_left + pad_x_right
+    size = fit_caption_size(
+        text, int(qr_h * 0.14),
+        max_w=max_strip_w - pad_x_left - pad_x_right, max_h=max_rot_h - 2 * pad_y,
+        font_path=font_path,
+    )
+    return caption_font(font_path, size)
+
+
+def caption_strip(text: str, qr_w: int, qr_h: int) -> Image.Image:
+    """Повёрнутая подпись (RGBA, прозрачные края обрезаны) для ленты слева от QR."""
+    pad_x_left = int(getattr(settings, "QR_TEXT_PAD_X_LEFT", 2))
+    pad_x_right = int(getattr(settings, "QR_TEXT_PAD_X_RIGHT", 0))
+    pad_y = int(getattr(settings, "QR_TEXT_PAD_Y", 2))
+    font = _caption_font(text, qr_w, qr_h)
+    tw, th = _text_wh(font, text)
+
+    # рисуем горизонтально -> поворачиваем
+    text_img = Image.new("RGBA", (tw + pad_x_left + pad_x_right, th + 2 * pad_y), (255, 255, 255, 0))
+    ImageDraw.Draw(text_img).text((pad_x_left, pad_y), text, fill=(0, 0, 0, 255), font=font)
+
+    text_rot = text_img.rotate(_rotate_deg(), expand=True, resample=Image.BICUBIC)
+
+    # авто-обрезка прозрачных краёв
+    bbox = text_rot.getbbox()
+    return text_rot.crop(bbox) if bbox else text_rot
+
+
+def _rotate_deg() -> int:
+    return int(getattr(settings, "QR_TEXT_ROTATE", 90))  # 90 снизу-вверх; 270 сверху-вниз
+
+
+def _strip_offsets() -> tuple[int, int]:
+    """Внешний левый отступ всей ленты и зазор между лентой и самим QR."""
+    return (
+        int(getattr(settings, "QR_STRIP_LEFT_OUTER_PAD", 4)),
+        int(getattr(settings, "QR_GAP_BETWEEN", 0)),
+    )
+
+
+def build_qr_png(data: str, caption: str | None = None) -> bytes:
+    """PNG: QR по data; если caption не None — слева вертикальная подпись."""
+    qr_img = qr_image(data)
+    if caption is None:
+        buf = io.BytesIO()
+        qr_img.save(buf, format="PNG")
+        return buf.getvalue()
+
+    qr_w, qr_h = qr_img.size
+    strip = caption_strip(caption, qr_w, qr_h)
+
+    outer_left_pad, gap_between = _strip_offsets()
+
+    canvas = Image.new("L", (outer_left_pad + strip.width + gap_between + qr_w, qr_h), "white")
+    canvas.paste(strip.convert("L"), (outer_left_pad, max(0, (qr_h - strip.height) // 2)))
+    canvas.paste(qr_img, (outer_left_pad + strip.width + gap_between, 0))
+
+    buf = io.BytesIO()
+    canvas.save(buf, format="PNG")
+    return buf.getvalue()
+
+
+# --- SVG для PDF: вектор вставляется в HTML как есть, WeasyPrint не декодирует PNG ---
+
+CAPTION_FONT_FAMILY = "DejaVuSansPassport, DejaVu Sans, sans-serif"
+
+
+@lru_cache(maxsize=1024)
+def build_qr_svg(data: str, caption: str | None = None) -> str:
+    """
+    Тот же QR и подпись, что build_qr_png, но <svg> для вставки в HTML.
+    Единица viewBox — пиксель PNG, так что пропорции и размер шрифта подписи
+    совпадают; размер на странице задаёт CSS.
+    """
+    qr, cut = _make_qr(data)
+    box_size = qr.box_size
+    n = qr.modules_count + 2 * qr.border
+    qr_w = (n - cut["LEFT"] - cut["RIGHT"]) * box_size
+    qr_h = (n - cut["TOP"] - cut["BOTTOM"]) * box_size
+    qr.box_size = 10  # у SvgPathImage 10 = 1 единица: координаты пути — в модулях
+    path = qr.make_image(image_factory=SvgPathImage).path.get("d")
+
+    parts, x_qr = [], 0
+    if caption is not None:
+        font = _caption_font(caption, qr_w, qr_h)
+        x0, y0, x1, y1 = font.getbbox(caption, anchor="ls")
+        outer_left_pad, gap_between = _strip_offsets()
+        strip_w = y1 - y0  # после поворота на 90/270 ширина ленты — высота текста
+        cx, cy = outer_left_pad + strip_w / 2, qr_h / 2
+        # PIL поворачивает против часовой, SVG — по часовой
+        parts.append(
+            f'<text x="{cx - (x0 + x1) / 2:g}" y="{cy - (y0 + y1) / 2:g}" '
+            f'transform="rotate({-_rotate_deg() % 360} {cx:g} {cy:g})" '
+            f'font-family="{escape(CAPTION_FONT_FAMILY)}" font-size="{getattr(font, "size", 10)}" '
+            f'fill="#000">{escape(caption)}</text>'
+        )
+        x_qr = outer_left_pad + strip_w + gap_between
+    parts.append(
+        f'<path transform="translate({x_qr} 0) scale({box_size}) translate({-cut["LEFT"]} {-cut["TOP"]})" '
+        f'd="{path}" fill="#000"/>'
+    )
+    return mark_safe(
+        f'<svg xmlns="http://www.w3.org/2000/svg" viewBox="0 0 {x_qr + qr_w} {qr_h}">'
+        f'<rect width="100%" height="100%" fill="#fff"/>{"".join(parts)}</svg>'
+    )
+
+
+_SVG_SIZE_RE = re.compile(r'<svg([^>]*?) width="([\d.]+)mm" height="([\d.]+)mm"')
+
+
+@lru_cache(maxsize=1024)
+def build_barcode_svg(value: str) -> str:
+    """
+    Code128 через SVGWriter python-barcode (те же опции, что у PNG) как <svg>
+    для вставки в HTML: без XML-пролога, с viewBox — чтобы масштабировался по CSS.
+    """
+    if not value:
+        return ""
+    writer = SVGWriter()
+    writer.with_doctype = False
+    svg = barcode.Code128(value, writer=writer).render().decode("utf-8")
+    svg = svg[svg.index("<svg"):]
+    # размеры в мм -> viewBox в px (1 мм = 96/25.4 px, так считают и координаты внутри)
+    return mark_safe(_SVG_SIZE_RE.sub(
+        lambda m: '<svg{} width="{}mm" height="{}mm" viewBox="0 0 {:.3f} {:.3f}"'.format(
+            m.group(1), m.group(2), m.group(3),
+            float(m.group(2)) * 96 / 25.4, float(m.group(3)) * 96 / 25.4,
+        ),
+        svg, count=1,
+    ))
@@ -0,0 +1,165 @@
+# apps/passports/rollup.py
+"""
+Предагрегированная статистика реестра для дашборда (RegistryStat,
+RegistryOwnerStat) вместо агрегатов по соединению паспорт⋈лошадь⋈владелец
+на каждый показ страницы.
+
+Каждый паспорт засчитан ровно в одну строку куба и (если у лошади есть
+владелец) в одну строку рейтинга владельцев; куда именно — помнит
+RegistryStatMember. refresh(ids) одним запросом считает текущие ключи
+паспортов и переносит единицы между строками только там, где ключ
+изменился, так что лишний refresh ничего не стоит, кроме чтения.
+
+Сигналы (signals.py) ставят паспорта в schedule() при сохранении и
+удалении паспорта, лошади, владельца, организации, при удалении физлица и
+региона; пересчёт — после коммита транзакции (откат ничего не меняет).
+queryset.update()/bulk_update() сигналов не рассылают: после них
+schedule(ids) вызывается явно. Если таблицы всё же разошлись с реестром —
+manage.py rebuild_registry_stats.
+"""
+from collections import Counter
+
+from django.db import transaction
+from django.db.models import F
+
+from .models import Passport, RegistryOwnerStat, RegistryStat, RegistryStatMember
+
+DIMENSIONS = ("status", "breed_id", "region_id", "horse_type", "owner_kind", "issue_month")
+
+KEY_FIELDS = (
+    "pk", "status", "issue_date", "horse__breed_id", "horse__place_of_birth_id", "horse__horse_type",
+    "horse__owner_current__person_id", "horse__owner_current__organization_id",
+    "horse__owner_current__organization__org_type",
+)
+
+
+def passport_keys(row) -> tuple[dict, str]:
+    """Строка values_list(*KEY_FIELDS) без pk -> (измерения куба, ключ владельца)."""
+    status, issue_date, breed_id, region_id, horse_type, person_id, org_id, org_type = row
+    if person_id:
+        kind, party_id = "PERSON", person_id
+    elif org_id:
+        kind, party_id = org_type, org_id
+    else:
+        kind, party_id = "", None
+    dims = {
+        "status": status,
+        "breed_id": breed_id,
+        "region_id": region_id,
+        "horse_type": horse_type or "",
+        "owner_kind": kind,
+        "issue_month": issue_date.replace(day=1) if issue_date else None,
+    }
+    return dims, f"{kind}:{party_id}" if party_id else ""
+
+
+def cube_key(dims: dict) -> str:
+    return "|".join("" if dims[d] is None else str(dims[d]) for d in DIMENSIONS)
+
+
+def schedule(passport_ids):
+    """Пересчитать статистику паспортов после коммита текущей транзакции (вне транзакции — сразу)."""
+    ids = set(passport_ids)
+    if ids:
+        transaction.on_commit(lambda: refresh(ids))
+
+
+def refresh(passport_ids, chunk_size: int = 1000):
+    """Перенести паспорта в строки статистики по их текущим данным (удалённые — вычесть)."""
+    ids = sorted(set(passport_ids))
+    for i in range(0, len(ids), chunk_size):
+        _refresh_chunk(ids[i:i + chunk_size])
+
+
+def _refresh_chunk(ids):
+    with transaction.atomic():
+        members = {m.passport_id: m for m in RegistryStatMember.objects.select_for_update().filter(passport_id__in=ids)}
+        current, dims_by_key = {}, {}
+        for pk, *row in Passport.objects.filter(pk__in=ids).values_list(*KEY_FIELDS):
+            dims, owner_key = passport_keys(row)
+            key = cube_key(dims)
+            dims_by_key[key] = dims
+            current[pk] = (key, owner_key)
+
+        cube, owners = Counter(), Counter()
+        created, changed, gone = [], [], []
+        for pk in ids:
+            m, keys = members.get(pk), current.get(pk)
+            if m is not None:
+                if keys == (m.cube_key, m.owner_key):
+                    continue
+                cube[m.cube_key] -= 1
+                owners[m.owner_key] -= 1
+            if keys is None:
+                if m is not None:
+                    gone.append(pk)
+                continue
+            cube[keys[0]] += 1
+            owners[keys[1]] += 1
+            if m is None:
+                created.append(RegistryStatMember(passport_id=pk, cube_key=keys[0], owner_key=keys[1]))
+            else:
+                m.cube_key, m.owner_key = keys
+                changed.append(m)
+
+        RegistryStatMember.objects.filter(passport_id__in=gone).delete()
+        RegistryStatMember.objects.bulk_update(changed, ["cube_key", "owner_key"])
+        RegistryStatMember.objects.bulk_create(created)
+
+        for key, delta in cube.items():
+            _add(RegistryStat.objects.filter(key=key), delta, lambda: {"key": key, **dims_by_key[key]})
+        for key, delta in owners.items():
+            if key:
+                kind, party_id = key.split(":")
+                _add(RegistryOwnerStat.objects.filter(kind=kind, party_id=party_id), delta,
+                     lambda: {"kind": kind, "party_id": party_id})
+
+
+def _add(row_qs, delta: int, create_kwargs):
+    if not delta:
+        return
+    if row_qs.update(count=F("count") + delta):
+        if delta < 0:
+            row_qs.filter(count=0).delete()  # куб не копит пустые сочетания
+        return
+    if delta > 0:  # сочетание встретилось впервые
+        row_qs.model.objects.get_or_create(**create_kwargs())
+        row_qs.update(count=F("count") + delta)
+
+
+def rebuild(chunk_size: int = 5000) -> tuple[int, int, int]:
+    """
+    Полный пересчёт за один проход по паспортам (учёт — пачками
+    bulk_create). Возвращает (строк куба, владельцев, паспортов).
+    """
+    with transaction.atomic():
+        RegistryStat.objects.all().delete()
+        RegistryOwnerStat.objects.all().delete()
+        RegistryStatMember.objects.all().delete()
+
+        cube, owners = Counter(), Counter()
+        dims_by_key = {}
+        batch = []
+        rows = Passport.objects.order_by().values_list(*KEY_FIELDS).iterator(chunk_size=chunk_size)
+        for pk, *row in rows:
+            dims, owner_key = passport_keys(row)
+            key = cube_key(dims)
+            dims_by_key[key] = dims
+            cube[key] += 1
+            if owner_key:
+                owners[owner_key] += 1
+            batch.append(RegistryStatMember(passport_id=pk, cube_key=key, owner_key=owner_key))
+            if len(batch) >= chunk_size:
+                RegistryStatMember.objects.bulk_create(batch)
+                batch = []
+        RegistryStatMember.objects.bulk_create(batch)
+
+        RegistryStat.objects.bulk_create(
+            RegistryStat(key=key, count=count, **dims_by_key[key]) for key, count in cube.items()
+        )
+        RegistryOwnerStat.objects.bulk_create(
+            RegistryOwnerStat(kind=key.split(":")[0], party_id=int(key.split(":")[1]), count=count)
+            for key, count in owners.items()
+        )
+    return len(cube), len(owners), sum(cube.values())
+
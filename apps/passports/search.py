@@ -0,0 +1,158 @@
+# apps/passports/search.py
+"""
+Единый поиск по реестру: одна строка PassportSearch на паспорт с токенами
+номера, старого номера, клички, регистрационного номера, микрочипа и тавро
+(Offspring.brand_no) лошади, ФИО/наименования владельца — вместо OR из
+icontains по соединению паспорт⋈лошадь⋈владелец в списке, админке и
+автодополнении.
+
+Токены — слова в нижнем регистре (ё = е); у составных номеров
+("UZ-JIZ-2024-000123") ещё и слитная форма, так что находится и «jiz2024».
+Каждое слово запроса — префикс какого-нибудь токена строки (все слова — И).
+На PostgreSQL LIKE '% слово%' ускоряет GIN-индекс pg_trgm по tokens. На
+остальных БД индекса под такой LIKE нет: это полный просмотр PassportSearch,
+от старого поиска он отличается только отсутствием соединений и OR.
+
+Строки обновляют сигналы (signals.py) после коммита, как и статистику
+дашборда. Паспорта без строки (первое развёртывание, импорт в обход
+сигналов) дозаполняет backfill() после каждого migrate (post_migrate);
+после правок существующих паспортов в обход ORM — manage.py
+rebuild_search_index.
+"""
+import re
+
+from django.db import connection, transaction
+from django.db.models import Q
+
+from apps.horses.models import Offspring
+from .models import Passport, PassportSearch
+
+MAX_TERMS = 6
+TRGM_INDEX = "passports_search_tokens_trgm"
+
+FIELDS = (
+    "pk", "number", "old_passport_number", "horse__name", "horse__registry_no", "horse__microchip",
+    "horse__owner_current__person__last_name", "horse__owner_current__person__first_name",
+    "horse__owner_current__person__middle_name", "horse__owner_current__organization__name",
+)
+
+_WORD_RE = re.compile(r"\w+")
+
+
+def words(value) -> list[str]:
+    return _WORD_RE.findall(str(value or "").lower().replace("ё", "е"))
+
+
+def passport_entry(row, brands=()) -> tuple[str, str]:
+    """Строка values_list(*FIELDS) без pk и тавро лошади -> (токены, подпись)."""
+    number, old_number, name, registry_no, microchip, last, first, middle, org = row
+    tokens = []
+    for value in (number, old_number, registry_no, *brands):
+        parts = words(value)
+        tokens += parts
+        if len(parts) > 1:
+            tokens.append("".join(parts))
+    for value in (name, microchip, last, first, middle, org):
+        tokens += words(value)
+    unique = dict.fromkeys(tokens)  # порядок сохраняем, повторы — нет
+    label = " — ".join(v for v in (number or old_number, name, registry_no) if v)
+    return f" {' '.join(unique)} ", label[:255]
+
+
+def terms(query: str) -> list[str]:
+    return list(dict.fromkeys(words(query)))[:MAX_TERMS]
+
+
+def matching(query: str):
+    """PassportSearch, подходящие под запрос (пустой запрос — ничего)."""
+    found = terms(query)
+    if not found:
+        return PassportSearch.objects.none()
+    condition = Q()
+    for term in found:
+        condition &= Q(tokens__contains=f" {term}")
+    return PassportSearch.objects.filter(condition)
+
+
+def looks_like_microchip(query: str) -> bool:
+    """Только цифры (с пробелами/дефисами сканера): ищем ещё и по части микрочипа."""
+    return bool(re.fullmatch(r"[\d\s-]+", query or "")) and any(ch.isdigit() for ch in query)
+
+
+def _brands(passport_ids) -> dict:
+    """{pk паспорта: [тавро лошади]} одним запросом (у лошади может быть несколько записей Offspring)."""
+    out = {}
+    rows = (Offspring.objects.filter(horse__passport__in=passport_ids).exclude(brand_no="")
+            .values_list("horse__passport", "brand_no"))
+    for pk, brand in rows:
+        out.setdefault(pk, []).append(brand)
+    return out
+
+
+def schedule(passport_ids):
+    """Обновить строки паспортов после коммита текущей транзакции (вне транзакции — сразу)."""
+    ids = set(passport_ids)
+    if ids:
+        transaction.on_commit(lambda: refresh(ids))
+
+
+def refresh(passport_ids, chunk_size: int = 1000):
+    ids = sorted(set(passport_ids))
+    for i in range(0, len(ids), chunk_size):
+        chunk = ids[i:i + chunk_size]
+        with transaction.atomic():
+            brands = _brands(chunk)
+            rows = {
+                pk: passport_entry(row, brands.get(pk, ()))
+                for pk, *row in Passport.objects.filter(pk__in=chunk).values_list(*FIELDS)
+            }
+            existing = PassportSearch.objects.select_for_update().in_bulk(chunk)
+            changed, created = [], []
+            for pk, (tokens, label) in rows.items():
+                entry = existing.get(pk)
+                if entry is None:
+                    created.append(PassportSearch(passport_id=pk, tokens=tokens, label=label))
+                elif (entry.tokens, entry.label) != (tokens, label):
+                    entry.tokens, entry.label = tokens, label
+                    changed.append(entry)
+            PassportSearch.objects.bulk_update(changed, ["tokens", "label"])
+            PassportSearch.objects.bulk_create(created)
+
+
+def backfill(chunk_size: int = 1000) -> int:
+    """Строки для паспортов, у которых их нет (уже заполненный индекс — один запрос). Возвращает число."""
+    missing = list(Passport.objects.filter(search_entry__isnull=True).order_by("pk").values_list("pk", flat=True))
+    if missing:
+        refresh(missing, chunk_size)
+        ensure_trgm_index()
+    return len(missing)
+
+
+def rebuild(chunk_size: int = 5000) -> int:
+    """Полное перезаполнение индекса; на PostgreSQL — ещё и GIN-индекс pg_trgm. Возвращает число строк."""
+    with transaction.atomic():
+        PassportSearch.objects.all().delete()
+        total, last_pk = 0, 0
+        rows = Passport.objects.order_by("pk").values_list(*FIELDS)
+        while chunk := list(rows.filter(pk__gt=last_pk)[:chunk_size]):
+            last_pk = chunk[-1][0]
+            brands = _brands([row[0] for row in chunk])
+            PassportSearch.objects.bulk_create(
+                PassportSearch(passport_id=pk, tokens=tokens, label=label)
+                for pk, *row in chunk
+                for tokens, label in [passport_entry(row, brands.get(pk, ()))]
+            )
+            total += len(chunk)
+    ensure_trgm_index()
+    return total
+
+
+def ensure_trgm_index():
+    """PostgreSQL: GIN-индекс pg_trgm по tokens (если его ещё нет) и свежая статистика таблицы."""
+    if connection.vendor != "postgresql":
+        return
+    table = connection.ops.quote_name(PassportSearch._meta.db_table)
+    with connection.cursor() as cursor:
+        cursor.execute("CREATE EXTENSION IF NOT EXISTS pg_trgm")
+        cursor.execute(f"CREATE INDEX IF NOT EXISTS {TRGM_INDEX} ON {table} USING gin (tokens gin_trgm_ops)")
+        cursor.execute(f"ANALYZE {table}")
@@ -0,0 +1,58 @@
+# apps/passports/section_cache.py
+"""
+Горячий кэш свёрстанных разделов паспорта в памяти процесса (см. engine.py).
+
+Ключ — (версии шаблонов/статики, раздел, хэш данных раздела), значение —
+{номер страницы: weasyprint Page}. Page — дерево вёрстки со ссылками на
+шрифты и cairo-объекты: не сериализуется, поэтому кэш живёт только в
+процессе и пропадает при его перезапуске (--max-renders в issue_passports,
+перезапуск веб-воркера). Попадание бывает, когда тот же паспорт
+перевёрстывается в том же процессе вскоре после прошлого рендера:
+предпросмотр -> выпуск, правка -> переоформление в долгоживущем
+run_render_worker. Размер — PASSPORT_PDF_SECTION_CACHE разделов (около 12 на
+паспорт; страница раздела с фото — порядка мегабайта), вытеснение LRU.
+Доступ под блокировкой: движок общий для потоков процесса.
+"""
+import threading
+from collections import OrderedDict
+
+from django.conf import settings
+
+
+class SectionCache:
+    def __init__(self):
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def limit() -> int:
+        return int(getattr(settings, "PASSPORT_PDF_SECTION_CACHE", 256) or 0)
+
+    def __contains__(self, key) -> bool:
+        with self._lock:
+            return key in self._entries
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._entries)
+
+    def get(self, key) -> dict | None:
+        with self._lock:
+            pages = self._entries.get(key)
+            if pages is not None:
+                self._entries.move_to_end(key)
+            return pages
+
+    def put(self, key, pages: dict):
+        limit = self.limit()
+        if limit <= 0:
+            return
+        with self._lock:
+            self._entries[key] = pages
+            self._entries.move_to_end(key)
+            while len(self._entries) > limit:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
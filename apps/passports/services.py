@@ -1,13 +1,22 @@
 # services.py
-from django.template.loader import get_template
 from django.conf import settings
 from django.contrib.staticfiles import finders
 from django.templatetags.static import static
-from weasyprint import HTML
+import tempfile
 from pathlib import Path
 from django.core.files.base import File
 from datetime import date
-from apps.horses.models import Horse, Offspring, HorseBonitation, RealOffspring
+from django.db.models import Prefetch, prefetch_related_objects
+from apps.horses.models import (
+    Horse, Offspring, HorseBonitation, RealOffspring,
+    DiagnosticCheck, SportAchievement, ExhibitionEntry, Ownership, IdentificationEvent,
+)
+from apps.common.instrumentation import RenderTrace
+from apps.vet.models import Vaccination, LabTest
+from .engine import get_engine
+from .fingerprint import passport_fingerprint, section_hashes
+from .models import Passport
+from .qr import build_barcode_svg
 
 def _fmt_country(r):
     return getattr(r, "name", "") if r else ""
@@ -147,9 +156,8 @@ def _vaccination_rows(passport, influenza: bool):
     influenza=False -> все остальные (в т.ч. старые записи с None)
     """
     horse = passport.horse
-    qs = horse.vaccinations.select_related("vaccine", "veterinarian").order_by("date")
     rows = []
-    for rec in qs:
+    for rec in horse.vaccinations.all():  # порядок и join'ы — из PassportRenderContext.PREFETCH
         is_flu = bool(rec.vaccine_for_grip)  # None -> False
         if is_flu != influenza:
             continue
@@ -175,14 +183,11 @@ def _lab_tests_first_page(passport):
     """
     horse = passport.horse
     qs = getattr(horse, "lab_tests", None)
-    if not hasattr(qs, "select_related"):
+    if not hasattr(qs, "all"):
         return []
 
-    # дата по возрастанию (можно поменять на '-date' если нужно сверху новые)
-    qs = qs.select_related("test_type", "veterinarian").order_by("date")
-
     rows = []
-    for rec in qs:
+    for rec in qs.all():  # дата по возрастанию — см. PassportRenderContext.PREFETCH
         # Наименование и адрес лаборатории -> одна строка
         if rec.address_lab:
             lab = rec.address_lab
@@ -233,13 +238,11 @@ def _diag_controls_first_page(passport):
     """
     horse = passport.horse
     qs = getattr(horse, "diagnostics", None)
-    if hasattr(qs, "select_related"):
-        qs = qs.select_related("veterinarian").order_by("date")
-    else:
+    if not hasattr(qs, "all"):
         return []
 
     rows = []
-    for rec in qs:
+    for rec in qs.all():
         vet = getattr(rec, "veterinarian", None)
         rows.append({
             "date": getattr(rec, "date", None),
@@ -269,19 +272,8 @@ def _achievements_first_page(passport):
     if not hasattr(qs, "all"):
         return []
 
-    # сортировка по дате/году
-    if hasattr(qs, "order_by"):
-        # если у модели есть 'date' — отсортируем по ней, иначе по 'year'
-        try:
-            qs = qs.order_by("-date")
-        except Exception:
-            try:
-                qs = qs.order_by("-year")
-            except Exception:
-                pass
-
     rows = []
-    for rec in qs:
+    for rec in qs.all():  # свежие сверху — см. PassportRenderContext.PREFETCH
         # year
         year = getattr(rec, "year", None)
         if not year:
@@ -319,12 +311,35 @@ def _exhibitions_first_page(passport):
     if not hasattr(qs, "all"):
         return []
 
-    qs = qs.order_by("-year", "place")  # свежие сверху
-    rows = [{"year": e.year, "place": e.place or "", "info": e.info or ""} for e in qs]
+    # свежие сверху — см. PassportRenderContext.PREFETCH
+    rows = [{"year": e.year, "place": e.place or "", "info": e.info or ""} for e in qs.all()]
     return rows
 
 # -------------------- Offspring helpers --------------------
 
+def _latest_offspring(horse):
+    """Последняя (по id) запись Offspring лошади; horse.offspring отсортирован по '-id'."""
+    rows = list(horse.offspring.all())
+    return rows[0] if rows else None
+
+def _offspring_by_immunity(horse):
+    """
+    Запись Offspring со свежей экспертизой иммунитета: '-immunity_exp_date', '-id'.
+    Пустая дата считается «самой свежей» — как NULLS FIRST в PostgreSQL.
+    """
+    rows = list(horse.offspring.all())
+    if not rows:
+        return None
+    return max(rows, key=lambda o: (o.immunity_exp_date is None, o.immunity_exp_date or date.min, o.id))
+
+def _pedigree_nodes(horse):
+    """Узлы RealOffspring лошади (пусто, если дерево ещё не заведено)."""
+    try:
+        pedigree = horse.pedigree
+    except RealOffspring.DoesNotExist:
+        return []
+    return list(pedigree.nodes.all())
+
 def _offspring_rows_for_passport(passport):
     """
     Страница «Приплод» (табличка на 7 строк).
@@ -337,19 +352,15 @@ def _offspring_rows_for_passport(passport):
 
     # --- родители из схемы (RealOffspringNode) ---
     sire_name = sire_breed = dam_name = dam_breed = ""
-    try:
-        pedigree = RealOffspring.objects.get(horse=h)
-        nodes = {n.relation: n for n in pedigree.nodes.all()}
-        sire = nodes.get("SIRE")
-        dam  = nodes.get("DAM")
-        if sire:
-            sire_name  = sire.name or ""
-            sire_breed = sire.breed or ""
-        if dam:
-            dam_name  = dam.name or ""
-            dam_breed = dam.breed or ""
-    except RealOffspring.DoesNotExist:
-        pass
+    nodes = {n.relation: n for n in _pedigree_nodes(h)}
+    sire = nodes.get("SIRE")
+    dam  = nodes.get("DAM")
+    if sire:
+        sire_name  = sire.name or ""
+        sire_breed = sire.breed or ""
+    if dam:
+        dam_name  = dam.name or ""
+        dam_breed = dam.breed or ""
 
     # --- признаки самой лошади ---
     # масть
@@ -358,13 +369,8 @@ def _offspring_rows_for_passport(passport):
     # пол
     sex = h.get_sex_display() if hasattr(h, "get_sex_display") else (h.sex or "")
     # тавро № из вашей модели Offspring (там оно хранится для самой лошади)
-    brand = ""
-    try:
-        o = h.offspring.order_by("-id").first()
-        if o and o.brand_no:
-            brand = o.brand_no
-    except Exception:
-        pass
+    o = _latest_offspring(h)
+    brand = o.brand_no if o and o.brand_no else ""
     # год рождения
     birth_year = h.birth_date.year if getattr(h, "birth_date", None) else ""
 
@@ -389,12 +395,11 @@ def _ownership_rows_for_passport(passport):
     """
     horse = passport.horse
     qs = getattr(horse, "ownerships", None)
-    if not hasattr(qs, "select_related"):
+    if not hasattr(qs, "all"):
         return []
 
-    qs = qs.select_related("owner").order_by("start_date")
     rows = []
-    for rec in qs:
+    for rec in qs.all():
         rows.append({
             "date": getattr(rec, "start_date", None),
             "owner": _owner_full_address(getattr(rec, "owner", None)),
@@ -417,11 +422,7 @@ def _parentage_ctx(passport):
     sex_display = h.get_sex_display() if hasattr(h, "get_sex_display") else getattr(h, "sex", "")
 
     # новая модель Offspring хранит реквизиты лошади
-    o = None
-    try:
-        o = Offspring.objects.filter(horse=h).order_by("-immunity_exp_date", "-id").first()
-    except Exception:
-        o = None
+    o = _offspring_by_immunity(h)
 
     return {
         "place_of_birth": place,
@@ -449,9 +450,8 @@ def _chip_rows_for_passport(passport, rows_per_page=5):
     qs = getattr(horse, "ident_events", None)
     rows = []
 
-    if hasattr(qs, "order_by"):
-        qs = qs.order_by("date")
-        for ev in qs:
+    if hasattr(qs, "all"):
+        for ev in qs.all():
             rows.append({
                 "date": ev.date,
                 "code": ev.microchip or "",
@@ -516,7 +516,6 @@ def _pedigree_tree_ctx(passport):
       nodes: 14 узлов в фиксированном порядке
     """
     h = passport.horse
-    pedigree, _ = RealOffspring.objects.get_or_create(horse=h)  # чтобы было что редактировать в админке
 
     # из Horse
     name = getattr(h, "name", "") or ""
@@ -524,13 +523,8 @@ def _pedigree_tree_ctx(passport):
     breed = (getattr(breed_obj, "name", None) or str(breed_obj or ""))
 
     # номер тавро у вас хранится в Offspring (родословная самой лошади)
-    brand = ""
-    try:
-        off = h.offspring.order_by("-id").first()
-        if off and off.brand_no:
-            brand = off.brand_no
-    except Exception:
-        pass
+    off = _latest_offspring(h)
+    brand = off.brand_no if off and off.brand_no else ""
 
     self_block = {"name": name, "brand": brand, "breed": breed}
 
@@ -541,7 +535,7 @@ def _pedigree_tree_ctx(passport):
         "DAM_SIRE_SIRE", "DAM_SIRE_DAM", "DAM_DAM_SIRE", "DAM_DAM_DAM",
     ]
     by_key = {k: {"name":"", "brand":"", "breed":""} for k in order}
-    for n in pedigree.nodes.all():
+    for n in _pedigree_nodes(h):
         if n.relation in by_key:
             by_key[n.relation] = {
                 "name": n.name or "",
@@ -552,101 +546,259 @@ def _pedigree_tree_ctx(passport):
     return {"self": self_block, "nodes": nodes, "by_key": by_key}
 
 
-def render_passport_pdf(passport):
-    horse = passport.horse
-    owner_name, owner_country, owner_region_district, owner_addr = _owner_parts(getattr(horse, "owner_current", None))
-    marks = _marks_from_models(horse)
-    ctx_parentage = _parentage_ctx(passport)
-
-    VACC_ROWS_PER_PAGE = 6
-    other_rows = _vaccination_rows(passport, influenza=False)
-    vacc_other_pages = _paginate_fixed(other_rows, VACC_ROWS_PER_PAGE, pages=8)
-    flu_rows = _vaccination_rows(passport, influenza=True)
-    vacc_flu_pages = _paginate_fixed(flu_rows, VACC_ROWS_PER_PAGE, pages=8)
-
-    LAB_ROWS_PER_PAGE = 7
-    filled_labs = _lab_tests_first_page(passport)[:LAB_ROWS_PER_PAGE]
-    if len(filled_labs) < LAB_ROWS_PER_PAGE:
-        filled_labs += [None] * (LAB_ROWS_PER_PAGE - len(filled_labs))
-    empty_lab_page = [None] * LAB_ROWS_PER_PAGE
-    lab_pages = [filled_labs] + [empty_lab_page for _ in range(9)]  # 1 + 9 = 10
-
-    DIAG_ROWS_PER_PAGE = 8
-    filled_diag = _diag_controls_first_page(passport)[:DIAG_ROWS_PER_PAGE]
-    if len(filled_diag) < DIAG_ROWS_PER_PAGE:
-        filled_diag += [None] * (DIAG_ROWS_PER_PAGE - len(filled_diag))
-    empty_diag_page = [None] * DIAG_ROWS_PER_PAGE
-    diag_pages = [filled_diag] + [empty_diag_page for _ in range(4)]  # 1 + 4 = 5
-
-    ACH_ROWS_PER_PAGE = 8  # строк на лист (при необходимости подгони)
-    ach_filled = _achievements_first_page(passport)[:ACH_ROWS_PER_PAGE]
-    if len(ach_filled) < ACH_ROWS_PER_PAGE:
-        ach_filled += [None] * (ACH_ROWS_PER_PAGE - len(ach_filled))
-    ach_empty_page = [None] * ACH_ROWS_PER_PAGE
-    ach_pages = [ach_filled, ach_empty_page]  # 1 из БД + 1 пустая
-
-    EXH_ROWS_PER_PAGE = 8  # сколько строк помещается на лист
-    exh_filled = _exhibitions_first_page(passport)[:EXH_ROWS_PER_PAGE]
-    if len(exh_filled) < EXH_ROWS_PER_PAGE:
-        exh_filled += [None] * (EXH_ROWS_PER_PAGE - len(exh_filled))
-    exh_empty_page = [None] * EXH_ROWS_PER_PAGE
-    exh_pages = [exh_filled, exh_empty_page]
-
-    OFFSPRING_ROWS_PER_PAGE = 7  # под макет;
-    offspring_rows = _offspring_rows_for_passport(passport)[:OFFSPRING_ROWS_PER_PAGE]
-    if len(offspring_rows) < OFFSPRING_ROWS_PER_PAGE:
-        offspring_rows += [None] * (OFFSPRING_ROWS_PER_PAGE - len(offspring_rows))
-
-    OWN_ROWS_PER_PAGE = 6
-    ownership_rows = _ownership_rows_for_passport(passport)[:OWN_ROWS_PER_PAGE]
-    if len(ownership_rows) < OWN_ROWS_PER_PAGE:
-        ownership_rows += [None] * (OWN_ROWS_PER_PAGE - len(ownership_rows))
-
-    # ---- Chip page (1 страница) ----
-    CHIP_ROWS_PER_PAGE = 3
-    chip_rows = _chip_rows_for_passport(passport, CHIP_ROWS_PER_PAGE)
-
-    # Баркод: используем тот же, что на обложке (для microchip).
-    chip_barcode_image = getattr(passport, "barcode_image", None)
-    chip_main_code = getattr(horse, "microchip", "")
-
-    # Дата выдачи паспорта (если поле есть). Иначе оставим пусто (линия для ручной записи).
-    issue_date = getattr(passport, "issue_date", None)
-
-    bon = _bonitation_ctx(passport)
-
-    ctx = {
-        "passport": passport,
-        "horse": horse,
-        "diagram_label": _diagram_label(_age_years(getattr(horse, "birth_date", None))),
-        "diagram_image_path": _diagram_image_path(passport.horse),
-        "marks": marks,
-        "owner_full_address": _owner_full_address(getattr(horse, "owner_current", None)),
-        "owner_name": owner_name,
-        "owner_region_district": owner_region_district,
-        "owner_country": owner_country,
-        "owner_address": owner_addr,
-        "stable_address": marks.get("stable_address") or "",
-        "vacc_other_pages": vacc_other_pages,
-        "vacc_flu_pages": vacc_flu_pages,
-        "lab_pages": lab_pages,
-        "diag_pages": diag_pages,
-        "ach_pages": ach_pages,
-        "exh_pages": exh_pages,
-        "offspring_rows": offspring_rows,
-        "ownership_rows": ownership_rows,
-        "parentage": ctx_parentage,
-        "chip_rows": chip_rows,
-        "chip_barcode_image": chip_barcode_image,
-        "chip_main_code": chip_main_code,
-        "passport_issue_date": issue_date,
-        "bon": bon,
-        "pedigree": _pedigree_tree_ctx(passport),
-    }
-    html = get_template("passports/pdf/base.html").render(ctx)  # один потоковый HTML
-    out_dir = Path(settings.MEDIA_ROOT) / "passports"
-    out_dir.mkdir(parents=True, exist_ok=True)
-    pdf_path = out_dir / f"{passport.number}.pdf"
-    HTML(string=html, base_url=str(settings.BASE_DIR)).write_pdf(str(pdf_path))
-    with open(pdf_path, "rb") as f:
-        passport.pdf_file.save(pdf_path.name, File(f), save=False)
+class PassportRenderContext:
+    """
+    Всё, что нужно шаблону passports/pdf/base.html, одной схемой загрузки.
+
+    Хелперы выше читают только related-кэши лошади (horse.vaccinations.all() и т.п.),
+    поэтому после load() сборка контекста не делает ни одного запроса — и для
+    одного паспорта, и для пачки: число запросов не зависит от N.
+
+        for rc in PassportRenderContext.load(PassportRenderContext.queryset().filter(...)):
+            html = get_template("passports/pdf/base.html").render(rc.as_dict())
+    """
+
+    SELECT_RELATED = (
+        "horse",
+        "horse__breed",
+        "horse__color",
+        "horse__country_of_birth",
+        "horse__place_of_birth",
+        "horse__meas",
+        "horse__diagram",
+        "horse__pedigree",
+        "horse__owner_current__person__country",
+        "horse__owner_current__person__region",
+        "horse__owner_current__person__district",
+        "horse__owner_current__organization__region",
+        "horse__owner_current__organization__district",
+    )
+
+    @staticmethod
+    def prefetch():
+        owner_related = (
+            "owner__person__country", "owner__person__region", "owner__person__district",
+            "owner__organization__region", "owner__organization__district",
+        )
+        return [
+            Prefetch("horse__vaccinations",
+                     queryset=Vaccination.objects.select_related("vaccine", "veterinarian").order_by("date")),
+            Prefetch("horse__lab_tests",
+                     queryset=LabTest.objects.select_related("test_type", "veterinarian").order_by("date")),
+            Prefetch("horse__diagnostics",
+                     queryset=DiagnosticCheck.objects.select_related("veterinarian").order_by("date")),
+            Prefetch("horse__achievements", queryset=SportAchievement.objects.order_by("-year")),
+            Prefetch("horse__exhibitions", queryset=ExhibitionEntry.objects.order_by("-year", "place")),
+            Prefetch("horse__ownerships",
+                     queryset=Ownership.objects.select_related(*owner_related).order_by("start_date")),
+            Prefetch("horse__ident_events", queryset=IdentificationEvent.objects.order_by("date")),
+            Prefetch("horse__offspring", queryset=Offspring.objects.order_by("-id")),
+            "horse__bonitations",
+            "horse__pedigree__nodes",
+        ]
+
+    def __init__(self, passport):
+        self.passport = passport
+        self.horse = passport.horse
+
+    @classmethod
+    def queryset(cls, qs=None):
+        """Passport-queryset со схемой загрузки: select_related + prefetch."""
+        qs = Passport.objects.all() if qs is None else qs
+        return qs.select_related(*cls.SELECT_RELATED).prefetch_related(*cls.prefetch())
+
+    @classmethod
+    def load(cls, passports) -> list["PassportRenderContext"]:
+        """
+        Догружает связи для уже полученных паспортов (то, что уже в кэше, не
+        перечитывается) и возвращает контексты в том же порядке.
+        """
+        passports = list(passports)
+        prefetch_related_objects(passports, *cls.SELECT_RELATED, *cls.prefetch())
+        cls._ensure_pedigrees([p.horse for p in passports])
+        return [cls(p) for p in passports]
+
+    @staticmethod
+    def _ensure_pedigrees(horses):
+        # Пустое дерево заводим заранее, чтобы было что редактировать в админке.
+        # Одним INSERT на всю пачку; сам рендер видит его как «узлов нет».
+        missing = {}
+        for h in horses:
+            try:
+                h.pedigree
+            except RealOffspring.DoesNotExist:
+                missing[h.pk] = h
+        if missing:
+            RealOffspring.objects.bulk_create(
+                [RealOffspring(horse=h) for h in missing.values()], ignore_conflicts=True
+            )
+            # bulk_create с ignore_conflicts не возвращает pk — перечитываем,
+            # иначе в кэше лошади останется несохранённое дерево
+            for pedigree in RealOffspring.objects.filter(horse_id__in=missing).prefetch_related("nodes"):
+                pedigree.horse = missing[pedigree.horse_id]
+
+    def as_dict(self) -> dict:
+        passport, horse = self.passport, self.horse
+        owner_name, owner_country, owner_region_district, owner_addr = _owner_parts(
+            getattr(horse, "owner_current", None)
+        )
+        marks = _marks_from_models(horse)
+        ctx_parentage = _parentage_ctx(passport)
+
+        VACC_ROWS_PER_PAGE = 6
+        other_rows = _vaccination_rows(passport, influenza=False)
+        vacc_other_pages = _paginate_fixed(other_rows, VACC_ROWS_PER_PAGE, pages=8)
+        flu_rows = _vaccination_rows(passport, influenza=True)
+        vacc_flu_pages = _paginate_fixed(flu_rows, VACC_ROWS_PER_PAGE, pages=8)
+
+        LAB_ROWS_PER_PAGE = 7
+        filled_labs = _lab_tests_first_page(passport)[:LAB_ROWS_PER_PAGE]
+        if len(filled_labs) < LAB_ROWS_PER_PAGE:
+            filled_labs += [None] * (LAB_ROWS_PER_PAGE - len(filled_labs))
+        empty_lab_page = [None] * LAB_ROWS_PER_PAGE
+        lab_pages = [filled_labs] + [empty_lab_page for _ in range(9)]  # 1 + 9 = 10
+
+        DIAG_ROWS_PER_PAGE = 8
+        filled_diag = _diag_controls_first_page(passport)[:DIAG_ROWS_PER_PAGE]
+        if len(filled_diag) < DIAG_ROWS_PER_PAGE:
+            filled_diag += [None] * (DIAG_ROWS_PER_PAGE - len(filled_diag))
+        empty_diag_page = [None] * DIAG_ROWS_PER_PAGE
+        diag_pages = [filled_diag] + [empty_diag_page for _ in range(4)]  # 1 + 4 = 5
+
+        ACH_ROWS_PER_PAGE = 8  # строк на лист (при необходимости подгони)
+        ach_filled = _achievements_first_page(passport)[:ACH_ROWS_PER_PAGE]
+        if len(ach_filled) < ACH_ROWS_PER_PAGE:
+            ach_filled += [None] * (ACH_ROWS_PER_PAGE - len(ach_filled))
+        ach_empty_page = [None] * ACH_ROWS_PER_PAGE
+        ach_pages = [ach_filled, ach_empty_page]  # 1 из БД + 1 пустая
+
+        EXH_ROWS_PER_PAGE = 8  # сколько строк помещается на лист
+        exh_filled = _exhibitions_first_page(passport)[:EXH_ROWS_PER_PAGE]
+        if len(exh_filled) < EXH_ROWS_PER_PAGE:
+            exh_filled += [None] * (EXH_ROWS_PER_PAGE - len(exh_filled))
+        exh_empty_page = [None] * EXH_ROWS_PER_PAGE
+        exh_pages = [exh_filled, exh_empty_page]
+
+        OFFSPRING_ROWS_PER_PAGE = 7  # под макет;
+        offspring_rows = _offspring_rows_for_passport(passport)[:OFFSPRING_ROWS_PER_PAGE]
+        if len(offspring_rows) < OFFSPRING_ROWS_PER_PAGE:
+            offspring_rows += [None] * (OFFSPRING_ROWS_PER_PAGE - len(offspring_rows))
+
+        OWN_ROWS_PER_PAGE = 6
+        ownership_rows = _ownership_rows_for_passport(passport)[:OWN_ROWS_PER_PAGE]
+        if len(ownership_rows) < OWN_ROWS_PER_PAGE:
+            ownership_rows += [None] * (OWN_ROWS_PER_PAGE - len(ownership_rows))
+
+        # ---- Chip page (1 страница) ----
+        CHIP_ROWS_PER_PAGE = 3
+        chip_rows = _chip_rows_for_passport(passport, CHIP_ROWS_PER_PAGE)
+
+        chip_main_code = getattr(horse, "microchip", "")
+
+        # Дата выдачи паспорта (если поле есть). Иначе оставим пусто (линия для ручной записи).
+        issue_date = getattr(passport, "issue_date", None)
+
+        bon = _bonitation_ctx(passport)
+
+        return {
+            "passport": passport,
+            "horse": horse,
+            # коды в PDF — вектором; PNG остаются для скачивания и публичной карточки
+            "qr_svg": passport.qr_svg(),
+            "barcode_svg": build_barcode_svg(passport.barcode_value),
+            "diagram_label": _diagram_label(_age_years(getattr(horse, "birth_date", None))),
+            "diagram_image_path": _diagram_image_path(passport.horse),
+            "marks": marks,
+            "owner_full_address": _owner_full_address(getattr(horse, "owner_current", None)),
+            "owner_name": owner_name,
+            "owner_region_district": owner_region_district,
+            "owner_country": owner_country,
+            "owner_address": owner_addr,
+            "stable_address": marks.get("stable_address") or "",
+            "vacc_other_pages": vacc_other_pages,
+            "vacc_flu_pages": vacc_flu_pages,
+            "lab_pages": lab_pages,
+            "diag_pages": diag_pages,
+            "ach_pages": ach_pages,
+            "exh_pages": exh_pages,
+            "offspring_rows": offspring_rows,
+            "ownership_rows": ownership_rows,
+            "parentage": ctx_parentage,
+            "chip_rows": chip_rows,
+            "chip_main_code": chip_main_code,
+            "passport_issue_date": issue_date,
+            "bon": bon,
+            "pedigree": _pedigree_tree_ctx(passport),
+        }
+
+
+def _spool():
+    """Буфер под PDF: в памяти до PDF_SPOOL_MAX_SIZE, дальше — во временный файл."""
+    return tempfile.SpooledTemporaryFile(max_size=getattr(settings, "PDF_SPOOL_MAX_SIZE", 16 * 1024 * 1024))
+
+
+def open_passport_pdf(passport):
+    """
+    Рендер без сохранения (для отдачи «на лету»): буфер с PDF, позиция 0.
+    Закрывает вызывающий.
+    """
+    buf = _spool()
+    get_engine().write_passport(PassportRenderContext.load([passport])[0].as_dict(), buf)
+    buf.seek(0)
+    return buf
+
+
+def render_passport_pdf(passport, force: bool = False, stages: dict | None = None) -> bool:
+    """
+    Рендерит PDF в passport.pdf_file (save=False — сохраняет вызывающий).
+    Если данные не менялись (тот же отпечаток) и файл на месте — рендер
+    пропускается. Возвращает True, если PDF действительно перерисован.
+
+    PDF пишется один раз через storage поля: прежний passports/<number>.pdf
+    перезаписывается, а не получает копию с суффиксом (скачивается под
+    номером паспорта).
+
+    Этапы (context, fingerprint, template, images, layout, write, save)
+    замеряются RenderTrace и уходят в хуки PASSPORT_RENDER_HOOKS; если передан
+    stages (dict) — туда же кладутся их длительности в секундах.
+    """
+    with RenderTrace("pdf", passport) as trace:
+        rendered = _render_passport_pdf(passport, force, trace)
+    if stages is not None:
+        stages.update({name: rec["seconds"] for name, rec in trace.stages.items()})
+    return rendered
+
+
+def _render_passport_pdf(passport, force: bool, trace: RenderTrace) -> bool:
+    with trace.stage("context"):
+        ctx = PassportRenderContext.load([passport])[0].as_dict()
+    with trace.stage("fingerprint"):
+        sections = section_hashes(ctx)
+        fingerprint = passport_fingerprint(ctx, sections)
+    if (
+        not force
+        and passport.pdf_fingerprint == fingerprint
+        and passport.pdf_file
+        and passport.pdf_file.storage.exists(passport.pdf_file.name)
+    ):
+        return False
+
+    engine = get_engine()
+    with trace.stage("template"):
+        html = engine.passport_html(ctx, sections)
+    with trace.stage("layout"):
+        doc = engine.layout_passport(ctx, html, sections)
+
+    filename = f"{passport.number}.pdf"
+    storage = passport.pdf_file.storage
+    target = passport.pdf_file.field.generate_filename(passport, filename)
+    with _spool() as buf:
+        with trace.stage("write"):
+            doc.write_pdf(buf)
+            buf.seek(0)
+        with trace.stage("save"):
+            if storage.exists(target):  # только для хранилищ с именами по номеру
+                storage.delete(target)
+            passport.pdf_file.save(filename, File(buf), save=False)
+    passport.pdf_fingerprint = fingerprint
+    return True
@@ -1,8 +1,15 @@
 # apps/passports/signals.py
-from django.db.models.signals import post_save
+from django.db.models import F, OuterRef, Subquery
+from django.db.models.signals import post_delete, post_save, pre_delete
 from django.dispatch import receiver
-from apps.horses.models import Horse
-from .models import Passport
+from apps.common import cache
+from apps.common.models import Region
+from apps.horses.models import Horse, Offspring
+from apps.horses.signals import microchips_changed
+from apps.parties.models import Organization, Owner, Person
+from apps.vet.models import LabTest, Vaccination
+from . import rollup, search
+from .models import Passport, RenderJob
 
 @receiver(post_save, sender=Horse)
 def sync_passport_barcode_on_microchip_change(sender, instance: Horse, **kwargs):
@@ -16,7 +23,126 @@ def sync_passport_barcode_on_microchip_change(sender, instance: Horse, **kwargs)
         return
 
     if p.barcode_value != instance.microchip:
+        # значение — сразу (без save(): он сам перерисовал бы коды в запросе),
+        # картинки штрих/QR перегенерирует воркер очереди
+        Passport.objects.filter(pk=p.pk).update(barcode_value=instance.microchip)
         p.barcode_value = instance.microchip
-        # Если хранишь изображения, перегенерируем
-        p.generate_codes()
-        p.save(update_fields=["barcode_value", "barcode_image", "qr_image"])
+        RenderJob.enqueue(p, RenderJob.Kind.CODES)
+
+
+@receiver(microchips_changed, sender=Horse)
+def sync_passport_barcodes_on_bulk_microchips(sender, horse_ids, **kwargs):
+    # То же для набора лошадей: штрих-коды — одним UPDATE, перегенерация
+    # кодов — по одной задаче на паспорт
+    ids = list(
+        Passport.objects.filter(horse_id__in=horse_ids)
+        .exclude(barcode_value=F("horse__microchip"))
+        .values_list("pk", flat=True)
+    )
+    if not ids:
+        return
+    Passport.objects.filter(pk__in=ids).update(
+        barcode_value=Subquery(Horse.objects.filter(pk=OuterRef("horse_id")).values("microchip")[:1])
+    )
+    RenderJob.enqueue_many(ids, RenderJob.Kind.CODES)
+    cache.bump_on_commit()
+
+
+@receiver(microchips_changed, sender=Horse)
+def search_bulk_microchips(sender, horse_ids, **kwargs):
+    search.schedule(Passport.objects.filter(horse_id__in=horse_ids).values_list("pk", flat=True))
+
+
+# --- статистика дашборда (rollup.py): паспорта, чьи измерения могли измениться ---
+
+@receiver(post_save, sender=Passport)
+@receiver(post_delete, sender=Passport)
+def rollup_passport(sender, instance: Passport, **kwargs):
+    rollup.schedule([instance.pk])
+
+
+# через какой путь от паспорта каждая модель влияет на его строку статистики
+ROLLUP_PATHS = {
+    Horse: "horse",
+    Owner: "horse__owner_current",
+    Organization: "horse__owner_current__organization",
+    Person: "horse__owner_current__person",
+    Region: "horse__place_of_birth",
+}
+
+
+def _rollup_passport_ids(sender, instance):
+    return Passport.objects.filter(**{ROLLUP_PATHS[sender]: instance.pk}).values_list("pk", flat=True)
+
+
+def rollup_related_save(sender, instance, created=False, **kwargs):
+    if not created:  # у новой записи паспортов ещё нет
+        rollup.schedule(_rollup_passport_ids(sender, instance))
+
+
+def rollup_related_pre_delete(sender, instance, **kwargs):
+    # после удаления ссылки уже обнулены (SET_NULL) — паспорта запоминаем до
+    instance._rollup_passport_ids = list(_rollup_passport_ids(sender, instance))
+
+
+def rollup_related_post_delete(sender, instance, **kwargs):
+    rollup.schedule(getattr(instance, "_rollup_passport_ids", ()))
+
+
+# имена физлиц и регионов статистика берёт при чтении — их сохранение ключей не меняет
+for _model in (Horse, Owner, Organization):
+    post_save.connect(rollup_related_save, sender=_model, dispatch_uid=f"rollup_save_{_model.__name__}")
+# лошадь с паспортом не удалить (PROTECT); у остальных ссылки обнуляются SET_NULL
+for _model in (Owner, Organization, Person, Region):
+    pre_delete.connect(rollup_related_pre_delete, sender=_model, dispatch_uid=f"rollup_pre_delete_{_model.__name__}")
+    post_delete.connect(rollup_related_post_delete, sender=_model, dispatch_uid=f"rollup_post_delete_{_model.__name__}")
+
+
+# --- поисковый индекс (search.py): номера, лошадь, имя владельца ---
+# строка паспорта удаляется вместе с ним (CASCADE)
+
+@receiver(post_save, sender=Passport)
+def search_passport(sender, instance: Passport, **kwargs):
+    search.schedule([instance.pk])
+
+
+def search_related_save(sender, instance, created=False, **kwargs):
+    if not created:
+        search.schedule(_rollup_passport_ids(sender, instance))
+
+
+def search_related_post_delete(sender, instance, **kwargs):
+    # паспорта запомнил rollup_related_pre_delete
+    search.schedule(getattr(instance, "_rollup_passport_ids", ()))
+
+
+@receiver(post_save, sender=Offspring)
+@receiver(post_delete, sender=Offspring)
+def search_brand(sender, instance: Offspring, **kwargs):
+    # тавро лошади — в токенах её паспорта
+    search.schedule(Passport.objects.filter(horse_id=instance.horse_id).values_list("pk", flat=True))
+
+
+# в отличие от статистики, имя физлица входит в токены
+for _model in (Horse, Owner, Organization, Person):
+    post_save.connect(search_related_save, sender=_model, dispatch_uid=f"search_save_{_model.__name__}")
+for _model in (Owner, Organization, Person):
+    post_delete.connect(search_related_post_delete, sender=_model, dispatch_uid=f"search_post_delete_{_model.__name__}")
+
+
+def fill_search_index(sender, **kwargs):
+    # post_migrate (apps.py): миграции в репозитории не хранятся, поэтому
+    # паспорта, заведённые до индекса, получают строки при первом migrate
+    search.backfill()
+
+
+# --- кэш страниц реестра (apps/common/cache.py): любая правка — новое поколение ключей ---
+
+def bump_registry_cache(sender, **kwargs):
+    cache.bump_on_commit()
+
+
+# прививки и анализы показывает публичная карточка
+for _model in (Passport, Horse, Owner, Organization, Person, Vaccination, LabTest):
+    post_save.connect(bump_registry_cache, sender=_model, dispatch_uid=f"cache_save_{_model.__name__}")
+    post_delete.connect(bump_registry_cache, sender=_model, dispatch_uid=f"cache_delete_{_model.__name__}")
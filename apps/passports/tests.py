@@ -1,3 +1,421 @@
-from django.test import TestCase
+import tempfile
+from datetime import date, timedelta
+from io import StringIO
 
-# Create your tests here.
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.management import CommandError, call_command
+from django.core.management.sql import emit_post_migrate_signal
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+
+from apps.common.cache import cached
+from apps.common.models import Breed, Color, Region, Vaccine, LabTestType
+from apps.horses.models import Horse, Offspring, Ownership, RealOffspring, RealOffspringNode, IdentificationEvent
+from apps.parties.models import Organization, Owner, Person, Veterinarian
+from apps.vet.models import Vaccination, LabTest
+from .engine import PassportPdfEngine, _page_role
+from .benchmark import PROFILES, STAGES, compare_reports, run_suite
+from .fingerprint import SECTIONS, section_hashes
+from .jobs import run_job
+from . import rollup, search
+from .models import Passport, PassportSearch, RegistryOwnerStat, RegistryStat, RenderJob
+from .pagination import ORDERING, KeysetPaginator
+from .services import PassportRenderContext
+
+
+def make_passport(i: int, *, region, breed, color, vet, vaccine, test_type) -> Passport:
+    owner = Owner.objects.create(person=Person.objects.create(last_name=f"Фамилия{i}", first_name="Имя", region=region))
+    microchip = f"{i:015d}"
+    horse = Horse.objects.create(
+        name=f"Лошадь {i}", sex="M", birth_date=date(2020, 1, 1), breed=breed, color=color,
+        place_of_birth=region, microchip=microchip, owner_current=owner,
+    )
+    Vaccination.objects.create(horse=horse, date=date(2023, 1, 1), vaccine=vaccine, vaccine_for_grip=True,
+                               registration_number="R-1", veterinarian=vet)
+    LabTest.objects.create(horse=horse, date=date(2023, 2, 1), test_type=test_type, result="отр.", veterinarian=vet)
+    Offspring.objects.create(horse=horse, brand_no=f"B{i}", shb_no=f"D{i}")
+    Ownership.objects.create(horse=horse, owner=owner, start_date=date(2021, 1, 1))
+    IdentificationEvent.objects.create(horse=horse, date=date(2021, 1, 1), microchip=microchip)
+    pedigree = RealOffspring.objects.create(horse=horse)
+    RealOffspringNode.objects.create(pedigree=pedigree, relation="SIRE", name="Отец")
+    return Passport.objects.create(horse=horse)
+
+
+def make_refs() -> dict:
+    """Справочники для make_passport."""
+    return dict(
+        region=Region.objects.create(name="Джизак", code="JIZ"),
+        breed=Breed.objects.create(name="Ахалтекинская"),
+        color=Color.objects.create(name="Гнедая"),
+        vet=Veterinarian.objects.create(last_name="Ветеринар", first_name="Имя", license_no="1"),
+        vaccine=Vaccine.objects.create(name="Грипп", vaccine_for_grip=True, batch_number="1",
+                                       manufacture_date=date(2022, 1, 1), manufacturer_address="—"),
+        test_type=LabTestType.objects.create(name="РТП"),
+    )
+
+
+class PassportRenderContextTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        refs = make_refs()
+        for i in range(1, 6):
+            make_passport(i, **refs)
+
+    # select_related(паспорт+лошадь+владелец) + 10 prefetch-запросов
+    QUERIES = 11
+
+    def _build(self, qs):
+        return [rc.as_dict() for rc in PassportRenderContext.load(PassportRenderContext.queryset(qs))]
+
+    def test_query_count_is_constant(self):
+        with self.assertNumQueries(self.QUERIES):
+            one = self._build(Passport.objects.order_by("pk")[:1])
+        with self.assertNumQueries(self.QUERIES):
+            many = self._build(Passport.objects.order_by("pk"))
+        self.assertEqual(len(one), 1)
+        self.assertEqual(len(many), 5)
+
+    def test_context_matches_related_rows(self):
+        ctx = self._build(Passport.objects.order_by("pk"))[0]
+        self.assertEqual(ctx["vacc_flu_pages"][0][0]["reg_no"], "R-1")
+        self.assertEqual(ctx["lab_pages"][0][0]["result"], "отр.")
+        self.assertEqual(ctx["parentage"]["brand"], "B1")
+        self.assertEqual(ctx["pedigree"]["by_key"]["SIRE"]["name"], "Отец")
+        self.assertEqual(ctx["offspring_rows"][0]["sire_name"], "Отец")
+        self.assertEqual(ctx["chip_rows"][0]["code"], f"{1:015d}")
+
+    def test_section_hashes_change_only_for_touched_section(self):
+        before = section_hashes(self._build(Passport.objects.order_by("pk"))[0])
+        horse = Passport.objects.order_by("pk").first().horse
+        Vaccination.objects.create(horse=horse, date=date(2024, 1, 1), vaccine=Vaccine.objects.get(),
+                                   vaccine_for_grip=True, registration_number="R-2")
+        after = section_hashes(self._build(Passport.objects.order_by("pk"))[0])
+        self.assertEqual(set(before), set(SECTIONS))
+        self.assertEqual({s for s in SECTIONS if before[s] != after[s]}, {"vaccinations"})
+
+    @override_settings(PASSPORT_PDF_SPLICE_STATIC=True, PASSPORT_PDF_SECTION_CACHE=64)
+    def test_unchanged_section_pages_are_reused(self):
+        engine = PassportPdfEngine()
+        ctx = self._build(Passport.objects.order_by("pk"))[0]
+        hashes = section_hashes(ctx)
+        first = engine.layout_passport(ctx, engine.passport_html(ctx, hashes), hashes)
+        laid_out = {i: page for i, page in enumerate(first.pages) if _page_role(page)[0] == "section"}
+        self.assertTrue(laid_out)
+        self.assertTrue(engine.cached_sections(hashes))
+
+        # вакцинация изменила только свой раздел: остальные страницы — те же объекты из кэша
+        Vaccination.objects.create(horse=Passport.objects.order_by("pk").first().horse, date=date(2024, 1, 1),
+                                   vaccine=Vaccine.objects.get(), vaccine_for_grip=True, registration_number="R-2")
+        ctx = self._build(Passport.objects.order_by("pk"))[0]
+        changed = section_hashes(ctx)
+        self.assertEqual(engine.cached_sections(changed), engine.cached_sections(hashes) - {"vaccinations"})
+        second = engine.layout_passport(ctx, engine.passport_html(ctx, changed), changed)
+        self.assertIn("vaccinations", {_page_role(p)[1] for p in laid_out.values()})
+        for i, page in laid_out.items():
+            section = _page_role(page)[1]
+            self.assertEqual(second.pages[i] is page, section != "vaccinations", section)
+
+
+class PassportListPaginationTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.refs = make_refs()
+        for i in range(1, 6):
+            make_passport(i, **cls.refs)
+
+    @staticmethod
+    def _walk(paginator):
+        """Все страницы вперёд, затем от последней назад -> (pk вперёд, pk назад)."""
+        page = paginator.page()
+        forward = [p.pk for p in page]
+        while page.has_next():
+            page = paginator.page(page.next_cursor)
+            forward += [p.pk for p in page]
+        backward = [p.pk for p in page]
+        while page.has_previous():
+            page = paginator.page(page.prev_cursor)
+            backward = [p.pk for p in page] + backward
+        return forward, backward
+
+    def test_keyset_pages_follow_list_order_both_ways(self):
+        # две пустые даты и две одинаковые — граница страницы внутри группы
+        for pk, day in zip(Passport.objects.order_by("pk").values_list("pk", flat=True), [None, 3, 3, None, 1]):
+            Passport.objects.filter(pk=pk).update(issue_date=date(2024, 1, day) if day else None)
+        expected = list(Passport.objects.order_by(*ORDERING).values_list("pk", flat=True))
+
+        forward, backward = self._walk(KeysetPaginator(Passport.objects.all(), 2))
+        self.assertEqual(forward, expected)
+        self.assertEqual(backward, expected)
+
+    def test_equal_keys_are_ordered_by_id_across_pages(self):
+        # одна дата и одно время создания у всех — порядок держит только id
+        Passport.objects.update(issue_date=date(2024, 1, 3), created_at=timezone.now())
+        expected = list(Passport.objects.order_by("-pk").values_list("pk", flat=True))
+        for per_page in (1, 2, 3):
+            self.assertEqual(self._walk(KeysetPaginator(Passport.objects.all(), per_page)), (expected, expected))
+
+    def test_cursor_is_stable_when_rows_are_added(self):
+        key = dict(issue_date=date(2024, 1, 3), created_at=timezone.now())
+        Passport.objects.update(**key)
+        paginator = KeysetPaginator(Passport.objects.all(), 2)
+        first = paginator.page()
+        # новый паспорт с тем же ключом попадает в начало списка и не сдвигает следующие страницы
+        Passport.objects.filter(pk=make_passport(6, **self.refs).pk).update(**key)
+        second = paginator.page(first.next_cursor)
+        rest = list(Passport.objects.order_by("-pk").values_list("pk", flat=True))[3:5]
+        self.assertEqual([p.pk for p in second], rest)
+
+
+class BenchmarkSuiteTests(TestCase):
+    def setUp(self):
+        media = tempfile.TemporaryDirectory()
+        self.addCleanup(media.cleanup)
+        overridden = override_settings(MEDIA_ROOT=media.name)
+        overridden.enable()
+        self.addCleanup(overridden.disable)
+
+    def test_report_has_every_stage(self):
+        report = run_suite(PROFILES[:1], horses=1, repeat=1)
+        stages = report["profiles"]["minimal"]["stages"]
+        self.assertEqual(set(stages), set(STAGES) | {"total"})
+        self.assertGreater(report["profiles"]["minimal"]["pdf_bytes"], 0)
+        self.assertEqual(compare_reports(report, report), [])
+
+    def test_compare_reports_flags_slower_stage(self):
+        def report(layout):
+            return {"profiles": {"minimal": {"stages": {"layout": {"median": layout}}}}}
+        self.assertEqual(compare_reports(report(0.100), report(0.110)), [])
+        self.assertEqual(len(compare_reports(report(0.100), report(0.200))), 1)
+        # рост меньше min_delta — шум, не регрессия
+        self.assertEqual(compare_reports(report(0.001), report(0.003)), [])
+
+
+class SavedPassportTestCase(TestCase):
+    """Один паспорт с полным набором связанных записей; медиа — во временном каталоге."""
+
+    def setUp(self):
+        media = tempfile.TemporaryDirectory()
+        self.addCleanup(media.cleanup)
+        overridden = override_settings(MEDIA_ROOT=media.name)
+        overridden.enable()
+        self.addCleanup(overridden.disable)
+        self.passport = make_passport(1, **make_refs())
+
+    def _load(self):
+        return Passport.objects.select_related("horse").get(pk=self.passport.pk)
+
+
+class PassportSaveTests(SavedPassportTestCase):
+    def test_save_without_code_changes_is_one_update(self):
+        p = self._load()
+        qr_name = p.qr_image.name
+        p.status = Passport.Status.ISSUED
+        with self.assertNumQueries(1):
+            p.save()
+        self.assertEqual(p.qr_image.name, qr_name)
+
+    def test_caption_change_regenerates_codes_in_same_update(self):
+        p = self._load()
+        qr_name = p.qr_image.name
+        p.old_passport_number = "OLD-1"
+        p.status = Passport.Status.ISSUED
+        with CaptureQueriesContext(connection) as queries:
+            p.save(update_fields=["old_passport_number", "status"])
+        # один UPDATE паспорта, без SELECT (db_hook замеров по умолчанию выключен)
+        self.assertEqual(len(queries), 1)
+        self.assertTrue(queries[0]["sql"].startswith("UPDATE"))
+        self.assertNotEqual(p.qr_image.name, qr_name)
+        self.assertEqual(self._load().qr_image.name, p.qr_image.name)
+
+    def test_bulk_microchip_update_enqueues_codes_once(self):
+        horse_id = self.passport.horse_id
+        self.assertEqual(Horse.objects.bulk_update_microchips({horse_id: "900000000000001"}), [horse_id])
+        self.assertEqual(Horse.objects.bulk_update_microchips({horse_id: "900000000000001"}), [])
+        self.assertEqual(self._load().barcode_value, "900000000000001")
+        jobs = RenderJob.objects.filter(passport=self.passport, kind=RenderJob.Kind.CODES)
+        self.assertEqual(jobs.count(), 1)
+
+    def test_render_job_records_skipped_render(self):
+        outcomes = []
+        for _ in range(2):
+            job = RenderJob.enqueue(self.passport, RenderJob.Kind.RENDER)
+            job.mark_done(run_job(job))
+            outcomes.append(RenderJob.objects.get(pk=job.pk).pdf_skipped)
+        # второй раз отпечаток тот же — PDF не перерисовывается
+        self.assertEqual(outcomes, [False, True])
+
+        job = RenderJob.enqueue(self.passport, RenderJob.Kind.CODES)
+        job.mark_done(run_job(job))
+        self.assertIsNone(RenderJob.objects.get(pk=job.pk).pdf_skipped)
+
+
+class RegistryRollupTests(SavedPassportTestCase):
+    def test_registry_stats_follow_passport_and_owner_changes(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            rollup.rebuild()
+        self.assertEqual(RegistryStat.objects.get().owner_kind, "PERSON")
+
+        org = Organization.objects.create(name="Конезавод", org_type=Organization.OrgType.STATE)
+        with self.captureOnCommitCallbacks(execute=True):
+            p = self._load()
+            p.status, p.issue_date = Passport.Status.ISSUED, date(2024, 5, 17)
+            p.save()
+            Owner.objects.filter(pk=p.horse.owner_current_id).update(person=None, organization=org)
+            Owner.objects.get(pk=p.horse.owner_current_id).save()
+        row = RegistryStat.objects.get()
+        self.assertEqual((row.status, row.owner_kind, row.issue_month, row.count),
+                         (Passport.Status.ISSUED, "STATE", date(2024, 5, 1), 1))
+        self.assertEqual(list(RegistryOwnerStat.objects.values_list("kind", "party_id", "count")),
+                         [("STATE", org.pk, 1)])
+
+
+class RegistryCacheTests(SavedPassportTestCase):
+    def test_registry_cache_is_invalidated_by_passport_save(self):
+        computed = []
+
+        def count():
+            computed.append(1)
+            return Passport.objects.count()
+
+        self.assertEqual(cached("test", (), count), 1)
+        self.assertEqual(cached("test", (), count), 1)
+        with self.captureOnCommitCallbacks(execute=True):
+            self._load().save()
+        cached("test", (), count)
+        self.assertEqual(len(computed), 2)
+
+
+class PassportSearchIndexTests(SavedPassportTestCase):
+    def test_search_index_follows_passport_and_owner_changes(self):
+        search.rebuild()
+        p = self._load()
+
+        def found(query):
+            return list(search.matching(query).values_list("passport_id", flat=True))
+
+        self.assertEqual(found(p.number), [p.pk])
+        self.assertEqual(found("".join(search.words(p.number))[:6]), [p.pk])
+        self.assertEqual(found(f"лош {p.horse.microchip[:5]}"), [p.pk])
+        self.assertEqual(found("b1"), [p.pk])  # тавро из Offspring
+        self.assertEqual(found("лош карим"), [])
+        with self.captureOnCommitCallbacks(execute=True):
+            person = p.horse.owner_current.person
+            person.last_name = "Каримов"
+            person.save()
+        self.assertEqual(found("Карим"), [p.pk])
+        self.assertEqual(found("фамилия1"), [])
+
+    def test_migrate_backfills_passports_missing_from_index(self):
+        search.rebuild()
+        PassportSearch.objects.all().delete()  # как до первого развёртывания индекса
+        self.assertFalse(search.matching(self.passport.number).exists())
+        emit_post_migrate_signal(verbosity=0, interactive=False, db="default")
+        self.assertEqual(list(search.matching(self.passport.number).values_list("passport_id", flat=True)),
+                         [self.passport.pk])
+        self.assertEqual(search.backfill(), 0)
+
+
+class DashboardOwnersTests(SavedPassportTestCase):
+    def test_owner_ranking_requires_login(self):
+        url = reverse("dashboard_owners")
+        response = self.client.get(url, {"kind": "PERSON"}, HTTP_HOST="127.0.0.1")
+        self.assertEqual(response.status_code, 302)
+        self.assertTrue(response["Location"].startswith(settings.LOGIN_URL))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            rollup.rebuild()
+        self.client.force_login(get_user_model().objects.create_user("viewer", password="x"))
+        response = self.client.get(url, {"kind": "PERSON"}, HTTP_HOST="127.0.0.1")
+        self.assertEqual([row["count"] for row in response.json()["PERSON"]["results"]], [1])
+
+    def test_anonymous_dashboard_shows_login_prompt_instead_of_owners(self):
+        owners_url = reverse("dashboard_owners")
+        response = self.client.get(reverse("dashboard"), HTTP_HOST="127.0.0.1")
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, 'id="ownersLogin"')
+        self.assertContains(response, "owners_url: null")
+        self.assertNotContains(response, owners_url)
+
+        self.client.force_login(get_user_model().objects.create_user("viewer", password="x"))
+        response = self.client.get(reverse("dashboard"), HTTP_HOST="127.0.0.1")
+        self.assertContains(response, f'owners_url: "{owners_url}"')
+        self.assertNotContains(response, 'id="ownersLogin"')
+
+
+class IssuePassportsCommandTests(TestCase):
+    def test_only_drafts_can_be_issued(self):
+        with self.assertRaisesMessage(CommandError, "только черновики"):
+            call_command("issue_passports", status="REVOKED", stdout=StringIO())
+        out = StringIO()
+        call_command("issue_passports", status="draft", stdout=out)
+        self.assertIn("Нет паспортов для выпуска", out.getvalue())
+
+
+class RenderJobQueueTests(TestCase):
+    def setUp(self):
+        media = tempfile.TemporaryDirectory()
+        self.addCleanup(media.cleanup)
+        overridden = override_settings(MEDIA_ROOT=media.name)
+        overridden.enable()
+        self.addCleanup(overridden.disable)
+        horse = Horse.objects.create(
+            name="Лошадь", sex="M", birth_date=date(2020, 1, 1), breed=Breed.objects.create(name="Ахалтекинская"),
+            color=Color.objects.create(name="Гнедая"), microchip="900000000000001",
+        )
+        self.passport = Passport.objects.create(horse=horse)
+
+    def _job(self, kind=RenderJob.Kind.RENDER, **kwargs):
+        return RenderJob.objects.create(passport=self.passport, kind=kind, **kwargs)
+
+    def test_claim_takes_each_ready_job_once(self):
+        first, second = self._job(), self._job(RenderJob.Kind.CODES)
+        self._job(RenderJob.Kind.ISSUE, run_after=timezone.now() + timedelta(hours=1))
+
+        claimed = [RenderJob.claim("w1"), RenderJob.claim("w2"), RenderJob.claim("w3")]
+        self.assertEqual([job and job.pk for job in claimed], [first.pk, second.pk, None])
+        first.refresh_from_db()
+        self.assertEqual((first.status, first.locked_by, first.attempts), (RenderJob.Status.RUNNING, "w1", 1))
+        # задачу, уже взятую воркером, пачкой не забрать
+        self.assertEqual(RenderJob.claim_batch("w4", [first.pk, second.pk]), [])
+
+    def test_failure_backs_off_exponentially(self):
+        job = self._job()
+        for attempt, delay in ((1, 30), (2, 60)):
+            claimed = RenderJob.claim("w1")
+            self.assertEqual((claimed.pk, claimed.attempts), (job.pk, attempt))
+            before = timezone.now()
+            claimed.mark_failed("boom", backoff_seconds=30)
+            job.refresh_from_db()
+            self.assertEqual((job.status, job.locked_by, job.last_error), (RenderJob.Status.PENDING, "", "boom"))
+            self.assertGreaterEqual(job.run_after, before + timedelta(seconds=delay))
+            self.assertLess(job.run_after, timezone.now() + timedelta(seconds=delay + 5))
+            # до run_after задача не выдаётся
+            self.assertIsNone(RenderJob.claim("w2"))
+            RenderJob.objects.filter(pk=job.pk).update(run_after=timezone.now())
+
+    def test_last_attempt_failure_is_final(self):
+        job = self._job(max_attempts=2)
+        for _ in range(2):
+            RenderJob.claim("w1").mark_failed("boom", backoff_seconds=0)
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.attempts), (RenderJob.Status.FAILED, 2))
+        self.assertIsNotNone(job.finished_at)
+        self.assertIsNone(RenderJob.claim("w1"))
+
+    def test_requeue_stale_returns_only_abandoned_jobs(self):
+        stale, fresh = self._job(), self._job(RenderJob.Kind.CODES)
+        RenderJob.claim("dead")
+        RenderJob.claim("alive")
+        RenderJob.objects.filter(pk=stale.pk).update(locked_at=timezone.now() - timedelta(minutes=30))
+
+        self.assertEqual(RenderJob.requeue_stale(timezone.now() - timedelta(minutes=10)), 1)
+        stale.refresh_from_db()
+        fresh.refresh_from_db()
+        self.assertEqual((stale.status, stale.locked_by, stale.locked_at), (RenderJob.Status.PENDING, "", None))
+        self.assertEqual((fresh.status, fresh.locked_by), (RenderJob.Status.RUNNING, "alive"))
+        # попытка брошенного запуска засчитана, следующий воркер берёт её снова
+        self.assertEqual(RenderJob.claim("w2").attempts, 2)
@@ -1,10 +1,19 @@
+from django.contrib.admin.views.decorators import staff_member_required
 from django.contrib.auth.decorators import login_required
 from django.urls import path
 
-from .views import PassportListView, public_passport
+from .views import (
+    PassportListView, RenderJobListView, RenderMetricsView, passport_pdf_stream, passport_search,
+    public_passport, registry_cache_stats,
+)
 
 app_name = 'passports'
 urlpatterns = [
     path('list/', login_required(PassportListView.as_view()), name='list'),
+    path("search/", login_required(passport_search), name="search"),
     path("p/<slug:number>/", public_passport, name="public"),
+    path("render-jobs/", staff_member_required(RenderJobListView.as_view()), name="render_jobs"),
+    path("render-metrics/", staff_member_required(RenderMetricsView.as_view()), name="render_metrics"),
+    path("cache-stats/", staff_member_required(registry_cache_stats), name="cache_stats"),
+    path("pdf/<int:pk>/", staff_member_required(passport_pdf_stream), name="pdf_stream"),
 ]
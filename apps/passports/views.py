@@ -1,25 +1,57 @@
+import json
+from base64 import urlsafe_b64decode, urlsafe_b64encode
 from datetime import timedelta, date
+from wsgiref.util import FileWrapper
 
-from django.db.models.functions import TruncDate, TruncMonth
-from django.shortcuts import get_object_or_404, render
+from django.conf import settings
+from django.core.paginator import Paginator
+from django.http import HttpResponse, JsonResponse, StreamingHttpResponse
+from django.shortcuts import get_object_or_404
+from django.template.loader import render_to_string
+from django.utils.functional import cached_property
 from django.utils.timezone import now
 from django.views.generic import ListView, TemplateView
-from django.db.models import Count, Prefetch, DateField
+from django.db.models import Count, Prefetch, Q, Sum
 
 from config.settings import PUBLIC_BASE_URL
 from web_project import TemplateLayout
-from .models import Passport
+from .models import Passport, RegistryOwnerStat, RegistryStat, RenderJob
 from .filters import PassportFilter
+from .metrics import retention_days, stage_summary
+from .pagination import InvalidCursor, KeysetPaginator, estimated_count
+from . import search
+from .services import open_passport_pdf
+from apps.common import cache
+from apps.common.cache import cached
 from apps.vet.models import Vaccination, LabTest
 from ..horses.models import Horse
-from ..parties.models import Organization
+from ..parties.models import Organization, Person
+
+
+class CachedCountPaginator(Paginator):
+    """COUNT(*) отфильтрованного списка — из кэша по параметрам фильтра (count_key)."""
+
+    def __init__(self, *args, count_key=(), **kwargs):
+        super().__init__(*args, **kwargs)
+        self.count_key = count_key
+
+    @cached_property
+    def count(self):
+        return cached("list_count", self.count_key, lambda: Paginator.count.func(self))
 
 
 class PassportListView(ListView):
+    """
+    Список паспортов с фильтрами. По умолчанию страницы — по ключу (pagination.py,
+    ?cursor=…) без OFFSET и COUNT(*); число записей — по запросу ?count=1, оценкой
+    из плана запроса (PostgreSQL) или кэшированным COUNT. ?page=N (или
+    PASSPORT_LIST_PAGINATION = "offset") — прежние нумерованные страницы.
+    """
     model = Passport
     template_name = "passports/list.html"
     context_object_name = "items"
     paginate_by = 25
+    keyset = False
 
     def get_queryset(self):
         qs = (Passport.objects
@@ -27,89 +59,175 @@ def get_queryset(self):
         self.filterset = PassportFilter(self.request.GET, queryset=qs)
         return self.filterset.qs.order_by("-issue_date", "-created_at")
 
+    def _filter_params(self):
+        return sorted((k, v) for k, v in self.request.GET.lists() if k not in (self.page_kwarg, "cursor", "count"))
+
+    def get_paginator(self, queryset, per_page, **kwargs):
+        return CachedCountPaginator(queryset, per_page, count_key=(self._filter_params(),), **kwargs)
+
+    def paginate_queryset(self, queryset, page_size):
+        if (getattr(settings, "PASSPORT_LIST_PAGINATION", "keyset") != "keyset"
+                or self.page_kwarg in self.request.GET):
+            return super().paginate_queryset(queryset, page_size)
+        self.keyset = True
+        paginator = KeysetPaginator(queryset, page_size)
+        try:
+            page = paginator.page(self.request.GET.get("cursor"))
+        except InvalidCursor:
+            page = paginator.page()
+        return paginator, page, page.object_list, page.has_other_pages()
+
     def get_context_data(self, **kwargs):
         ctx = super().get_context_data(**kwargs)
         ctx["filter"] = self.filterset
+        ctx["keyset"] = self.keyset
+        if self.keyset:
+            page = ctx["page_obj"]
+            ctx["next_query"] = self._query(cursor=page.next_cursor) if page.has_next() else ""
+            ctx["prev_query"] = self._query(cursor=page.prev_cursor) if page.has_previous() else ""
+            if self.request.GET.get("count"):
+                qs = self.object_list
+                ctx["count_estimate"] = estimated_count(qs)
+                if ctx["count_estimate"] is None:
+                    ctx["count_exact"] = cached("list_count", (self._filter_params(),), qs.count)
+            else:
+                ctx["count_query"] = self._query(count="1", cursor=self.request.GET.get("cursor"))
+        return TemplateLayout().init(ctx)
+
+    def _query(self, **params) -> str:
+        query = self.request.GET.copy()
+        for key, value in params.items():
+            if value:
+                query[key] = value
+            else:
+                query.pop(key, None)
+        return query.urlencode()
+
+
+class RenderJobListView(ListView):
+    """Состояние очереди рендера: счётчики по статусам и последние задачи."""
+    model = RenderJob
+    template_name = "passports/render_jobs.html"
+    context_object_name = "jobs"
+    paginate_by = 50
+
+    def get_queryset(self):
+        qs = RenderJob.objects.select_related("passport").order_by("-created_at")
+        status = self.request.GET.get("status")
+        if status in RenderJob.Status.values:
+            qs = qs.filter(status=status)
+        return qs
+
+    def get_context_data(self, **kwargs):
+        ctx = super().get_context_data(**kwargs)
+        counts = dict(RenderJob.objects.values_list("status").annotate(c=Count("id")))
+        ctx["status_counts"] = [(value, label, counts.get(value, 0)) for value, label in RenderJob.Status.choices]
+        ctx["current_status"] = self.request.GET.get("status", "")
         return TemplateLayout().init(ctx)
 
+class RenderMetricsView(TemplateView):
+    """p50/p95 по этапам выпуска паспортов (таблица RenderMetric)."""
+    template_name = "passports/render_metrics.html"
+
+    def get_context_data(self, **kwargs):
+        ctx = super().get_context_data(**kwargs)
+        try:
+            days = max(1, int(self.request.GET.get("days", 7)))
+        except ValueError:
+            days = 7
+        days = min(days, retention_days())
+        ctx["days"] = days
+        ctx["rows"] = stage_summary(days)
+        return TemplateLayout().init(ctx)
 
 class RegistryDashboardView(TemplateView):
     template_name = "dashboard/registry_dashboard.html"
 
+    # блоки страницы: каждый кэшируется отдельно (apps/common/cache.py)
+    # (рейтинг владельцев страница подгружает отдельно — dashboard_owners)
+    SECTIONS = ("kpi", "by_status", "by_breed", "by_region", "by_horse_type", "by_owner_kind",
+                "by_day", "by_month")
+
     def get_context_data(self, **kwargs):
         ctx = super().get_context_data(**kwargs)
+        # Всё, кроме динамики по дням, — из куба RegistryStat (rollup.py):
+        # десятки/сотни строк вместо агрегатов по всему реестру
+        self.stats = RegistryStat.objects.all()
+        today = now().date()
+        for name in self.SECTIONS:
+            ctx[name] = cached("dashboard", (name, today), getattr(self, f"_{name}"))
+        return TemplateLayout().init(ctx)
 
-        # База с related’ами (чтобы не ддосить БД)
-        qs = (Passport.objects
-              .select_related(
-                  "horse",
-                  "horse__breed",
-                  "horse__place_of_birth",
-                  "horse__owner_current",
-                  "horse__owner_current__organization",
-              ))
-
-        # KPI
-        total = qs.count()
-        issued = qs.filter(status__in=[Passport.Status.ISSUED, Passport.Status.REISSUED]).count()
-        revoked = qs.filter(status=Passport.Status.REVOKED).count()
-        ctx["kpi"] = {"total": total, "issued": issued, "revoked": revoked}
+    def _total(self, **filters):
+        return self.stats.filter(**filters).aggregate(c=Sum("count"))["c"] or 0
 
+    def _sliced(self, field):
+        return self.stats.values(field).annotate(c=Sum("count")).order_by("-c")
+
+    def _kpi(self):
+        return {
+            "total": self._total(),
+            "issued": self._total(status__in=[Passport.Status.ISSUED, Passport.Status.REISSUED]),
+            "revoked": self._total(status=Passport.Status.REVOKED),
+        }
+
+    def _by_status(self):
         # Статусы с человекочитаемыми лейблами
         status_map = dict(Passport.Status.choices)  # {"DRAFT":"Черновик", ...}
-        status_raw = qs.values("status").annotate(c=Count("id")).order_by("-c")
-        ctx["by_status"] = [
+        return [
             {"status": x["status"], "label": status_map.get(x["status"], x["status"]), "c": x["c"]}
-            for x in status_raw
+            for x in self._sliced("status")
         ]
 
-        # ТОП породы / регионы рождения (как было)
-        ctx["by_breed"]  = list(qs.values("horse__breed__name").annotate(c=Count("id")).order_by("-c")[:10])
-        ctx["by_region"] = list(qs.values("horse__place_of_birth__name").annotate(c=Count("id")).order_by("-c")[:10])
+    # ТОП породы / регионы рождения (ключи — как в прежних values() по паспортам)
+    def _by_breed(self):
+        return [{"horse__breed__name": x["breed__name"], "c": x["c"]} for x in self._sliced("breed__name")[:10]]
+
+    def _by_region(self):
+        return [
+            {"horse__place_of_birth__name": x["region__name"], "c": x["c"]} for x in self._sliced("region__name")[:10]
+        ]
 
-        # НОВОЕ: срез по ТИПАМ ЛОШАДЕЙ (sport/service/expo)
+    def _by_horse_type(self):
+        # Срез по ТИПАМ ЛОШАДЕЙ (sport/service/expo)
         type_map = dict(Horse.HORSE_TYPE_CHOICES)  # {"SPORT":"Спортивная", ...}
-        type_raw = qs.values("horse__horse_type").annotate(c=Count("id")).order_by("-c")
-        ctx["by_horse_type"] = [
-            {"code": (x["horse__horse_type"] or ""), "label": type_map.get(x["horse__horse_type"], "Не указан"), "c": x["c"]}
-            for x in type_raw
+        return [
+            {"code": x["horse_type"], "label": type_map.get(x["horse_type"], "Не указан"), "c": x["c"]}
+            for x in self._sliced("horse_type")
         ]
 
-        # Срез по типу владельца (как было)
-        phys        = qs.filter(horse__owner_current__person__isnull=False).count()
-        org_state   = qs.filter(horse__owner_current__organization__org_type=Organization.OrgType.STATE).count()
-        org_private = qs.filter(horse__owner_current__organization__org_type=Organization.OrgType.PRIVATE).count()
-        ctx["by_owner_kind"] = [
-            {"label": "Физические лица", "value": phys},
-            {"label": "Юр. лица (гос)", "value": org_state},
-            {"label": "Юр. лица (частные)", "value": org_private},
+    def _by_owner_kind(self):
+        owner_kind = {x["owner_kind"]: x["c"] for x in self._sliced("owner_kind")}
+        return [
+            {"label": "Физические лица", "value": owner_kind.get("PERSON", 0)},
+            {"label": "Юр. лица (гос)", "value": owner_kind.get(Organization.OrgType.STATE, 0)},
+            {"label": "Юр. лица (частные)", "value": owner_kind.get(Organization.OrgType.PRIVATE, 0)},
         ]
 
-        # Динамика за 30 дней (с НОЛЕФИЛЛЕНИЕМ)
+    def _by_day(self):
+        # Динамика за 30 дней (с НОЛЕФИЛЛЕНИЕМ): в кубе только месяцы, но это
+        # узкий запрос по одной таблице паспортов
         start = now().date() - timedelta(days=29)
-        daily_q = (qs.filter(issue_date__gte=start)
-                     .annotate(d=TruncDate("issue_date"))
-                     .values("d").annotate(c=Count("id")).order_by("d"))
+        daily_q = (Passport.objects.filter(issue_date__gte=start)
+                     .values("issue_date").annotate(c=Count("id")).order_by("issue_date"))
         # заполняем отсутствующие дни нулями
-        day_index = {x["d"]: x["c"] for x in daily_q}
+        day_index = {x["issue_date"]: x["c"] for x in daily_q}
         by_day = []
         for i in range(30):
             d = start + timedelta(days=i)
             by_day.append({"d": d.strftime("%d.%m"), "c": int(day_index.get(d, 0))})
-        ctx["by_day"] = by_day
+        return by_day
 
-        # НОВОЕ: Динамика по месяцам (последние 12 мес) с нолефиллом
+    def _by_month(self):
+        # Динамика по месяцам (последние 12 мес) с нолефиллом
         today = now().date().replace(day=1)
         start_m = (today - timedelta(days=365)).replace(day=1)
 
-        monthly_q = (
-            qs.filter(issue_date__isnull=False, issue_date__gte=start_m)
-            .annotate(m=TruncMonth("issue_date", output_field=DateField()))  # ← форсируем DATE
-            .values("m").annotate(c=Count("id")).order_by("m")
+        month_index = dict(
+            self.stats.filter(issue_month__gte=start_m)
+            .values_list("issue_month").annotate(c=Sum("count")).values_list("issue_month", "c")
         )
 
-        month_index = {x["m"]: x["c"] for x in monthly_q}
-
         by_month = []
         cur = start_m
         for _ in range(12):
@@ -120,72 +238,83 @@ def get_context_data(self, **kwargs):
                 cur = date(cur.year + 1, 1, 1)
             else:
                 cur = date(cur.year, cur.month + 1, 1)
-        ctx["by_month"] = by_month
-
-        # ===== ВЛАДЕЛЬЦЫ: физ, гос-орг, частные =====
-        persons_q = (
-            qs.filter(horse__owner_current__person__isnull=False)
-            .values(
-                "horse__owner_current__person__id",
-                "horse__owner_current__person__last_name",
-                "horse__owner_current__person__first_name",
-                "horse__owner_current__person__middle_name",
-            )
-            .annotate(c=Count("id")).order_by("-c")
-        )
+        return by_month
 
-        owners_person = []
-        for x in persons_q:
-            ln = (x["horse__owner_current__person__last_name"] or "").strip()
-            fn = (x["horse__owner_current__person__first_name"] or "").strip()
-            mn = (x["horse__owner_current__person__middle_name"] or "").strip()
-            label = " ".join([p for p in (ln, fn, mn) if p]) or "—"
-            owners_person.append({
-                "id": x["horse__owner_current__person__id"],
-                "label": label,
-                "kind": "PERSON",
-                "count": x["c"],
-            })
-
-        # Гос. организации
-        state_q = (
-            qs.filter(horse__owner_current__organization__org_type=Organization.OrgType.STATE)
-            .values(
-                "horse__owner_current__organization__id",
-                "horse__owner_current__organization__name",
-            )
-            .annotate(c=Count("id")).order_by("-c")
-        )
-        owners_state = [{
-            "id": x["horse__owner_current__organization__id"],
-            "label": x["horse__owner_current__organization__name"] or "—",
-            "kind": "STATE",
-            "count": x["c"],
-        } for x in state_q]
-
-        # Частные организации
-        private_q = (
-            qs.filter(horse__owner_current__organization__org_type=Organization.OrgType.PRIVATE)
-            .values(
-                "horse__owner_current__organization__id",
-                "horse__owner_current__organization__name",
-            )
-            .annotate(c=Count("id")).order_by("-c")
-        )
-        owners_private = [{
-            "id": x["horse__owner_current__organization__id"],
-            "label": x["horse__owner_current__organization__name"] or "—",
-            "kind": "PRIVATE",
-            "count": x["c"],
-        } for x in private_q]
 
-        # Общий массив для фронта
-        ctx["owners"] = owners_person + owners_state + owners_private
+OWNER_KINDS = ("PERSON", Organization.OrgType.STATE.value, Organization.OrgType.PRIVATE.value)
+OWNERS_PAGE_MAX = 100
 
-        return TemplateLayout().init(ctx)
 
+def _encode_cursor(count: int, party_id: int) -> str:
+    return urlsafe_b64encode(json.dumps([count, party_id]).encode()).decode().rstrip("=")
 
-def public_passport(request, number: str):
+
+def _decode_cursor(cursor: str) -> tuple[int, int]:
+    count, party_id = json.loads(urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)))
+    return int(count), int(party_id)
+
+
+def _owner_labels(kind: str, ids) -> dict:
+    if kind == "PERSON":
+        labels = {}
+        for pk, *names in Person.objects.filter(pk__in=ids).values_list("pk", "last_name", "first_name", "middle_name"):
+            labels[pk] = " ".join(n.strip() for n in names if n and n.strip())
+        return labels
+    return dict(Organization.objects.filter(pk__in=ids).values_list("pk", "name"))
+
+
+def _owners_page(kind: str, q: str, limit: int, cursor: str) -> dict:
+    rows = RegistryOwnerStat.objects.filter(kind=kind).order_by("-count", "party_id")
+    if q:
+        if kind == "PERSON":
+            people = Person.objects.all()
+            for word in q.split():
+                people = people.filter(Q(last_name__icontains=word) | Q(first_name__icontains=word)
+                                       | Q(middle_name__icontains=word))
+            rows = rows.filter(party_id__in=people.values("pk"))
+        else:
+            rows = rows.filter(party_id__in=Organization.objects.filter(name__icontains=q).values("pk"))
+    if cursor:
+        count, party_id = _decode_cursor(cursor)
+        rows = rows.filter(Q(count__lt=count) | Q(count=count, party_id__gt=party_id))
+
+    page = list(rows.values_list("party_id", "count")[:limit + 1])
+    more, page = len(page) > limit, page[:limit]
+    labels = _owner_labels(kind, [pk for pk, _ in page])
+    return {
+        "results": [{"id": pk, "label": labels.get(pk) or "—", "kind": kind, "count": c} for pk, c in page],
+        "next": _encode_cursor(*page[-1][::-1]) if more else None,
+    }
+
+
+def dashboard_owners(request):
+    """
+    Рейтинг владельцев для дашборда (JSON): по каждому типу владельца — top-N
+    по числу паспортов (RegistryOwnerStat) с курсором на следующую страницу.
+    ?kind=PERSON|STATE|PRIVATE (по умолчанию — все три), ?q= — фильтр по
+    ФИО/названию, ?limit= (до OWNERS_PAGE_MAX), ?cursor= — из "next" (вместе с kind).
+    """
+    kind = request.GET.get("kind", "")
+    q = request.GET.get("q", "").strip()
+    cursor = request.GET.get("cursor", "")
+    try:
+        limit = min(OWNERS_PAGE_MAX, max(1, int(request.GET.get("limit", 20))))
+    except ValueError:
+        limit = 20
+    if kind and kind not in OWNER_KINDS:
+        return JsonResponse({"error": f"kind: одно из {', '.join(OWNER_KINDS)}"}, status=400)
+    if cursor and not kind:
+        return JsonResponse({"error": "cursor передаётся вместе с kind"}, status=400)
+    try:
+        data = cached("dashboard_owners", (kind, q, limit, cursor), lambda: {
+            k: _owners_page(k, q, limit, cursor) for k in ([kind] if kind else OWNER_KINDS)
+        })
+    except (ValueError, TypeError):  # битый cursor
+        return JsonResponse({"error": "неверный cursor"}, status=400)
+    return JsonResponse(data)
+
+
+def _public_card_html(request, number: str) -> str:
     p = get_object_or_404(
         Passport.objects.select_related(
             "horse", "horse__breed", "horse__color", "horse__place_of_birth"
@@ -196,4 +325,45 @@ def public_passport(request, number: str):
         number=number,
         status__in=[Passport.Status.ISSUED, Passport.Status.REISSUED, Passport.Status.REVOKED],
     )
-    return render(request, "passports/public_card.html", {"p": p})
+    return render_to_string("passports/public_card.html", {"p": p}, request=request)
+
+
+def public_passport(request, number: str):
+    # карточку открывают по QR с телефонов: готовый HTML до ближайшей правки реестра
+    html = cached("public_card", (number,), lambda: _public_card_html(request, number))
+    return HttpResponse(html)
+
+
+def passport_pdf_stream(request, pk: int):
+    """PDF паспорта «на лету» для сотрудников: рендер без сохранения в storage."""
+    p = get_object_or_404(Passport, pk=pk)
+    buf = open_passport_pdf(p)
+    response = StreamingHttpResponse(FileWrapper(buf, 64 * 1024), content_type="application/pdf")
+    response["Content-Disposition"] = f'inline; filename="{p.number}.pdf"'
+    return response
+
+
+SEARCH_LIMIT_MAX = 20
+
+
+def passport_search(request):
+    """
+    Автодополнение поиска по реестру (JSON): ?q= — номер, старый номер, кличка,
+    регистрационный номер, микрочип или владелец (начала слов), ?limit= (до
+    SEARCH_LIMIT_MAX). Читает только PassportSearch, без соединений.
+    """
+    q = request.GET.get("q", "").strip()
+    try:
+        limit = min(SEARCH_LIMIT_MAX, max(1, int(request.GET.get("limit", 10))))
+    except ValueError:
+        limit = 10
+    results = cached("search", (search.terms(q), limit), lambda: [
+        {"id": pk, "label": label}
+        for pk, label in search.matching(q).order_by("-passport_id").values_list("passport_id", "label")[:limit]
+    ])
+    return JsonResponse({"results": results})
+
+
+def registry_cache_stats(request):
+    """Попадания/промахи кэша страниц реестра по разделам (счётчики этого процесса)."""
+    return JsonResponse({"generation": cache.generation(), "sections": cache.stats()})
@@ -0,0 +1,70 @@
+# apps/passports/workers.py
+"""
+Функции для процессов-воркеров (ProcessPoolExecutor, контекст spawn).
+
+Модуль импортируется воркером ДО django.setup(), поэтому модели и сервисы
+подключаем только внутри функций.
+"""
+
+
+def rss_mb() -> float:
+    """Пиковый RSS текущего процесса в МБ (0, если платформа не умеет)."""
+    try:
+        import resource
+    except ImportError:  # Windows
+        return 0.0
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024.0
+
+
+def init_worker(pdf_engine: bool = True):
+    # spawn-воркер стартует «с нуля»: поднимаем Django сами
+    import django
+    django.setup()
+
+    # стили и шрифты компилируем один раз на процесс, до первого паспорта
+    if pdf_engine:
+        from apps.passports.engine import get_engine
+        get_engine()
+
+
+def issue_one(pk: int) -> dict:
+    """
+    Штрих/QR + PDF для одного паспорта.
+    В БД ничего не пишем — статус/дату/файлы фиксирует родитель пачками.
+    """
+    from django.utils.timezone import now
+
+    from apps.passports.models import Passport
+    from apps.passports.services import render_passport_pdf
+
+    p = Passport.objects.select_related("horse").get(pk=pk)
+    p.barcode_value = p.barcode_value or p.horse.microchip or p.horse.registry_no
+    # как в jobs._issue: коды и PDF — уже выпущенного паспорта (подпись QR,
+    # дата выдачи и отпечаток PDF зависят от статуса и даты)
+    p.status = Passport.Status.ISSUED
+    p.issue_date = p.issue_date or now().date()
+    p.generate_codes()
+    rendered = render_passport_pdf(p)
+    return {
+        "pk": p.pk,
+        "issue_date": p.issue_date,
+        "barcode_value": p.barcode_value,
+        "barcode_image": p.barcode_image.name,
+        "qr_image": p.qr_image.name,
+        "pdf_file": p.pdf_file.name,
+        "pdf_fingerprint": p.pdf_fingerprint,
+        "rendered": rendered,
+        "rss_mb": rss_mb(),
+    }
+
+
+def codes_one(pk: int) -> dict:
+    """
+    Штрих/QR одного паспорта. Паспорт в БД не пишем — имена файлов
+    фиксирует родитель пачкой.
+    """
+    from apps.passports.models import Passport
+
+    p = Passport.objects.get(pk=pk)
+    p.generate_codes()
+    return {"pk": p.pk, "barcode_image": p.barcode_image.name, "qr_image": p.qr_image.name}
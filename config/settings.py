@@ -172,11 +172,52 @@
 STATIC_URL = "/static/"
 STATICFILES_DIRS = [BASE_DIR / "static"]
 STATIC_ROOT = BASE_DIR / "staticfiles"
-STATICFILES_STORAGE = "whitenoise.storage.CompressedManifestStaticFilesStorage"
 
 MEDIA_URL = "/media/"
 MEDIA_ROOT = BASE_DIR / "media"
 
+# Сгенерированные файлы (штрих-код, QR) адресуются по содержимому:
+# <upload_to>/<aa>/<bb>/<sha256>.<ext>, одинаковые хранятся один раз
+# (apps/common/storage.py). Загрузки и PDF паспортов — под своими именами.
+# Файлы, на которые больше не ссылается БД, удаляет manage.py gc_media
+STORAGES = {
+    "default": {"BACKEND": "django.core.files.storage.FileSystemStorage"},
+    "generated": {"BACKEND": "apps.common.storage.ContentAddressedStorage"},
+    "staticfiles": {"BACKEND": "whitenoise.storage.CompressedManifestStaticFilesStorage"},
+}
+
+# Кэш страниц реестра (apps/common/cache.py): блоки дашборда, счётчики списка,
+# публичная карточка. locmem — у каждого процесса свой; CACHE_BACKEND=file —
+# общий для всех процессов сервера (каталог CACHE_LOCATION)
+CACHE_BACKEND = os.environ.get("CACHE_BACKEND", "locmem")
+if CACHE_BACKEND == "file":
+    CACHES = {
+        "default": {
+            "BACKEND": "django.core.cache.backends.filebased.FileBasedCache",
+            "LOCATION": os.environ.get("CACHE_LOCATION", str(BASE_DIR / "cache")),
+            "OPTIONS": {"MAX_ENTRIES": 10000},
+        }
+    }
+else:
+    CACHES = {
+        "default": {
+            "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+            "OPTIONS": {"MAX_ENTRIES": 5000},
+        }
+    }
+# ключи устаревают сами при любой правке реестра; TTL — страховка для locmem
+# нескольких процессов и правок в обход ORM
+REGISTRY_CACHE_TIMEOUT = 300
+
+# Список паспортов: "keyset" — страницы по ключу (без OFFSET и COUNT(*)),
+# "offset" — нумерованные страницы
+PASSPORT_LIST_PAGINATION = "keyset"
+
+# Поиск по части микрочипа не на PostgreSQL (там — GIN pg_trgm): таблица
+# 4-грамм MicrochipNgram, ~12 строк на лошадь. Заполнить для уже
+# зарегистрированных — manage.py build_microchip_index
+MICROCHIP_NGRAM_INDEX = os.environ.get("MICROCHIP_NGRAM_INDEX", "True").lower() in ["true", "yes", "1"]
+
 # Default URL on which Django application runs for specific environment
 BASE_URL = os.environ.get("BASE_URL", default="http://127.0.0.1:8000")
 PUBLIC_BASE_URL = os.environ.get("PUBLIC_BASE_URL", "http://127.0.0.1:8000")
@@ -203,6 +244,39 @@
 
 # Поворот вертикальной подписи: 90 (снизу-вверх) или 270 (сверху-вниз)
 QR_TEXT_ROTATE = 270
+
+# PDF паспорта: неизменные страницы (статичный текст, пустые страницы таблиц)
+# верстаются один раз на процесс и подставляются в документ каждой лошади
+PASSPORT_PDF_SPLICE_STATIC = True
+# …и разделы паспорта (обложка, фото, вакцинации, …): горячий LRU свёрстанных
+# страниц в памяти процесса на столько разделов (~12 на паспорт, т.е. ~20
+# последних паспортов; до сотен МБ на процесс). Помогает только повторному
+# рендеру в том же процессе (предпросмотр -> выпуск, run_render_worker);
+# 0 — выключить. См. apps/passports/section_cache.py
+PASSPORT_PDF_SECTION_CACHE = 256
+
+# Фото в PDF встраиваются копиями под размер рамки при этом разрешении
+# (0 — встраивать оригиналы); кэш копий — MEDIA_ROOT/print_cache
+PDF_PRINT_DPI = 300
+PDF_PRINT_JPEG_QUALITY = 85
+
+# Предпросмотр паспорта в админке: PNG этого разрешения (нужен pypdfium2,
+# без него — PDF), кэш — MEDIA_ROOT/preview_cache
+PASSPORT_PREVIEW_DPI = 50
+
+# Отрендеренный PDF держим в памяти до этого размера, дальше — во временном файле
+PDF_SPOOL_MAX_SIZE = 16 * 1024 * 1024
+
+# Замеры этапов выпуска паспорта (время, SQL-запросы, прирост RSS): JSON в лог
+# apps.passports.render. Таблица RenderMetric (страница /render-metrics/) —
+# по желанию: добавить "apps.passports.metrics.db_hook" (INSERT на каждый
+# рендер и каждую генерацию кодов) и чистить manage.py prune_render_metrics
+PASSPORT_RENDER_HOOKS = [
+    "apps.common.instrumentation.log_hook",
+]
+# сколько дней хранить RenderMetric; за больший период сводка не считается
+RENDER_METRICS_RETENTION_DAYS = 30
+
 # Default primary key field type
 # https://docs.djangoproject.com/en/5.0/ref/settings/#default-auto-field
 
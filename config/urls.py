@@ -1,8 +1,9 @@
 from django.contrib import admin
+from django.contrib.auth.decorators import login_required
 from django.urls import include, path
 from django.conf.urls.static import static
 from config import settings
-from apps.passports.views import RegistryDashboardView
+from apps.passports.views import RegistryDashboardView, dashboard_owners
 from web_project.views import SystemView
 from django.views.generic import RedirectView
 
@@ -15,6 +16,8 @@
     path("auth/", include("apps.authentication.urls", namespace="auth")),
 
     path("dashboard/", RegistryDashboardView.as_view(), name="dashboard"),
+    # ФИО владельцев — только для вошедших (сама панель — агрегаты без персональных данных)
+    path("dashboard/owners/", login_required(dashboard_owners), name="dashboard_owners"),
     path('', RedirectView.as_view(pattern_name='dashboard', permanent=False)),
 
     path("", include("apps.passports.urls", namespace="passports")),
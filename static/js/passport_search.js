@@ -0,0 +1,27 @@
+// static/js/passport_search.js
+// Подсказки для поля «Поиск» списка паспортов: /search/?q= -> <datalist>
+(function(){
+  const input = document.querySelector('input[data-search-url]');
+  const list = input && document.getElementById(input.getAttribute('list'));
+  if (!list) return;
+
+  let timer = null, controller = null;
+  input.addEventListener('input', ()=>{
+    clearTimeout(timer);
+    const q = input.value.trim();
+    if (q.length < 2) { list.replaceChildren(); return; }
+    timer = setTimeout(async ()=>{
+      controller?.abort();
+      controller = new AbortController();
+      try {
+        const url = `${input.dataset.searchUrl}?q=${encodeURIComponent(q)}`;
+        const resp = await fetch(url, { signal: controller.signal, headers: { 'Accept': 'application/json' } });
+        if (!resp.ok) return;
+        const { results } = await resp.json();
+        list.replaceChildren(...results.map(r => Object.assign(document.createElement('option'), { value: r.label })));
+      } catch (e) {
+        if (e.name !== 'AbortError') console.error('[Поиск] Ошибка подсказок:', e);
+      }
+    }, 200);
+  });
+})();
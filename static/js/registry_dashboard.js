@@ -92,21 +92,26 @@
     area('chartMonthly', m.map(i=>i[0]), m.map(i=>i[1]));
   }, 'chartMonthly');
 
-  // ===== ВЛАДЕЛЬЦЫ: барчарт с фильтром =====
+  // ===== ВЛАДЕЛЬЦЫ: барчарт с фильтром (данные — с /dashboard/owners/ после загрузки страницы) =====
   safeMount(() => {
-    const raw = Array.isArray(D.owners) ? D.owners : [];
+    if (!D.owners_url) return; // аноним: вместо графика — приглашение войти (шаблон)
     const kindSel = document.getElementById('ownerKindFilter');
     const searchInp = document.getElementById('ownerSearch');
+    const moreBtn = document.getElementById('ownersMore');
     const mountId = 'chartOwners';
+    const PAGE = 20;
 
     let chart = null;
+    let shown = [];      // что уже на графике
+    let next = null;     // курсор следующей страницы (только для одного типа)
+    let seq = 0;         // ответы устаревших запросов игнорируем
 
     const makeBar = (labels, data) => {
       if (!exists(mountId)) return;
       // пересоздаём на каждый апдейт для простоты
       document.getElementById(mountId).innerHTML = '';
       chart = new ApexCharts(document.querySelector('#'+mountId), {
-        chart: { type: 'bar', height: 360, toolbar: { show:false } },
+        chart: { type: 'bar', height: Math.max(360, labels.length * 18), toolbar: { show:false } },
         plotOptions: { bar: { horizontal: true, borderRadius: 6 } },
         series: [{ name: 'Паспорта', data }],
         xaxis: { categories: labels },
@@ -116,30 +121,40 @@
       chart.render();
     };
 
-    const norm = s => (s || '').toString().toLowerCase();
     const debounce = (fn, ms=200) => {
       let t; return (...args) => { clearTimeout(t); t = setTimeout(() => fn(...args), ms); };
     };
 
-    const refresh = () => {
+    const load = (append) => {
       const kind = (kindSel && kindSel.value) || 'ALL';
-      const q = norm(searchInp && searchInp.value);
-
-      let arr = raw;
-      if (kind !== 'ALL') arr = arr.filter(x => x.kind === kind);
-      if (q) arr = arr.filter(x => norm(x.label).includes(q));
-
-      // сортировка по count ↓ и берём топ-20 для читаемости
-      arr = arr.slice().sort((a,b) => (b.count||0) - (a.count||0)).slice(0, 20);
-
-      const labels = arr.map(x => x.label);
-      const data = arr.map(x => x.count || 0);
-      makeBar(labels, data);
+      const params = new URLSearchParams({ limit: PAGE });
+      if (kind !== 'ALL') params.set('kind', kind);
+      const q = ((searchInp && searchInp.value) || '').trim();
+      if (q) params.set('q', q);
+      if (append && next) params.set('cursor', next);
+
+      const my = ++seq;
+      fetch(`${D.owners_url}?${params}`, { credentials: 'same-origin' })
+        // сессия истекла — login_required уводит на страницу входа вместо JSON
+        .then(r => r.ok && !r.redirected ? r.json() : Promise.reject(r.redirected ? 'login' : r.status))
+        .then(data => {
+          if (my !== seq) return;
+          // «Все»: по PAGE лучших каждого типа, общий топ-PAGE
+          const pages = Object.values(data);
+          let arr = pages.flatMap(p => p.results || []);
+          if (kind === 'ALL') arr = arr.sort((a,b) => (b.count||0) - (a.count||0)).slice(0, PAGE);
+          shown = append ? shown.concat(arr) : arr;
+          next = kind !== 'ALL' && pages.length ? pages[0].next : null;
+          if (moreBtn) moreBtn.classList.toggle('d-none', !next);
+          makeBar(shown.map(x => x.label), shown.map(x => x.count || 0));
+        })
+        .catch(e => console.error('[Analytics] Владельцы не загружены:', e));
     };
 
-    if (kindSel) kindSel.addEventListener('change', refresh);
-    if (searchInp) searchInp.addEventListener('input', debounce(refresh, 200));
+    if (kindSel) kindSel.addEventListener('change', () => load(false));
+    if (searchInp) searchInp.addEventListener('input', debounce(() => load(false), 300));
+    if (moreBtn) moreBtn.addEventListener('click', () => load(true));
 
-    refresh(); // первичный рендер
+    load(false); // первичная загрузка
   }, 'chartOwners');
 })();